@@ -0,0 +1,53 @@
+"""
+Start-up shared by the API server (app.server, star.py) and the command-line
+chatbot (app.main).
+
+Importing this module stays cheap: the service stack (OpenAI client, numpy,
+SQLAlchemy, lxml, ...) is only imported when the services are built, so
+loading the app and answering health checks never waits on it.
+"""
+import os
+from dotenv import load_dotenv
+
+_configured = False
+
+
+def configure():
+    """Load .env into the environment (once per process)"""
+    global _configured
+    if not _configured:
+        load_dotenv()
+        _configured = True
+
+
+def preload_chat_stack():
+    """Import the chat stack and load the tokenizer ahead of building it; safe to run on a worker thread"""
+    from .services import chatbot  # noqa: F401
+    from .services.history import load_encoding
+    load_encoding()
+
+
+def build_retriever(shared_cache=None):
+    from .services.retriever import Retriever
+    return Retriever(shared_cache=shared_cache)
+
+
+def build_chatbot(retriever, api_key: str = None):
+    from .services.chatbot import Chatbot
+    return Chatbot(api_key=api_key or os.getenv("OPENAI_API_KEY"), retriever=retriever)
+
+
+def build_session_manager(session_url: str = None):
+    from .services.session_manager import SessionManager
+    from .services.session_store import create_session_store
+    return SessionManager(create_session_store(session_url))
+
+
+def serve(app_path: str = "app.server:app"):
+    """Run the API under uvicorn on PORT with WEB_CONCURRENCY worker processes"""
+    import uvicorn
+    configure()
+    port = int(os.getenv("PORT") or os.getenv("port") or 8000)
+    workers = int(os.getenv("WEB_CONCURRENCY") or 1)
+    # The app goes by import string so each worker process builds its own
+    uvicorn.run(app_path, host="0.0.0.0", port=port, workers=workers)
@@ -1,23 +1,22 @@
 import os
-from dotenv import load_dotenv
-from .services.chatbot import Chatbot
-from .services.retriever import Retriever
+from .bootstrap import build_chatbot, build_retriever, configure
 
 def main():
-    load_dotenv()
+    configure()
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         print("Error: OPENAI_API_KEY not found. Please create a .env file and set your API key.")
         return
 
-    retriever = Retriever()
-    chatbot = Chatbot(api_key=api_key, retriever=retriever)
+    retriever = build_retriever()
+    chatbot = build_chatbot(retriever, api_key)
     
     print("Welcome to the Legal Advice Chatbot!")
     
     while True:
         user_input = input("\nPlease enter your legal question (or type 'exit' to quit): ")
         if user_input.lower() == 'exit':
+            retriever.close()
             print("Thank you for using the Legal Advice Chatbot. Goodbye!")
             break
         
@@ -1,7 +1,12 @@
+import functools
+import json
+from contextlib import aclosing
 from fastapi import APIRouter, Request, Depends, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from typing import List, Optional
-from ..services.session_manager import SessionManager
+from ..services.admission import CONTINUING, NEW, Overloaded, RateLimited, retry_after_header
+from ..services.session_manager import SessionGone, SessionManager
 
 router = APIRouter()
 
@@ -13,6 +18,13 @@ class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
 
+class PrefetchRequest(BaseModel):
+    query: Optional[str] = Field(None, max_length=4000)
+    session_id: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=500)
+
 class ChatResponse(BaseModel):
     response: str
     session_id: str
@@ -22,43 +34,66 @@ class ChatResponse(BaseModel):
 async def get_current_user_id(request: Request) -> str:
     return "test_user_123"
 
+async def _admit(request: Request, req: ChatRequest, user_id: str):
+    """Take a chat slot (follow-ups in a session go first); 429 over the user's rate, 503 when saturated"""
+    admission = request.app.state.admission
+    try:
+        await admission.acquire(user_id, CONTINUING if req.session_id else NEW)
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e.retry_after))
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=retry_after_header(e.retry_after))
+    return admission
+
+async def _prepare_session(req: ChatRequest, user_id: str, session_manager: SessionManager, chatbot, session=None):
+    """Resolve (unless already looked up) or create the session and load its summary and budgeted history"""
+    if req.session_id:
+        if session is None:
+            session = await session_manager.get_session(req.session_id, user_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        session_id = req.session_id
+    else:
+        # Create new session with title from first message
+        title = req.message[:50] + "..." if len(req.message) > 50 else req.message
+        session_id = await session_manager.create_session(user_id, title)
+        session = None
+    
+    # Get conversation summary, recent history and messages due to be summarised
+    summary, history, overflow = await chatbot.memory.load(session_manager, session)
+    conversation_history = [
+        {"role": msg["role"], "content": msg["content"]} 
+        for msg in history
+    ]
+    return session_id, summary, conversation_history, overflow
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_with_session(
     req: ChatRequest,
     request: Request,
     user_id: str = Depends(get_current_user_id)
 ):
+    admission = await _admit(request, req, user_id)
     try:
         # Get services from app state
         chatbot = request.app.state.chatbot
         session_manager = request.app.state.session_manager  # Use app state
         
-        # Handle session
-        if req.session_id:
-            session = await session_manager.get_session(req.session_id, user_id)
-            if not session:
-                raise HTTPException(status_code=404, detail="Session not found")
-            session_id = req.session_id
-        else:
-            # Create new session with title from first message
-            title = req.message[:50] + "..." if len(req.message) > 50 else req.message
-            session_id = await session_manager.create_session(user_id, title)
-        
-        # Get conversation history
-        history = await session_manager.get_session_history(session_id, limit=20)
-        conversation_history = [
-            {"role": msg.role, "content": msg.content} 
-            for msg in history
-        ]
-        
-        # Store user message
-        await session_manager.add_message(session_id, req.message, "user")
+        session_id, summary, conversation_history, overflow = await _prepare_session(
+            req, user_id, session_manager, chatbot
+        )
         
         # Generate response with history
-        reply = chatbot.process_query_with_history(req.message, conversation_history)
+        reply = await chatbot.aprocess_query_with_history(req.message, conversation_history, summary)
         
-        # Store assistant response
-        message_id = await session_manager.add_message(session_id, reply, "assistant")
+        # Store the user message and assistant response in one write
+        try:
+            _, message_id = await session_manager.add_messages(
+                session_id, [(req.message, "user"), (reply, "assistant")]
+            )
+        except SessionGone:
+            raise HTTPException(status_code=410, detail="Session expired")
+        chatbot.memory.schedule_update(session_manager, session_id, summary, overflow)
         
         return ChatResponse(
             response=reply,
@@ -66,29 +101,206 @@ async def chat_with_session(
             message_id=message_id
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Chat error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        admission.release()
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream_with_session(
+    req: ChatRequest,
+    request: Request,
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Server-sent events variant of /chat.
+
+    Emits a `session` event once a chat slot is free, `token` events as the
+    model produces them, then `done` with the stored message id. The slot is
+    taken and released inside the stream, so a response whose body is never
+    sent holds nothing; over the rate limit or at capacity the stream is a
+    single `error` event with the status /chat would return and
+    `retry_after`, and a session evicted before the turn could be stored
+    ends with an `error` event with status 410. If the client disconnects
+    the upstream OpenAI stream is closed and the turn is not stored.
+    """
+    chatbot = request.app.state.chatbot
+    session_manager = request.app.state.session_manager
+    admission = request.app.state.admission
+    session = None
+    if req.session_id:
+        session = await session_manager.get_session(req.session_id, user_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+
+    async def events():
+        try:
+            await admission.acquire(user_id, CONTINUING if req.session_id else NEW)
+        except (RateLimited, Overloaded) as e:
+            status = 429 if isinstance(e, RateLimited) else 503
+            yield _sse("error", {"status": status, "detail": str(e), "retry_after": e.retry_after})
+            return
+        try:
+            parts = []
+            try:
+                session_id, summary, conversation_history, overflow = await _prepare_session(
+                    req, user_id, session_manager, chatbot, session
+                )
+                yield _sse("session", {"session_id": session_id})
+                deltas = chatbot.astream_query_with_history(req.message, conversation_history, summary)
+                async with aclosing(deltas):
+                    async for delta in deltas:
+                        if await request.is_disconnected():
+                            print(f"Client disconnected from stream for session {session_id}")
+                            return
+                        parts.append(delta)
+                        yield _sse("token", {"content": delta})
+            except Exception as e:
+                print(f"Chat stream error: {e}")
+                yield _sse("error", {"detail": "I apologize, but I'm experiencing technical difficulties. Please try again."})
+                return
+
+            try:
+                _, message_id = await session_manager.add_messages(
+                    session_id, [(req.message, "user"), ("".join(parts), "assistant")]
+                )
+            except SessionGone:
+                yield _sse("error", {"status": 410, "detail": "Session expired"})
+                return
+            chatbot.memory.schedule_update(session_manager, session_id, summary, overflow)
+            yield _sse("done", {"session_id": session_id, "message_id": message_id})
+        finally:
+            admission.release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/chat/prefetch", status_code=202)
+async def chat_prefetch(
+    req: PrefetchRequest,
+    request: Request,
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Warm retrieval for a message the user is still typing (call it as they type).
+
+    Returns at once; the search and feed caches fill in the background at low
+    priority, so the `/chat` call that follows finds its context ready.
+    `status` says whether the draft was scheduled or why it was skipped.
+    """
+    if req.session_id:
+        session_manager = request.app.state.session_manager
+        if not await session_manager.get_session(req.session_id, user_id):
+            raise HTTPException(status_code=404, detail="Session not found")
+    return {"status": request.app.state.prefetcher.submit(user_id, req.query)}
+
+@router.post("/chat/batch")
+async def chat_batch(
+    req: BatchRequest,
+    request: Request,
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Answer a list of independent questions (no session history).
+
+    Results stream back as newline-delimited JSON in completion order, one
+    object per question with its `index` in the request. Items that still fail
+    after retries have status "error" and can be resubmitted on their own.
+
+    Each question counts against the user's chat allowance and runs in a
+    share of the chat slots below interactive chats; the batch is turned away
+    (429/503) when the user has no allowance left or chats are queueing.
+    """
+    chatbot = request.app.state.chatbot
+    admission = request.app.state.admission
+    try:
+        admission.check_batch(user_id)
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e.retry_after))
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=retry_after_header(e.retry_after))
+
+    async def results():
+        gate = functools.partial(admission.batch_item, user_id)
+        async with aclosing(chatbot.aprocess_batch(req.questions, gate)) as batch:
+            async for result in batch:
+                if await request.is_disconnected():
+                    print(f"Client disconnected from batch of {len(req.questions)} questions")
+                    return
+                yield json.dumps(result) + "\n"
+
+    return StreamingResponse(
+        results(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/sessions")
 async def get_user_sessions(
     request: Request,
+    limit: int = 50,
+    before: Optional[str] = None,
     user_id: str = Depends(get_current_user_id)
 ):
-    """Get all sessions for user"""
+    """Get sessions for user, newest first; pass `next_before` back as `before` for the next page"""
     try:
         session_manager = request.app.state.session_manager
-        sessions = await session_manager.get_user_sessions(user_id)
+        sessions = await session_manager.get_user_sessions(user_id, limit=limit, before=before)
         
-        return {"sessions": [
-            {
-                "id": session.id,
-                "title": session.title,
-                "created_at": session.created_at.isoformat(),
-                "updated_at": session.updated_at.isoformat()
-            }
-            for session in sessions
-        ]}
+        return {
+            "sessions": [
+                {
+                    "id": session.id,
+                    "title": session.title,
+                    "created_at": session.created_at.isoformat(),
+                    "updated_at": session.updated_at.isoformat()
+                }
+                for session in sessions
+            ],
+            "next_before": sessions[-1].id if len(sessions) == limit else None
+        }
     except Exception as e:
         print(f"Sessions error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/sessions/{session_id}/messages")
+async def get_session_messages(
+    session_id: str,
+    request: Request,
+    limit: int = 50,
+    before: Optional[str] = None,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Get session history, oldest first; pass `next_before` back as `before` for older messages"""
+    try:
+        session_manager = request.app.state.session_manager
+        if not await session_manager.get_session(session_id, user_id):
+            raise HTTPException(status_code=404, detail="Session not found")
+        messages = await session_manager.get_session_history(session_id, limit=limit, before=before)
+        
+        return {
+            "messages": [
+                {
+                    "id": msg.id,
+                    "role": msg.role,
+                    "content": msg.content,
+                    "created_at": msg.created_at.isoformat()
+                }
+                for msg in messages
+            ],
+            "next_before": messages[0].id if len(messages) == limit else None
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Session messages error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,21 +1,78 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
-from .services.chatbot import Chatbot
-from .services.retriever import Retriever
-from .services.session_manager import SessionManager
+from .bootstrap import build_chatbot, build_retriever, build_session_manager, configure, preload_chat_stack, serve
+from .services.admission import AdmissionController
+from .services.prefetch import Prefetcher
+from .services.shared_state import SharedCache, shared_state_dir
+from .services.concurrency import run_blocking, shutdown_blocking_executor
+from .services.tracing import tracer
 from .routes.chat import router
 
 # Load environment
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-retriever = Retriever()
-chatbot = Chatbot(api_key=api_key, retriever=retriever)
-session_manager = SessionManager()  # Add this line
+configure()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Build the services for this worker process, load the legislation feeds
+    before taking traffic, and release everything on shutdown.
+
+    With several workers (WEB_CONCURRENCY > 1, uvicorn --workers, or
+    SHARED_STATE_DIR set) sessions default to a SQLite file and search results
+    and feed entries go through a shared SQLite cache, both in WAL mode, so a
+    session created on one worker is found on every other.
+
+    The service modules are imported here rather than with the app; the chat
+    stack loads on a worker thread while the feeds are fetched.
+    """
+    state_dir = shared_state_dir()
+    shared_cache = SharedCache(os.path.join(state_dir, "cache.db")) if state_dir else None
+    # Sessions stay in process unless SESSION_DATABASE_URL points at a database (e.g. sqlite:///sessions.db)
+    session_url = os.getenv("SESSION_DATABASE_URL")
+    if not session_url and state_dir:
+        session_url = f"sqlite:///{os.path.abspath(os.path.join(state_dir, 'sessions.db'))}"
+
+    retriever = build_retriever(shared_cache)
+    prewarm = asyncio.ensure_future(retriever.feed_store.prewarm(float(os.getenv("FEED_PREWARM_TIMEOUT", "10"))))
+    await run_blocking(preload_chat_stack)
+    chatbot = build_chatbot(retriever)
+    session_manager = build_session_manager(session_url)
+    app.state.chatbot = chatbot
+    app.state.session_manager = session_manager
+    app.state.retriever = retriever
+    app.state.admission = AdmissionController.from_env()
+    app.state.prefetcher = Prefetcher(
+        chatbot, app.state.admission, max_concurrent=int(os.getenv("PREFETCH_MAX_CONCURRENT", "2"))
+    )
+
+    await prewarm
+    # Keep the legislation feeds (and the offline legislation mirror, if configured) fresh in the background
+    retriever.feed_store.start()
+    if retriever.corpus is not None:
+        retriever.corpus.start(
+            retriever.http, retriever.legislation_feeds, float(os.getenv("CORPUS_SYNC_INTERVAL", "3600"))
+        )
+    try:
+        yield
+    finally:
+        # Release the pooled upstream connections and worker threads
+        await app.state.prefetcher.close()
+        await retriever.feed_store.stop()
+        if retriever.corpus is not None:
+            await retriever.corpus.stop()
+        await retriever.aclose()
+        await chatbot.aclose()
+        await session_manager.close()
+        if shared_cache is not None:
+            shared_cache.close()
+        shutdown_blocking_executor()
 
 # Create FastAPI app
-app = FastAPI(title="Zanger AI API")
+app = FastAPI(title="Zanger AI API", lifespan=lifespan)
 
 # Add CORS middleware to allow requests from frontend
 app.add_middleware(
@@ -26,11 +83,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store services in app state for routes to access
-@app.on_event("startup")
-async def startup_event():
-    app.state.chatbot = chatbot
-    app.state.session_manager = session_manager  # Add this line
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Root span per request; its trace id is returned in X-Trace-Id"""
+    if not tracer.enabled:
+        return await call_next(request)
+    with tracer.span("http.request", method=request.method) as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        span.labels["route"] = getattr(route, "path", "unmatched")
+        span.labels["status"] = response.status_code
+        response.headers["X-Trace-Id"] = span.trace_id
+        return response
+
+def _service_metrics():
+    """Gauges and counters read from the services' own stats at scrape time"""
+    chatbot = getattr(app.state, "chatbot", None)
+    retriever = getattr(app.state, "retriever", None)
+    if chatbot is None or retriever is None:
+        return
+    for name, cache in (("query", retriever.query_cache), ("answer", chatbot.answer_cache)):
+        stats = cache.stats()
+        yield "lexley_cache_entries", "gauge", "Entries held per cache", {"cache": name}, stats["entries"]
+        yield "lexley_cache_bytes", "gauge", "Estimated bytes held per cache", {"cache": name}, stats["bytes"]
+        yield "lexley_cache_hit_rate", "gauge", "Hit rate per cache since start", {"cache": name}, stats["hit_rate"]
+    for site_key, guard in retriever.guards.items():
+        yield ("lexley_source_circuit_open", "gauge", "1 while a source's circuit breaker is not closed",
+               {"source": site_key}, int(guard.breaker.state != guard.breaker.CLOSED))
+        yield ("lexley_source_failures_total", "counter", "Failed calls per source",
+               {"source": site_key}, guard.stats.failures)
+    yield "lexley_feed_version", "gauge", "Legislation feed content version", {}, retriever.feed_store.version
+    session_store = getattr(getattr(app.state, "session_manager", None), "store", None)
+    if hasattr(session_store, "stats"):
+        stats = session_store.stats()
+        yield "lexley_sessions", "gauge", "Sessions held in process", {}, stats["sessions"]
+        yield "lexley_session_messages", "gauge", "Messages held in process", {}, stats["messages"]
+        yield "lexley_sessions_evicted_total", "counter", "Idle sessions evicted", {}, stats["evicted_sessions"]
+    admission = getattr(app.state, "admission", None)
+    if admission is not None:
+        stats = admission.stats()
+        yield "lexley_chat_in_flight", "gauge", "Chats being answered", {}, stats["in_flight"]
+        for kind, count in stats["queued"].items():
+            yield "lexley_chat_queue_depth", "gauge", "Chats waiting for a slot", {"session": kind}, count
+        for reason, count in stats["rejected"].items():
+            yield "lexley_chat_rejections_total", "counter", "Chats turned away", {"reason": reason}, count
+        yield "lexley_chat_batch_in_flight", "gauge", "Batch questions being answered", {}, stats["batch_in_flight"]
+    prefetcher = getattr(app.state, "prefetcher", None)
+    if prefetcher is not None:
+        for outcome, count in prefetcher.stats()["outcomes"].items():
+            yield "lexley_prefetch_total", "counter", "Speculative prefetch drafts by outcome", {"outcome": outcome}, count
+    for intent, route in chatbot.intents.stats()["routes"].items():
+        yield "lexley_intent_requests_total", "counter", "Messages per intent route", {"intent": intent}, route["count"]
+    for model, stats in chatbot.router.stats()["models"].items():
+        for kind in ("prompt", "completion", "cached_prompt"):
+            yield ("lexley_model_tokens_total", "counter", "Tokens used per model",
+                   {"model": model, "kind": kind}, stats[f"{kind}_tokens"])
+        yield "lexley_model_fallbacks_total", "counter", "Fallbacks away from a model", {"model": model}, stats["fallbacks"]
+
+tracer.metrics.add_collector(_service_metrics)
 
 # Include the chat router WITH /api prefix
 app.include_router(router, prefix="/api")  
@@ -42,7 +152,37 @@ async def root():
 async def health():
     return {"status": "healthy", "service": "ZangerAI"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition: span latency histograms plus service counters"""
+    return PlainTextResponse(tracer.metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/sources")
+async def source_health(request: Request):
+    """Per-source breaker state, latency percentiles and error rates, plus cache counters"""
+    retriever = request.app.state.retriever
+    chatbot = request.app.state.chatbot
+    return {
+        **retriever.source_stats(),
+        "query_cache": retriever.query_cache.stats(),
+        "answer_cache": chatbot.answer_cache.stats(),
+        "context": chatbot.context_processor.stats()
+    }
+
+@app.get("/health/admission")
+async def admission_health(request: Request):
+    """Chat slots in use, queue depth by session kind, requests admitted or turned away, and speculative prefetch"""
+    return {**request.app.state.admission.stats(), "prefetch": request.app.state.prefetcher.stats()}
+
+@app.get("/health/intents")
+async def intent_health(request: Request):
+    """How much traffic each route takes (legal questions vs greetings and small talk)"""
+    return request.app.state.chatbot.intents.stats()
+
+@app.get("/health/models")
+async def model_health(request: Request):
+    """Requests routed per model tier, plus latency, fallbacks and token usage per model"""
+    return request.app.state.chatbot.router.stats()
+
 if __name__ == "__main__":
-    import uvicorn
-    port = int(os.getenv("port", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    serve()
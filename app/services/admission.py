@@ -0,0 +1,318 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+CONTINUING = 0  # a follow-up in an existing session
+NEW = 1  # the first message of a new session
+
+
+class RateLimited(Exception):
+    """The user has used up their request allowance; retry after `retry_after` seconds"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    """No chat capacity is free and the wait queue is full (or the wait timed out)"""
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        super().__init__(f"Server busy ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self, cost: float = 1) -> float:
+        """Take `cost` tokens; returns 0 on success, else the seconds until they are available"""
+        self._refill()
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def wait_time(self, cost: float = 1) -> float:
+        """Seconds until `cost` tokens are available, without taking them"""
+        self._refill()
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+
+class AdmissionController:
+    """
+    Admission control in front of the chat endpoints.
+
+    - Each user has a token bucket (`rate_per_minute`, bursts of `burst`);
+      a request without a token is rejected at once (429).
+    - At most `max_in_flight` chats run at a time. Further requests wait in a
+      queue of at most `max_queue`, continuing sessions ahead of new ones and
+      first come first served within each. A continuing session arriving at a
+      full queue takes the place of the newest waiting new session; otherwise
+      the request is rejected at once, as is one that waits longer than
+      `queue_timeout` (503).
+    - Batch questions run below both: each one takes `batch_item_cost` from
+      the user's bucket (waiting in line for it to refill rather than failing;
+      one task per user sleeps on the refill, not every waiting item) and a
+      chat slot, only while no chat is queued, and at most `batch_share` of
+      the slots go to batch items at once. A batch is turned away up front
+      when the user has no allowance left (429) or chats are queueing (503).
+
+    Limits are per worker process. Buckets of users idle long enough to have
+    refilled are dropped once more than `max_users` are held. `listeners` are
+    called whenever a request has to queue (e.g. to shed speculative work).
+    """
+
+    def __init__(self, rate_per_minute: float = 20, burst: float = 5, max_in_flight: int = 32,
+                 max_queue: int = 64, queue_timeout: float = 10.0, max_users: int = 10000,
+                 batch_share: float = 0.25, batch_item_cost: float = 1):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_users = max_users
+        self.batch_limit = max(1, int(max_in_flight * batch_share))
+        self.batch_item_cost = batch_item_cost
+        self.batch_in_flight = 0
+        self._batch_waiters = deque()
+        self._token_waiters = {}  # user id -> batch items waiting for tokens, first come first served
+        self._token_feeders = {}  # user id -> the task handing those tokens out
+        self.batch_items = 0
+        self.buckets = OrderedDict()  # user id -> TokenBucket, least recently used first
+        self.in_flight = 0
+        self._waiters = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self.listeners = []
+        self.admitted = {CONTINUING: 0, NEW: 0}
+        self.rejected = {"rate_limited": 0, "queue_full": 0, "queue_timeout": 0, "displaced": 0, "batch_busy": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            rate_per_minute=float(os.getenv("CHAT_RATE_PER_MINUTE", "20")),
+            burst=float(os.getenv("CHAT_RATE_BURST", "5")),
+            max_in_flight=int(os.getenv("CHAT_MAX_IN_FLIGHT", "32")),
+            max_queue=int(os.getenv("CHAT_MAX_QUEUE", "64")),
+            queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT", "10")),
+            batch_share=float(os.getenv("CHAT_BATCH_SHARE", "0.25")),
+            batch_item_cost=float(os.getenv("CHAT_BATCH_ITEM_COST", "1"))
+        )
+
+    def _bucket(self, user_id: str) -> TokenBucket:
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            bucket = self.buckets[user_id] = TokenBucket(self.rate, self.burst)
+            if len(self.buckets) > self.max_users:
+                # A bucket idle for burst / rate seconds is full again: forgetting it changes nothing
+                idle_since = time.monotonic() - self.burst / self.rate
+                while len(self.buckets) > self.max_users:
+                    oldest = next(iter(self.buckets.values()))
+                    if oldest.updated_at > idle_since:
+                        break
+                    self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(user_id)
+        return bucket
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, waiter in self._waiters if not waiter.done())
+
+    def _wake_next(self):
+        """Hand free slots to the highest priority chats waiting, then to batch items"""
+        while self._waiters and self.in_flight < self.max_in_flight:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+        while self._batch_waiters and self._batch_slot_free():
+            waiter = self._batch_waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                self.batch_in_flight += 1
+                waiter.set_result(None)
+
+    def _batch_slot_free(self) -> bool:
+        return (self.batch_in_flight < self.batch_limit and self.in_flight < self.max_in_flight
+                and not self.queued)
+
+    def _displace_new(self) -> bool:
+        """Reject the most recently queued new session to make room for a continuing one"""
+        candidates = [entry for entry in self._waiters if entry[0] == NEW and not entry[2].done()]
+        if not candidates:
+            return False
+        entry = max(candidates, key=lambda entry: entry[1])
+        entry[2].set_exception(Overloaded("displaced"))
+        self._waiters.remove(entry)
+        heapq.heapify(self._waiters)
+        self.rejected["displaced"] += 1
+        return True
+
+    async def acquire(self, user_id: str, priority: int = NEW):
+        """Take a token and a chat slot, waiting in the queue if need be; call release() when done"""
+        retry_after = self._bucket(user_id).take()
+        if retry_after:
+            self.rejected["rate_limited"] += 1
+            raise RateLimited(retry_after)
+
+        if self.in_flight < self.max_in_flight and not self.queued:
+            self.in_flight += 1
+            self.admitted[priority] += 1
+            return
+        if self.queued >= self.max_queue and not (priority == CONTINUING and self._displace_new()):
+            self.rejected["queue_full"] += 1
+            raise Overloaded("queue_full")
+
+        for listener in self.listeners:
+            listener()
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.exception():
+                # Granted a slot just as the wait ran out: use it
+                self.admitted[priority] += 1
+                return
+            waiter.cancel()
+            self.rejected["queue_timeout"] += 1
+            raise Overloaded("queue_timeout", retry_after=self.queue_timeout)
+        except asyncio.CancelledError:
+            # The client went away while queued; pass on a slot it was just given
+            if waiter.done() and not waiter.cancelled() and not waiter.exception():
+                self.release()
+            else:
+                waiter.cancel()
+            raise
+        self.admitted[priority] += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake_next()
+
+    @asynccontextmanager
+    async def admit(self, user_id: str, priority: int = NEW):
+        await self.acquire(user_id, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def check_batch(self, user_id: str):
+        """Turn a batch away up front if the user has no allowance left or chats are queueing"""
+        retry_after = self._bucket(user_id).wait_time(self.batch_item_cost)
+        if retry_after:
+            self.rejected["rate_limited"] += 1
+            raise RateLimited(retry_after)
+        if self.queued:
+            self.rejected["batch_busy"] += 1
+            raise Overloaded("batch_busy")
+
+    @asynccontextmanager
+    async def batch_item(self, user_id: str):
+        """Slot for one batch question: its cost from the user's bucket, then a spare chat slot"""
+        await self._take_batch_tokens(user_id)
+        if self._batch_slot_free() and not self._batch_waiters:
+            self.in_flight += 1
+            self.batch_in_flight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._batch_waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Given a slot as it was cancelled: hand it on
+                    self._release_batch_item()
+                raise
+        self.batch_items += 1
+        try:
+            yield
+        finally:
+            self._release_batch_item()
+
+    async def _take_batch_tokens(self, user_id: str):
+        """Take a batch item's cost from the user's bucket, queueing behind the user's earlier items"""
+        bucket = self._bucket(user_id)
+        waiters = self._token_waiters.get(user_id)
+        if waiters is None and not bucket.take(self.batch_item_cost):
+            return
+        if waiters is None:
+            waiters = self._token_waiters[user_id] = deque()
+            self._token_feeders[user_id] = asyncio.get_running_loop().create_task(
+                self._feed_tokens(user_id, bucket, waiters))
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Given the tokens as it was cancelled: put them back
+                bucket.tokens = min(bucket.burst, bucket.tokens + self.batch_item_cost)
+            raise
+
+    async def _feed_tokens(self, user_id: str, bucket: TokenBucket, waiters: deque):
+        """The one task per user that sleeps until the bucket refills and hands tokens out in order"""
+        try:
+            while waiters:
+                if waiters[0].done():
+                    waiters.popleft()
+                    continue
+                retry_after = bucket.take(self.batch_item_cost)
+                if retry_after:
+                    await asyncio.sleep(retry_after)
+                else:
+                    waiters.popleft().set_result(None)
+        finally:
+            del self._token_waiters[user_id]
+            del self._token_feeders[user_id]
+            for waiter in waiters:
+                waiter.cancel()
+
+    def _release_batch_item(self):
+        self.batch_in_flight -= 1
+        self.release()
+
+    def stats(self):
+        waiting = [priority for priority, _, waiter in self._waiters if not waiter.done()]
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": {
+                "continuing": waiting.count(CONTINUING),
+                "new": waiting.count(NEW),
+                "batch": sum(1 for waiters in (self._batch_waiters, *self._token_waiters.values())
+                             for waiter in waiters if not waiter.done())
+            },
+            "batch_in_flight": self.batch_in_flight,
+            "batch_limit": self.batch_limit,
+            "max_queue": self.max_queue,
+            "admitted": {"continuing": self.admitted[CONTINUING], "new": self.admitted[NEW], "batch": self.batch_items},
+            "rejected": dict(self.rejected),
+            "users_tracked": len(self.buckets)
+        }
+
+
+def retry_after_header(seconds: Optional[float]) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(seconds or 1)))}
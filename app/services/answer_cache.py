@@ -0,0 +1,218 @@
+import re
+import sys
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from .query_cache import normalise_query
+from .text_index import tokenize
+from .tracing import traced
+
+
+# Words that flip or scope a legal answer ("without notice", "in Scotland"); embeddings
+# barely register them, so a near-identical question has to agree on every one
+_QUALIFIER_RE = re.compile(
+    r"\b(?:not|no|never|without|except|unless|cannot|before|after|"
+    r"england|english|wales|welsh|scotland|scottish|northern\s+ireland)\b|n't\b",
+    re.I
+)
+_QUALIFIER_ALIASES = {"n't": "not", "cannot": "not", "english": "england", "welsh": "wales", "scottish": "scotland"}
+
+
+def qualifiers(question: str) -> frozenset:
+    """Negations, jurisdictions and citation or number tokens a semantic match must share with the question"""
+    terms = set()
+    for match in _QUALIFIER_RE.finditer(question):
+        term = " ".join(match.group(0).lower().split())
+        terms.add(_QUALIFIER_ALIASES.get(term, term))
+    terms.update(token for token in tokenize(question) if any(char.isdigit() for char in token))
+    return frozenset(terms)
+
+
+class AnswerCache:
+    """
+    Cache of final answers to history-independent questions.
+
+    Lookups try the normalised question first. With an `embedder`, they then
+    try the nearest cached questions by embedding cosine similarity (at least
+    `threshold`) that also share the question's negations, jurisdictions and
+    citations; without one only exact repeats are served. Each
+    entry records the source URLs of the context it was answered from and the
+    version of every legislation feed that context drew on; an entry is not
+    served once any of those feeds has changed. Memory is bounded by an estimated byte budget; eviction
+    takes the least frequently used of the `eviction_sample` least recently
+    used entries.
+    """
+
+    def __init__(self, embedder=None, threshold: float = 0.97, ttl: float = 86400,
+                 max_bytes: int = 16 * 1024 * 1024, eviction_sample: int = 8):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.eviction_sample = eviction_sample
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # normalised question -> entry
+        self._matrix: Optional[np.ndarray] = None  # question vectors of entries in _matrix_keys
+        self._matrix_keys: List[str] = []
+        self._matrix_dirty = False
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _usable(self, entry, feed_versions: Dict[str, int]) -> bool:
+        return (
+            all(feed_versions.get(feed_key, 0) == version for feed_key, version in entry['feeds'].items())
+            and time.monotonic() < entry['expires_at']
+        )
+
+    def _hit(self, key, entry) -> str:
+        entry['hits'] += 1
+        self._entries.move_to_end(key)
+        return entry['answer']
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry['size']
+            self._matrix_dirty = self._matrix_dirty or entry['vector'] is not None
+        return entry
+
+    async def _embed(self, question: str) -> Optional[np.ndarray]:
+        if self.embedder is None:
+            return None
+        try:
+            vector = (await self.embedder.embed([question]))[0].astype(np.float32)
+        except Exception as e:
+            print(f"Answer cache embedding unavailable, exact matches only: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _nearest(self, vector: np.ndarray) -> List[str]:
+        """Keys of cached questions at least `threshold` similar to the vector, most similar first"""
+        if self._matrix_dirty:
+            self._matrix_keys = [key for key, entry in self._entries.items() if entry['vector'] is not None]
+            self._matrix = (
+                np.vstack([self._entries[key]['vector'] for key in self._matrix_keys])
+                if self._matrix_keys else None
+            )
+            self._matrix_dirty = False
+        if self._matrix is None:
+            return []
+        scores = self._matrix @ vector
+        rows = np.flatnonzero(scores >= self.threshold)
+        return [self._matrix_keys[row] for row in rows[np.argsort(-scores[rows], kind="stable")]]
+
+    def get_exact(self, question: str, feed_versions: Dict[str, int]) -> Optional[str]:
+        """Exact-match lookup only (for sync callers that can't embed)"""
+        key = normalise_query(question)
+        entry = self._entries.get(key)
+        if entry is not None and self._usable(entry, feed_versions):
+            self.exact_hits += 1
+            return self._hit(key, entry)
+        self.misses += 1
+        return None
+
+    @traced("answer_cache.get")
+    async def get(self, question: str, feed_versions: Dict[str, int]) -> Optional[str]:
+        key = normalise_query(question)
+        entry = self._entries.get(key)
+        if entry is not None and self._usable(entry, feed_versions):
+            self.exact_hits += 1
+            return self._hit(key, entry)
+
+        if self._entries and self.embedder is not None:
+            vector = await self._embed(question)
+            if vector is not None:
+                # A close match that is stale, or differs in a qualifier, gives way to the next one
+                wanted = qualifiers(question)
+                for nearest in self._nearest(vector):
+                    entry = self._entries.get(nearest)
+                    if entry is not None and entry['qualifiers'] == wanted and self._usable(entry, feed_versions):
+                        self.semantic_hits += 1
+                        return self._hit(nearest, entry)
+        self.misses += 1
+        return None
+
+    async def put(self, question: str, answer: str, context: List[Dict], feed_versions: Dict[str, int]):
+        """Store an answer; `feed_versions` must be the feed versions read before the context was retrieved"""
+        self._store(question, answer, context, feed_versions, await self._embed(question))
+
+    def put_exact(self, question: str, answer: str, context: List[Dict], feed_versions: Dict[str, int]):
+        """Store without an embedding, so only exact repeats will match"""
+        return self._store(question, answer, context, feed_versions, None)
+
+    def _store(self, question, answer, context, feed_versions, vector):
+        key = normalise_query(question)
+        items = [item for item in context if isinstance(item, dict)]
+        sources = sorted({item['url'] for item in items if item.get('url')})
+        feeds = {
+            item['feed_type']: feed_versions.get(item['feed_type'], 0)
+            for item in items if item.get('feed_type')
+        }
+        size = (
+            sys.getsizeof(key) + sys.getsizeof(answer) + sum(sys.getsizeof(url) for url in sources)
+            + (vector.nbytes if vector is not None else 0)
+        )
+        self._remove(key)
+        self._entries[key] = {
+            'answer': answer,
+            'sources': sources,
+            'feeds': feeds,
+            'qualifiers': qualifiers(question),
+            'expires_at': time.monotonic() + self.ttl,
+            'vector': vector,
+            'hits': 0,
+            'size': size
+        }
+        self.current_bytes += size
+        self._matrix_dirty = self._matrix_dirty or vector is not None
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            candidates = []
+            for candidate in self._entries:
+                if candidate != key:
+                    candidates.append(candidate)
+                if len(candidates) >= self.eviction_sample:
+                    break
+            victim = min(candidates, key=lambda candidate: self._entries[candidate]['hits'])
+            self._remove(victim)
+            self.evictions += 1
+
+    def invalidate(self, feeds=None, urls=None):
+        """Drop entries whose context came from any of `feeds`, or citing any of `urls`"""
+        feeds = set(feeds or ())
+        urls = set(urls or ())
+        stale = [
+            key for key, entry in self._entries.items()
+            if (feeds and feeds.intersection(entry['feeds'])) or (urls and urls.intersection(entry['sources']))
+        ]
+        for key in stale:
+            self._remove(key)
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+        self._matrix = None
+        self._matrix_keys = []
+        self._matrix_dirty = False
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+import weakref
+from typing import AsyncIterator, Dict, List
+from .intent import LEGAL
+from .query_cache import normalise_query
+from .tracing import traced
+
+
+class BatchRunner:
+    """
+    Answers a list of independent questions (e.g. a compliance checklist) and
+    yields each result as soon as it is ready.
+
+    - Questions that normalise to the same text are answered once.
+    - Feeds are refreshed once up front; site searches shared between
+      questions are coalesced by the retriever's query cache.
+    - At most `retrieval_concurrency` questions retrieve at a time (each fans
+      out to every source, within the sources' own limits) and at most
+      `llm_concurrency` completions run at a time, across all batches on the loop.
+    - A failed step is retried up to `attempts` times with backoff; a failed
+      completion reuses the context already retrieved. Items that still fail
+      are reported with status "error" so just those can be resubmitted.
+    - An optional `gate` (e.g. AdmissionController.batch_item for the caller)
+      is entered around each question that needs retrieval or a completion,
+      so that work is counted against the caller's allowance and the server's
+      chat capacity; template replies and cached answers are returned ungated.
+    """
+
+    def __init__(self, chatbot, retrieval_concurrency: int = 4, llm_concurrency: int = 8,
+                 attempts: int = 3, retry_delay: float = 1.0):
+        self.chatbot = chatbot
+        self.retrieval_concurrency = retrieval_concurrency
+        self.llm_concurrency = llm_concurrency
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self._semaphores = weakref.WeakKeyDictionary()  # loop -> (retrieval, llm) semaphores
+        self._lock = threading.Lock()
+
+    def _limits(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            limits = self._semaphores.get(loop)
+            if limits is None:
+                limits = (asyncio.Semaphore(self.retrieval_concurrency), asyncio.Semaphore(self.llm_concurrency))
+                self._semaphores[loop] = limits
+            return limits
+
+    async def _retrying(self, step, question: str, operation, attempts: List[int]):
+        """Run operation() with retries; attempts[0] counts tries across every step of the item"""
+        for attempt in range(1, self.attempts + 1):
+            attempts[0] += 1
+            try:
+                return await operation()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == self.attempts:
+                    raise
+                print(f"Batch {step} failed for '{question[:60]}' ({type(e).__name__}), retrying")
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+    @traced("batch.answer")
+    async def _answer(self, question: str, feed_versions: Dict[str, int], gate=None) -> Dict:
+        chatbot = self.chatbot
+        started = time.monotonic()
+
+        # Template replies and cached answers cost nothing, so they skip the gate
+        intent = await chatbot.intents.aclassify(question)
+        if intent != LEGAL:
+            answer = chatbot.templated_reply(intent)
+            if answer is not None:
+                return {"status": "ok", "answer": answer, "sources": [], "cached": False, "attempts": 0,
+                        "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+        else:
+            cached = await chatbot.answer_cache.get(question, feed_versions)
+            if cached is not None:
+                return {"status": "ok", "answer": cached, "sources": [], "cached": True, "attempts": 0,
+                        "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+
+        if gate is None:
+            return await self._generate(question, intent, feed_versions, started)
+        async with gate():
+            return await self._generate(question, intent, feed_versions, started)
+
+    async def _generate(self, question: str, intent: str, feed_versions: Dict[str, int], started: float) -> Dict:
+        chatbot = self.chatbot
+        retrieval_limit, llm_limit = self._limits()
+        attempts = [0]
+
+        if intent != LEGAL:
+            async with llm_limit:
+                answer = await chatbot.arespond_without_retrieval(question, intent)
+            return {"status": "ok", "answer": answer, "sources": [], "cached": False, "attempts": 1,
+                    "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+
+        async def retrieve():
+            async with retrieval_limit:
+                return await chatbot.aretrieve_context(question)
+
+        context = await self._retrying("retrieval", question, retrieve, attempts)
+        tier = chatbot.router.choose_tier(question, context)
+        messages = chatbot.build_messages(question, context)
+
+        async def complete():
+            async with llm_limit:
+                return await chatbot.router.acomplete(chatbot.async_client, messages, tier)
+
+        answer = await self._retrying("completion", question, complete, attempts)
+        await chatbot.answer_cache.put(question, answer, context, feed_versions)
+        return {
+            "status": "ok",
+            "answer": answer,
+            "sources": [item['url'] for item in context if isinstance(item, dict) and item.get('url', 'N/A') != 'N/A'],
+            "cached": False,
+            "attempts": attempts[0],
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1)
+        }
+
+    async def _run_group(self, question: str, indices: List[int], feed_versions: Dict[str, int], gate=None):
+        try:
+            result = await self._answer(question, feed_versions, gate)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Batch item failed for '{question[:60]}': {e}")
+            result = {"status": "error", "error": f"{type(e).__name__}: {e}", "attempts": self.attempts}
+        return indices, result
+
+    async def run(self, questions: List[str], gate=None) -> AsyncIterator[Dict]:
+        """Yield one result per question, in completion order; `index` is its position in `questions`"""
+        groups = {}  # normalised question -> (first wording, [indices])
+        for index, question in enumerate(questions):
+            groups.setdefault(normalise_query(question), (question, []))[1].append(index)
+
+        # One feed refresh for the whole batch instead of a check per question
+        feed_store = getattr(self.chatbot.retriever, 'feed_store', None)
+        if feed_store is not None:
+            await feed_store.refresh()
+        feed_versions = self.chatbot.feed_versions()
+
+        tasks = [
+            asyncio.ensure_future(self._run_group(question, indices, feed_versions, gate))
+            for question, indices in groups.values()
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                indices, result = await next_done
+                for index in indices:
+                    yield {"index": index, "question": questions[index], **result}
+        finally:
+            # The consumer went away (e.g. the client disconnected): stop the remaining work
+            for task in tasks:
+                task.cancel()
@@ -1,131 +1,386 @@
-from openai import OpenAI
+import functools
+import os
+from contextlib import aclosing
+from openai import OpenAI, AsyncOpenAI
 from typing import List, Dict, Any, Optional
+from .history import ConversationMemory, HistoryBuilder
+from .embedding_index import EmbeddingIndex, OpenAIEmbedder, SemanticReranker
+from .answer_cache import AnswerCache
+from .context import ContextProcessor, canonical_url
+from .model_router import ModelRouter
+from .batch import BatchRunner
+from .tracing import traced
+from .intent import IntentClassifier, GREETING, THANKS, FAREWELL, LEGAL
+
+ERROR_REPLY = "I apologize, but I'm experiencing technical difficulties. Please try again."
+
+# Replies for messages that need neither retrieval nor a model call:
+# intent -> (first message of a conversation, continuing conversation)
+TEMPLATE_REPLIES = {
+    GREETING: (
+        "Hello! Welcome to Lexley. I can help with questions about UK law, such as housing, employment, "
+        "consumer rights and family matters. What would you like to know?",
+        "Hi again! What else can I help you with?"
+    ),
+    THANKS: (
+        "You're welcome! Is there anything else I can help you with?",
+        "You're welcome! Is there anything else I can help you with?"
+    ),
+    FAREWELL: (
+        "Goodbye! Come back any time you have a question about UK law.",
+        "Goodbye, and good luck. Come back any time you have another question about UK law."
+    )
+}
+
+INTENT_PROMPT = """
+Classify this message sent to Lexley, a UK legal assistant. Reply with exactly one word:
+greeting, thanks, farewell, smalltalk, or legal (anything that may need legal information).
+
+Message: {message}
+"""
+
+# Kept byte-for-byte stable and always sent first, so provider-side prefix caching can hit
+SYSTEM_PROMPT = """
+You are Lexley, a helpful, friendly, and knowledgeable legal assistant specializing in UK law.
+
+**IMPORTANT CONVERSATION RULES:**
+- Only greet the user with "Hello!" or similar if this is the very first message of the conversation
+- For continuing conversations, respond naturally without repetitive greetings
+- Build on previous conversation context when relevant
+- Be conversational and helpful
+
+**Conversation Style:**
+- Be warm, approachable, and professional
+- For casual greetings, respond naturally and ask how you can help
+- For legal questions, provide comprehensive, professional answers
+- Remember what was discussed earlier in the conversation
+
+**Legal Expertise:**
+You have access to current UK legislation, government guidance, legal case law, and professional legal practice guidance.
+
+**When responding to legal questions:**
+- Reference previous conversation context when relevant
+- Prioritize recent legislation and official sources
+- Cite specific Acts, sections, or statutory instruments when relevant
+- very important -> ""Always" cite your sources with URLs, if you can't cite a source, give the link to the uk government website where the user can find the information themselves.
+"""
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a user and Lexley, a UK legal assistant.
+Update the summary with the new messages below. Keep the user's circumstances, key facts and dates,
+the legal issues raised, the advice given and any Acts, cases or URLs cited. Drop pleasantries.
+Reply with the updated summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+"""
 
 class Chatbot:
-    def __init__(self, api_key: str, retriever):
+    def __init__(self, api_key: str, retriever, history_builder: HistoryBuilder = None,
+                 summary_model: str = "gpt-4o-mini", context_top_k: int = 5, answer_cache: AnswerCache = None,
+                 smalltalk_tier: str = "simple", intent_model: str = None, model_router: ModelRouter = None):
         self.api_key = api_key
         self.retriever = retriever
-        self.client = OpenAI(api_key=self.api_key)
-
-    def generate_response_with_memory(self, query: str, context: list, conversation_history: List[Dict] = None):
-        """Enhanced response with conversation memory"""
+        self.async_client = AsyncOpenAI(api_key=self.api_key)
+        self.summary_model = summary_model
+        # Model tier per question (by complexity) with fallback on timeouts and errors
+        self.router = model_router if model_router is not None else ModelRouter.from_config()
+        self.memory = ConversationMemory(self.asummarise_history, builder=history_builder)
+        self.context_top_k = context_top_k
+        self.reranker = SemanticReranker(EmbeddingIndex(OpenAIEmbedder(self.async_client)))
+        # Retrieved items are deduplicated, stripped of markup and trimmed before reranking
+        self.context_processor = ContextProcessor(snippet_tokens=int(os.getenv("CONTEXT_SNIPPET_TOKENS", "150")))
+        # Answers to questions asked without any conversation history are reused for
+        # exact repeats until a legislation feed their context came from changes.
+        # ANSWER_CACHE_SEMANTIC=1 also serves near-identical questions by embedding
+        if answer_cache is None:
+            semantic = os.getenv("ANSWER_CACHE_SEMANTIC", "0").lower() not in ("0", "false", "no", "off")
+            answer_cache = AnswerCache(
+                self.reranker.index.embedder if semantic else None,
+                threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97")),
+                ttl=float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+            )
+        self.answer_cache = answer_cache
+        # Greetings and small talk are routed before retrieval; INTENT_MODEL (e.g.
+        # gpt-4o-mini) settles short messages the keyword rules can't place
+        self.smalltalk_tier = smalltalk_tier
+        self.intent_model = intent_model or os.getenv("INTENT_MODEL")
+        self.intents = IntentClassifier(self._aclassify_with_model if self.intent_model else None)
+        # Bulk question lists share retrieval work and bounded LLM concurrency
+        self.batch = BatchRunner(
+            self,
+            retrieval_concurrency=int(os.getenv("BATCH_RETRIEVAL_CONCURRENCY", "4")),
+            llm_concurrency=int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+        )
+        feed_store = getattr(retriever, 'feed_store', None)
+        if feed_store is not None:
+            feed_store.listeners.append(lambda feed_key, items: self.answer_cache.invalidate(feeds=[feed_key]))
+        # Search results leave the local index when their source's TTL passes or the page
+        # changes; answers citing them go with them
+        text_index = getattr(retriever, 'text_index', None)
+        if text_index is not None:
+            text_index.listeners.append(
+                lambda urls: self.answer_cache.invalidate(urls=[canonical_url(url) for url in urls])
+            )
 
-        is_first_message = not conversation_history or len(conversation_history) == 0
-        
-        greeting_keywords = ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening', 'how are you']
-        is_simple_greeting = any(keyword in query.lower() for keyword in greeting_keywords) and len(query.split()) <= 3
-        
-        system_prompt = """
-        You are Lexley, a helpful, friendly, and knowledgeable legal assistant specializing in UK law.
-        
-        **IMPORTANT CONVERSATION RULES:**
-        - Only greet the user with "Hello!" or similar if this is the very first message of the conversation
-        - For continuing conversations, respond naturally without repetitive greetings
-        - Build on previous conversation context when relevant
-        - Be conversational and helpful
-        
-        **Conversation Style:**
-        - Be warm, approachable, and professional
-        - For casual greetings, respond naturally and ask how you can help
-        - For legal questions, provide comprehensive, professional answers
-        - Remember what was discussed earlier in the conversation
-        
-        **Legal Expertise:**
-        You have access to current UK legislation, government guidance, legal case law, and professional legal practice guidance.
-        
-        **When responding to legal questions:**
-        - Reference previous conversation context when relevant
-        - Prioritize recent legislation and official sources
-        - Cite specific Acts, sections, or statutory instruments when relevant
-        - very important -> ""Always" cite your sources with URLs, if you can't cite a source, give the link to the uk government website where the user can find the information themselves.
-        """
+    @functools.cached_property
+    def client(self) -> OpenAI:
+        """Sync OpenAI client, built on first use (only the sync/CLI path needs it)"""
+        return OpenAI(api_key=self.api_key)
 
-        # Build conversation context
-        conversation_context = ""
-        if conversation_history and len(conversation_history) > 0:
-            conversation_context = "\n**Previous conversation:**\n"
-            recent_history = conversation_history[-6:] if len(conversation_history) > 6 else conversation_history
-            
-            for msg in recent_history:
-                role = "User" if msg['role'] == 'user' else "ZangerAI"
-                conversation_context += f"{role}: {msg['content']}\n"
-            conversation_context += "\n"
-
-        if is_simple_greeting:
-            if is_first_message:
-                simple_prompt = f"""
-                {system_prompt}
-                
-                Current user message: "{query}"
+    def format_context(self, context: list) -> str:
+        context_items = []
+        for item in (context or [])[:self.context_top_k]: 
+            if isinstance(item, dict):
+                title = item.get('title', 'Legal Source')
+                snippet = item.get('snippet', '')
+                url = item.get('url', '')
+                site = item.get('site', 'Legal Database')
                 
-                This is the user's first message and it's a greeting. Welcome them warmly to Lexley 
-                and ask how you can help with their legal questions today.
-                """
-            else:
-                simple_prompt = f"""
-                {system_prompt}
-                
-                {conversation_context}
-                Current user message: "{query}"
-                
-                This is a casual greeting in an ongoing conversation. Respond naturally and 
-                ask what you can help with next, referencing our previous discussion if appropriate.
-                """
-            return self.call_openai_api(simple_prompt)
-
-
-        formatted_context = ""
-        if context:
-            context_items = []
-            for item in context[:5]: 
-                if isinstance(item, dict):
-                    title = item.get('title', 'Legal Source')
-                    snippet = item.get('snippet', '')
-                    url = item.get('url', '')
-                    site = item.get('site', 'Legal Database')
-                    
-                    context_items.append(f"[{site}] {title}\n{snippet}\n(Source: {url})")
-            
-            if context_items:
-                formatted_context = f"\n\nAvailable legal context:\n---\n" + "\n\n".join(context_items) + "\n---\n"
-
-        # Build full prompt
-        user_prompt = f"""
-        {system_prompt}
-        
-        {conversation_context}
-        Current user question: "{query}"
-        {formatted_context}
-        
-        Please provide a comprehensive answer. Build on our previous conversation where relevant. 
-        {'Include specific source citations when using the legal context above.' if formatted_context else 'Provide helpful guidance based on your legal knowledge.'}
+                context_items.append(f"[{site}] {title}\n{snippet}\n(Source: {url})")
+        if not context_items:
+            return ""
+        return "Available legal context:\n---\n" + "\n\n".join(context_items) + "\n---\n\n"
+
+    @traced("chatbot.build_prompt")
+    def build_messages(self, query: str, context: list, conversation_history: List[Dict] = None,
+                       conversation_summary: str = None, small_talk: bool = False) -> List[Dict]:
         """
+        Chat messages for a query. The fixed system prompt always comes first so
+        the provider can reuse its cached prefix; the rolling summary, recent
+        history, context and question follow as their own messages. The
+        history is used as given: it has already been fitted to the token
+        budget (by memory.load, or on entry to the sync path).
+        """
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        if conversation_summary:
+            messages.append({"role": "system", "content": f"Summary of earlier conversation:\n{conversation_summary}"})
+        if conversation_history:
+            messages.extend(
+                {"role": "user" if msg['role'] == 'user' else "assistant", "content": msg['content']}
+                for msg in conversation_history
+            )
+
+        if small_talk:
+            messages.append({"role": "user", "content": query})
+            return messages
 
-        return self.call_openai_api(user_prompt)
+        formatted_context = self.format_context(context)
+        instruction = (
+            'Include specific source citations when using the legal context above.' if formatted_context
+            else 'Provide helpful guidance based on your legal knowledge.'
+        )
+        messages.append({
+            "role": "user",
+            "content": f'{formatted_context}Question: "{query}"\n\n'
+                       f'Please provide a comprehensive answer. Build on our previous conversation where relevant. {instruction}'
+        })
+        return messages
 
-    def call_openai_api(self, prompt: str) -> str:
-        """Call OpenAI API using GPT-4"""
+    @traced("chatbot.generate")
+    def generate_response_with_memory(self, query: str, context: list, conversation_history: List[Dict] = None,
+                                      conversation_summary: str = None):
+        """Enhanced response with conversation memory"""
+        tier = self.router.choose_tier(query, context, conversation_history)
+        messages = self.build_messages(query, context, conversation_history, conversation_summary)
+        return self.call_openai_api(messages, tier=tier)
+
+    @traced("chatbot.generate")
+    async def agenerate_response_with_memory(self, query: str, context: list, conversation_history: List[Dict] = None,
+                                             conversation_summary: str = None):
+        """Async variant of generate_response_with_memory"""
+        tier = self.router.choose_tier(query, context, conversation_history)
+        messages = self.build_messages(query, context, conversation_history, conversation_summary)
+        return await self.acall_openai_api(messages, tier=tier)
+
+    @staticmethod
+    def _as_messages(prompt) -> List[Dict]:
+        return [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+
+    @traced("chatbot.call_openai_api")
+    def call_openai_api(self, prompt, model: str = None, max_tokens: int = None, tier: str = None) -> str:
+        """Call OpenAI API through the model router (a prompt string or a message list)"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=2000,
-                temperature=0.7
-            )
-            return response.choices[0].message.content
+            return self.router.complete(self.client, self._as_messages(prompt), tier, model, max_tokens)
+        except Exception as e:
+            print(f"Error calling OpenAI API: {e}")
+            return ERROR_REPLY
+
+    @traced("chatbot.call_openai_api")
+    async def acall_openai_api(self, prompt, model: str = None, max_tokens: int = None, tier: str = None) -> str:
+        """Call OpenAI API through the model router without blocking the event loop"""
+        try:
+            return await self.router.acomplete(self.async_client, self._as_messages(prompt), tier, model, max_tokens)
         except Exception as e:
             print(f"Error calling OpenAI API: {e}")
-            return "I apologize, but I'm experiencing technical difficulties. Please try again."
+            return ERROR_REPLY
+
+    async def astream_openai_api(self, prompt, model: str = None, max_tokens: int = None, tier: str = None):
+        """Stream the completion through the model router, yielding content deltas as they arrive"""
+        deltas = self.router.astream(self.async_client, self._as_messages(prompt), tier, model, max_tokens)
+        async with aclosing(deltas):
+            async for delta in deltas:
+                yield delta
+
+    @traced("chatbot.retrieve")
+    def retrieve_context(self, query: str) -> list:
+        """Fetch context and keep the most relevant items (lexical ordering on the sync path)"""
+        context = self.context_processor.process(self.retriever.fetch_context_for_query(query))
+        return self.reranker.rerank_lexical(query, context, self.context_top_k)
+
+    @traced("chatbot.retrieve")
+    async def aretrieve_context(self, query: str) -> list:
+        """Fetch context and keep the top-k items by embedding similarity to the query"""
+        context = self.context_processor.process(await self.retriever.afetch_context_for_query(query))
+        return await self.reranker.rerank(query, context, self.context_top_k)
+
+    async def _aclassify_with_model(self, query: str) -> str:
+        return await self.router.acomplete(
+            self.async_client,
+            [{"role": "user", "content": INTENT_PROMPT.format(message=query[:500])}],
+            tier="simple", model=self.intent_model, max_tokens=3, temperature=0
+        )
+
+    def templated_reply(self, intent: str, conversation_history: List[Dict] = None,
+                        conversation_summary: str = None) -> Optional[str]:
+        """Canned reply for greetings, thanks and farewells; None for anything else"""
+        replies = TEMPLATE_REPLIES.get(intent)
+        if replies is None:
+            return None
+        is_first_message = not conversation_history and not conversation_summary
+        return replies[0] if is_first_message else replies[1]
+
+    def respond_without_retrieval(self, query: str, intent: str, conversation_history: List[Dict] = None,
+                                  conversation_summary: str = None) -> str:
+        """Template reply, or the cheaper model with no legal context for other small talk"""
+        reply = self.templated_reply(intent, conversation_history, conversation_summary)
+        if reply is not None:
+            return reply
+        messages = self.build_messages(query, [], conversation_history, conversation_summary, small_talk=True)
+        return self.call_openai_api(messages, max_tokens=300, tier=self.smalltalk_tier)
+
+    async def arespond_without_retrieval(self, query: str, intent: str, conversation_history: List[Dict] = None,
+                                         conversation_summary: str = None) -> str:
+        """Async variant of respond_without_retrieval"""
+        reply = self.templated_reply(intent, conversation_history, conversation_summary)
+        if reply is not None:
+            return reply
+        messages = self.build_messages(query, [], conversation_history, conversation_summary, small_talk=True)
+        return await self.acall_openai_api(messages, max_tokens=300, tier=self.smalltalk_tier)
+
+    def feed_versions(self) -> Dict[str, int]:
+        """Content version of each legislation feed, read before retrieval for the answer cache"""
+        feed_store = getattr(self.retriever, 'feed_store', None)
+        return dict(feed_store.versions) if feed_store is not None else {}
 
     # Keep backward compatibility
     def process_query(self, query: str):
         """Legacy method"""
-        context = self.retriever.fetch_context_for_query(query)
-        return self.generate_response_with_memory(query, context, [])
+        return self.process_query_with_history(query, [])
     
     def process_query_with_history(self, query: str, conversation_history: List[Dict] = None):
         """Process query with conversation history"""
-        context = self.retriever.fetch_context_for_query(query)
-        return self.generate_response_with_memory(query, context, conversation_history)
+        # Callers pass the raw history here, so fit it to the budget once
+        conversation_history, _ = self.memory.builder.select(conversation_history)
+        intent = self.intents.classify(query, follow_up=bool(conversation_history))
+        if intent != LEGAL:
+            return self.respond_without_retrieval(query, intent, conversation_history)
+        cacheable = not conversation_history
+        feed_versions = self.feed_versions()
+        if cacheable:
+            # No embeddings on the sync path, so only exact repeats are served here
+            cached = self.answer_cache.get_exact(query, feed_versions)
+            if cached is not None:
+                return cached
+        context = self.retrieve_context(query)
+        reply = self.generate_response_with_memory(query, context, conversation_history)
+        if cacheable and reply != ERROR_REPLY:
+            self.answer_cache.put_exact(query, reply, context, feed_versions)
+        return reply
+
+    async def aprocess_query(self, query: str):
+        """Async variant of process_query"""
+        return await self.aprocess_query_with_history(query, [])
+
+    async def aprocess_query_with_history(self, query: str, conversation_history: List[Dict] = None,
+                                          conversation_summary: str = None):
+        """Async variant of process_query_with_history for the API routes"""
+        intent = await self.intents.aclassify(query, follow_up=bool(conversation_history or conversation_summary))
+        if intent != LEGAL:
+            return await self.arespond_without_retrieval(query, intent, conversation_history, conversation_summary)
+        cacheable = not conversation_history and not conversation_summary
+        feed_versions = self.feed_versions()
+        if cacheable:
+            cached = await self.answer_cache.get(query, feed_versions)
+            if cached is not None:
+                return cached
+        context = await self.aretrieve_context(query)
+        reply = await self.agenerate_response_with_memory(query, context, conversation_history, conversation_summary)
+        if cacheable and reply != ERROR_REPLY:
+            await self.answer_cache.put(query, reply, context, feed_versions)
+        return reply
+
+    async def astream_query_with_history(self, query: str, conversation_history: List[Dict] = None,
+                                         conversation_summary: str = None):
+        """Retrieve context, then stream the answer token by token"""
+        intent = await self.intents.aclassify(query, follow_up=bool(conversation_history or conversation_summary))
+        if intent != LEGAL:
+            reply = self.templated_reply(intent, conversation_history, conversation_summary)
+            if reply is not None:
+                yield reply
+                return
+            messages = self.build_messages(query, [], conversation_history, conversation_summary, small_talk=True)
+            async with aclosing(self.astream_openai_api(messages, max_tokens=300, tier=self.smalltalk_tier)) as deltas:
+                async for delta in deltas:
+                    yield delta
+            return
+        cacheable = not conversation_history and not conversation_summary
+        feed_versions = self.feed_versions()
+        if cacheable:
+            cached = await self.answer_cache.get(query, feed_versions)
+            if cached is not None:
+                yield cached
+                return
+        context = await self.aretrieve_context(query)
+        tier = self.router.choose_tier(query, context, conversation_history)
+        messages = self.build_messages(query, context, conversation_history, conversation_summary)
+        parts = []
+        async with aclosing(self.astream_openai_api(messages, tier=tier)) as deltas:
+            async for delta in deltas:
+                parts.append(delta)
+                yield delta
+        if cacheable and parts:
+            await self.answer_cache.put(query, "".join(parts), context, feed_versions)
+
+    async def aprocess_batch(self, questions: List[str], gate=None):
+        """Answer independent questions, yielding {"index", "question", "status", "answer", ...} as each completes"""
+        async with aclosing(self.batch.run(questions, gate)) as results:
+            async for result in results:
+                yield result
+
+    @traced("chatbot.summarise")
+    async def asummarise_history(self, previous_summary: Optional[str], messages: List[Dict], max_words: int = 250) -> str:
+        """Fold messages that left the history window into the rolling summary"""
+        builder = self.memory.builder
+        formatted = "\n".join(
+            f"{'User' if msg['role'] == 'user' else 'ZangerAI'}: {builder.truncate(msg['content'], 1000)}"
+            for msg in messages
+        )
+        prompt = SUMMARY_PROMPT.format(
+            max_words=max_words,
+            summary=previous_summary or "(none yet)",
+            messages=formatted
+        )
+        return await self.router.acomplete(
+            self.async_client,
+            [{"role": "user", "content": prompt}],
+            tier="simple", model=self.summary_model, max_tokens=max_words * 2, temperature=0
+        )
+
+    async def aclose(self):
+        """Finish pending summary updates and close the async OpenAI client"""
+        await self.memory.drain()
+        await self.async_client.close()
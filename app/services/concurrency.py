@@ -0,0 +1,68 @@
+import asyncio
+import concurrent.futures
+import functools
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+def run_sync(coro):
+    """
+    Run a coroutine to completion from synchronous code.
+
+    Uses asyncio.run directly when no loop is running in this thread, otherwise
+    runs it on a fresh loop in a helper thread so callers inside async code
+    (e.g. a sync method called from a FastAPI handler) don't crash.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+# Bounded pool for the CPU-bound or blocking pieces left on the async path
+# (HTML and feed parsing), so they never run on the event loop thread.
+_blocking_executor = None
+
+
+def _get_blocking_executor():
+    global _blocking_executor
+    if _blocking_executor is None:
+        max_workers = int(os.getenv("BLOCKING_WORKERS", "8"))
+        _blocking_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="blocking"
+        )
+    return _blocking_executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a sync callable on the bounded blocking executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_blocking_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_blocking_executor():
+    global _blocking_executor
+    if _blocking_executor is not None:
+        _blocking_executor.shutdown(wait=False)
+        _blocking_executor = None
+
+
+_speculative = ContextVar("speculative", default=False)
+
+
+@contextmanager
+def speculative():
+    """Mark work started in this block (and tasks it spawns) as speculative, for HttpClientPool.budget"""
+    token = _speculative.set(True)
+    try:
+        yield
+    finally:
+        _speculative.reset(token)
+
+
+def is_speculative() -> bool:
+    return _speculative.get()
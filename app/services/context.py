@@ -0,0 +1,134 @@
+import html
+import re
+import zlib
+from typing import Dict, List
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from .history import count_tokens, truncate_tokens
+from .tracing import traced
+
+_TAGS = re.compile(r"<(script|style)\b.*?</\1\s*>|<[^>]+>", re.I | re.S)
+_SPACES = re.compile(r"\s+")
+_WORDS = re.compile(r"\w+")
+_TRACKING_PARAMS = re.compile(r"^(?:utm_\w+|ref|fbclid|gclid|src)$", re.I)
+# Views of the same legislation.gov.uk document (an Act, or one of its sections, parts or
+# schedules): /id/ukpga/2025/26, .../contents/enacted, .../section/11/made, .../data.feed
+_LEGISLATION_VIEW = re.compile(
+    r"^/(?:id/)?([a-z]+/\d{4}/\d+(?:/[\w.-]+)*?)(?:/contents)?(?:/(?:enacted|made|created|adopted))?(?:/data\.\w+)?$"
+)
+# Fallback URLs of link-less search results (page_url#result-n) are told apart by their fragment
+_RESULT_FRAGMENT = re.compile(r"^result-\d+$")
+
+
+def canonical_url(url: str) -> str:
+    """
+    One spelling per document: https, lowercase host, no fragment (except the
+    #result-n of link-less search results), tracking parameters or trailing
+    slash; legislation.gov.uk views of a document (/id/..., /contents,
+    /enacted, /data.*, ...) collapse to the document itself, while its
+    sections, parts and schedules stay separate.
+    """
+    if not url or url == "N/A":
+        return url
+    parts = urlsplit(url.strip())
+    if not parts.netloc:
+        return url
+    host = parts.netloc.lower()
+    if host == "legislation.gov.uk":
+        host = "www." + host
+    path = parts.path.rstrip("/") or "/"
+    if host == "www.legislation.gov.uk":
+        match = _LEGISLATION_VIEW.match(path)
+        if match:
+            path = "/" + match.group(1)
+    query = urlencode([(key, value) for key, value in parse_qsl(parts.query) if not _TRACKING_PARAMS.match(key)])
+    fragment = parts.fragment if _RESULT_FRAGMENT.match(parts.fragment) else ""
+    return urlunsplit(("https", host, path, query, fragment))
+
+
+def strip_markup(text: str) -> str:
+    """Plain text from an HTML fragment (feed summaries often carry markup and entities)"""
+    if not text:
+        return ""
+    if "<" in text:
+        text = _TAGS.sub(" ", text)
+    return _SPACES.sub(" ", html.unescape(text)).strip()
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """Hashes of the overlapping `size`-word runs of the text"""
+    words = _WORDS.findall(text.lower())
+    if len(words) < size:
+        return {zlib.crc32(" ".join(words).encode())} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + size]).encode()) for i in range(len(words) - size + 1)}
+
+
+class ContextProcessor:
+    """
+    Cleans retrieved context before reranking and prompt assembly.
+
+    Every item gets a canonical URL and a plain-text title and snippet.
+    Items with the same canonical URL, or whose title and snippet shingles
+    overlap by at least `similarity` (Jaccard), are collapsed into the first
+    one, keeping the longer snippet. Snippets are then cut to
+    `snippet_tokens` tokens, at a sentence end where one is close.
+    """
+
+    def __init__(self, similarity: float = 0.8, snippet_tokens: int = 150, model: str = "gpt-4"):
+        self.similarity = similarity
+        self.snippet_tokens = snippet_tokens
+        self.model = model
+        self.items_in = 0
+        self.duplicates = 0
+        self.tokens_trimmed = 0
+
+    def _trim(self, text: str) -> str:
+        trimmed = truncate_tokens(text, self.snippet_tokens, self.model)
+        if trimmed == text:
+            return text
+        # Prefer ending on a sentence when that keeps most of the budget
+        sentence_end = trimmed.rfind(". ", 0, len(trimmed) - 3)
+        if sentence_end > len(trimmed) * 0.6:
+            trimmed = trimmed[:sentence_end + 1]
+        self.tokens_trimmed += count_tokens(text, self.model) - count_tokens(trimmed, self.model)
+        return trimmed
+
+    @traced("context.process")
+    def process(self, items: List[Dict]) -> List[Dict]:
+        kept = []  # (item, shingles)
+        by_url = {}  # canonical url -> index in kept
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            self.items_in += 1
+            item = dict(item)
+            item['url'] = canonical_url(item.get('url', ''))
+            item['title'] = strip_markup(item.get('title', ''))
+            item['snippet'] = strip_markup(item.get('snippet', ''))
+            signature = shingles(f"{item['title']} {item['snippet']}")
+
+            duplicate = by_url.get(item['url']) if item['url'] not in ("", "N/A") else None
+            if duplicate is None and signature:
+                for index, (other, other_signature) in enumerate(kept):
+                    overlap = len(signature & other_signature) / len(signature | other_signature)
+                    if overlap >= self.similarity:
+                        duplicate = index
+                        break
+            if duplicate is not None:
+                self.duplicates += 1
+                other, other_signature = kept[duplicate]
+                if len(item['snippet']) > len(other['snippet']):
+                    kept[duplicate] = ({**other, 'snippet': item['snippet']}, other_signature | signature)
+                continue
+            by_url[item['url']] = len(kept)
+            kept.append((item, signature))
+
+        for item, _ in kept:
+            item['snippet'] = self._trim(item['snippet'])
+        return [item for item, _ in kept]
+
+    def stats(self):
+        return {
+            "items_in": self.items_in,
+            "duplicates_removed": self.duplicates,
+            "snippet_tokens_trimmed": self.tokens_trimmed
+        }
@@ -0,0 +1,370 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional
+import feedparser
+from lxml import html as lxml_html
+from .concurrency import run_blocking
+from .text_index import TextIndex, tokenize
+from .tracing import traced
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+# legislation.gov.uk identifiers: /ukpga/2025/26, /id/uksi/2023/123, ...
+_LEGISLATION_PATH = re.compile(r"legislation\.gov\.uk/(?:id/)?(?P<type>[a-z]+)/(?P<year>\d{4})/(?P<number>\d+)")
+_QUERY_CITATION = re.compile(r"""
+    \b(?P<p_type>[a-z]{2,5})/(?P<p_year>\d{4})/(?P<p_number>\d+)\b
+  | \b(?:s\.?\s?i\.?|ssi|wsi|sr)\s*(?P<si_year>\d{4})\s*/\s*(?P<si_number>\d+)
+  | \b(?P<c_year>\d{4})\s*c(?:hapter)?\.?\s*(?P<c_number>\d+)\b
+  | \b(?P<n_year>\d{4})\s*/\s*(?P<n_number>\d+)\b
+""", re.I | re.X)
+
+
+def citation_keys(url: str) -> List[str]:
+    """Lookup keys for a legislation URL: 'ukpga/2025/26' and the bare '2025/26'"""
+    match = _LEGISLATION_PATH.search(url or "")
+    if not match:
+        return []
+    year, number = match.group('year'), match.group('number')
+    return [f"{match.group('type')}/{year}/{number}", f"{year}/{number}"]
+
+
+def query_citations(query: str) -> List[str]:
+    """Citation keys written in a query ('SI 2023/123', '2025 c. 26', 'ukpga/2025/26', ...)"""
+    keys = []
+    for match in _QUERY_CITATION.finditer(query or ""):
+        if match.group('p_type'):
+            keys.append(f"{match.group('p_type').lower()}/{match.group('p_year')}/{match.group('p_number')}")
+        else:
+            year = match.group('si_year') or match.group('c_year') or match.group('n_year')
+            number = match.group('si_number') or match.group('c_number') or match.group('n_number')
+            keys.append(f"{year}/{number}")
+    return list(dict.fromkeys(keys))
+
+
+class LegislationCorpus:
+    """
+    Local mirror of legislation announced in the legislation.gov.uk feeds.
+
+    Full-text documents are compressed one by one (zstd, or zlib without
+    zstandard) and appended to `documents.seg`; `index.jsonl` records each
+    document's id, updated timestamp, title and byte range in the segment.
+    The newest index line for an id wins, so an updated document is just
+    appended again. Lookups by citation or title are answered from the index
+    in memory and one read of the segment.
+
+    `sync` walks each feed from its newest page back through older pages,
+    fetching only documents whose id is new or whose updated timestamp moved.
+    Progress (feed validators and the next older page to visit) is saved in
+    `sync_state.json` after every page, and the index is the record of what
+    has been downloaded, so an interrupted sync resumes where it stopped.
+    Only one process syncs at a time; others pick up new index lines on
+    their next lookup.
+    """
+
+    def __init__(self, directory: str, document_suffix: str = "/data.htm", max_pages_per_sync: int = 10,
+                 min_title_coverage: float = 0.75, snippet_chars: int = 1500):
+        self.directory = directory
+        self.document_suffix = document_suffix
+        self.max_pages_per_sync = max_pages_per_sync
+        self.min_title_coverage = min_title_coverage
+        self.snippet_chars = snippet_chars
+        self.segment_path = os.path.join(directory, "documents.seg")
+        self.index_path = os.path.join(directory, "index.jsonl")
+        self.state_path = os.path.join(directory, "sync_state.json")
+        self.lock_path = os.path.join(directory, "sync.lock")
+        self.docs: Dict[str, Dict] = {}  # document id -> newest index entry
+        self.citations = defaultdict(set)  # citation key -> document ids
+        self.titles = TextIndex()  # title search, keyed by document id
+        self._index_bytes = 0  # how much of index.jsonl has been loaded
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # appends come from several executor threads
+        self._compressor = zstd.ZstdCompressor(level=9) if zstd is not None else None
+        self._task = None
+        os.makedirs(directory, exist_ok=True)
+        self.refresh_index()
+
+    def __len__(self):
+        return len(self.docs)
+
+    # -- index -----------------------------------------------------------
+
+    def refresh_index(self):
+        """Load index lines appended since the last call (by this or another process)"""
+        try:
+            size = os.path.getsize(self.index_path)
+        except OSError:
+            return
+        with self._lock:
+            if size <= self._index_bytes:
+                return
+            with open(self.index_path, "rb") as f:
+                f.seek(self._index_bytes)
+                data = f.read(size - self._index_bytes)
+            # A line still being written has no newline yet; it is read next time
+            complete = data[:data.rfind(b"\n") + 1]
+            self._index_bytes += len(complete)
+            for line in complete.splitlines():
+                if line.strip():
+                    self._add_entry(json.loads(line))
+
+    def _add_entry(self, entry: Dict):
+        self.docs[entry['id']] = entry
+        for key in citation_keys(entry['url']):
+            self.citations[key].add(entry['id'])
+        self.titles.add({'id': entry['id'], 'title': entry['title'], 'snippet': '', 'url': entry['url']}, key=entry['id'])
+
+    def _indexed_end(self) -> int:
+        return max((entry['offset'] + entry['length'] for entry in self.docs.values()), default=0)
+
+    def _recover(self):
+        """Cut off a segment record whose index line was never written (a sync that died mid-append)"""
+        self.refresh_index()
+        end = self._indexed_end()
+        if os.path.exists(self.segment_path) and os.path.getsize(self.segment_path) > end:
+            with open(self.segment_path, "r+b") as f:
+                f.truncate(end)
+
+    # -- documents -------------------------------------------------------
+
+    def _append(self, document: Dict):
+        data = json.dumps(document).encode('utf-8')
+        with self._write_lock:
+            if self._compressor is not None:
+                codec, payload = 'zstd', self._compressor.compress(data)
+            else:
+                codec, payload = 'zlib', zlib.compress(data, 6)
+            with open(self.segment_path, "ab") as f:
+                offset = f.tell()
+                f.write(payload)
+            self._write_index_line({
+                'id': document['id'],
+                'title': document['title'],
+                'url': document['url'],
+                'updated': document['updated'],
+                'feed': document['feed'],
+                'offset': offset,
+                'length': len(payload),
+                'codec': codec
+            })
+        self.refresh_index()
+
+    def _write_index_line(self, entry: Dict):
+        # The segment bytes are written first, so an index line always points at a complete record
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def read(self, doc_id: str) -> Optional[Dict]:
+        """The stored document (id, title, url, updated, feed, text)"""
+        entry = self.docs.get(doc_id)
+        if entry is None:
+            return None
+        with open(self.segment_path, "rb") as f:
+            f.seek(entry['offset'])
+            payload = f.read(entry['length'])
+        if entry['codec'] == 'zstd':
+            data = zstd.ZstdDecompressor().decompress(payload)
+        else:
+            data = zlib.decompress(payload)
+        return json.loads(data)
+
+    def _context_item(self, doc_id: str) -> Optional[Dict]:
+        document = self.read(doc_id)
+        if document is None:
+            return None
+        keys = citation_keys(document['url'])
+        return {
+            "site": "legislation.gov.uk (local corpus)",
+            "title": document['title'],
+            "url": document['url'],
+            "snippet": document['text'][:self.snippet_chars],
+            "citation": keys[0] if keys else None,
+            "updated": document['updated']
+        }
+
+    @traced("corpus.lookup")
+    def lookup(self, query: str, limit: int = 3) -> List[Dict]:
+        """
+        Documents cited in the query, or else whose title the query mostly
+        contains (at least `min_title_coverage` of the title's terms).
+        """
+        self.refresh_index()
+        with self._lock:
+            ids = []
+            for key in query_citations(query):
+                ids.extend(sorted(self.citations.get(key, ())))
+            if not ids:
+                query_terms = set(tokenize(query))
+                for score, coverage, item in self.titles.search(query, limit=limit * 4):
+                    title_terms = set(tokenize(item['title']))
+                    if title_terms and len(title_terms & query_terms) / len(title_terms) >= self.min_title_coverage:
+                        ids.append(item['id'])
+            ids = list(dict.fromkeys(ids))[:limit]
+        return [item for item in map(self._context_item, ids) if item is not None]
+
+    # -- sync ------------------------------------------------------------
+
+    def _load_state(self) -> Dict:
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state: Dict):
+        with open(self.state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def _acquire_writer(self):
+        """An exclusive lock file held while syncing; None if another process is syncing"""
+        handle = open(self.lock_path, "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                return None
+        return handle
+
+    def is_current(self, entry_id: str, updated: str) -> bool:
+        known = self.docs.get(entry_id)
+        return known is not None and (not updated or known['updated'] >= updated)
+
+    @staticmethod
+    def _parse_feed(content):
+        feed = feedparser.parse(content)
+        next_page = next((link.get('href') for link in feed.feed.get('links', []) if link.get('rel') == 'next'), None)
+        entries = [
+            {
+                'id': entry.get('id') or entry.get('link'),
+                'title': entry.get('title', ''),
+                'url': entry.get('link', ''),
+                'updated': entry.get('updated', '')
+            }
+            for entry in feed.entries
+            if entry.get('link')
+        ]
+        return entries, next_page
+
+    @staticmethod
+    def _document_text(content: bytes) -> str:
+        tree = lxml_html.fromstring(content)
+        for element in tree.xpath('//script|//style|//nav|//header|//footer'):
+            element.drop_tree()
+        return re.sub(r"\s+", " ", " ".join(tree.itertext())).strip()
+
+    async def _fetch_document(self, http, feed_key: str, entry: Dict, limit: asyncio.Semaphore):
+        url = entry['url'].rstrip('/') + self.document_suffix
+        async with limit:
+            try:
+                response = await http.get(url)
+                response.raise_for_status()
+                text = await run_blocking(self._document_text, response.content)
+            except Exception as e:
+                # Not indexed, so the next sync tries it again
+                print(f"Corpus could not fetch {url}: {e}")
+                return False
+        await run_blocking(self._append, {**entry, 'feed': feed_key, 'text': text})
+        return True
+
+    async def _sync_page(self, http, feed_key: str, url: str, feed_state: Dict, limit, conditional: bool):
+        """Fetch one feed page and every new or updated document on it; returns (fetched, next page)"""
+        headers = {}
+        if conditional and feed_state.get('etag'):
+            headers['If-None-Match'] = feed_state['etag']
+        if conditional and feed_state.get('last_modified'):
+            headers['If-Modified-Since'] = feed_state['last_modified']
+        response = await http.get(url, headers=headers)
+        if response.status_code == 304:
+            return 0, None
+        response.raise_for_status()
+        entries, next_page = await run_blocking(self._parse_feed, response.content)
+        pending = [entry for entry in entries if not self.is_current(entry['id'], entry['updated'])]
+        results = await asyncio.gather(*(self._fetch_document(http, feed_key, entry, limit) for entry in pending))
+        if conditional and all(results):
+            feed_state['etag'] = response.headers.get('ETag')
+            feed_state['last_modified'] = response.headers.get('Last-Modified')
+        return sum(results), next_page
+
+    @traced("corpus.sync")
+    async def sync(self, http, feeds: Dict[str, dict], concurrency: int = 4) -> Dict:
+        """
+        Bring the mirror up to date with the feeds' newest pages, then continue
+        each feed's backfill of older pages (at most `max_pages_per_sync` pages
+        per feed per call). Returns the number of documents fetched per feed.
+        """
+        lock = await run_blocking(self._acquire_writer)
+        if lock is None:
+            print("Corpus sync already running in another process")
+            return {}
+        try:
+            await run_blocking(self._recover)
+            state = self._load_state()
+            limit = asyncio.Semaphore(concurrency)
+            fetched = {}
+            for feed_key, feed_config in feeds.items():
+                feed_state = state.setdefault(feed_key, {'backfill': None, 'complete': False})
+                fetched[feed_key] = 0
+                try:
+                    count, next_page = await self._sync_page(
+                        http, feed_key, feed_config['url'], feed_state, limit, conditional=True
+                    )
+                    fetched[feed_key] += count
+                    if feed_state['backfill'] is None and not feed_state['complete']:
+                        feed_state['backfill'] = next_page
+                        feed_state['complete'] = next_page is None
+                    self._save_state(state)
+
+                    pages = 0
+                    while feed_state['backfill'] and pages < self.max_pages_per_sync:
+                        count, next_page = await self._sync_page(
+                            http, feed_key, feed_state['backfill'], feed_state, limit, conditional=False
+                        )
+                        fetched[feed_key] += count
+                        feed_state['backfill'] = next_page
+                        feed_state['complete'] = next_page is None
+                        pages += 1
+                        self._save_state(state)
+                except Exception as e:
+                    print(f"Corpus sync of {feed_key} stopped: {e}")
+            return fetched
+        finally:
+            lock.close()
+
+    async def _run(self, http, feeds, interval):
+        while True:
+            try:
+                fetched = await self.sync(http, feeds)
+                if any(fetched.values()):
+                    print(f"Corpus sync fetched {sum(fetched.values())} documents ({len(self)} held)")
+            except Exception as e:
+                print(f"Corpus sync failed: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self, http, feeds: Dict[str, dict], interval: float = 3600):
+        """Sync in the background on the running loop every `interval` seconds"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(http, feeds, interval))
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,195 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from .text_index import tokenize
+from .tracing import traced
+
+
+def _item_key(item: Dict) -> str:
+    return item.get('url') or item.get('title', '')
+
+
+def _item_text(item: Dict) -> str:
+    return f"{item.get('title', '')}\n{item.get('snippet', '')}"[:2000]
+
+
+class OpenAIEmbedder:
+    """Batched embedding calls with a small LRU cache for repeated texts (e.g. queries)"""
+
+    def __init__(self, async_client, model: str = "text-embedding-3-small", batch_size: int = 64, cache_size: int = 2048):
+        self.async_client = async_client
+        self.model = model
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # text -> np.ndarray
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts in batches, returning an (n, dim) float32 matrix"""
+        missing = [text for text in dict.fromkeys(texts) if text not in self._cache]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            response = await self.async_client.embeddings.create(model=self.model, input=batch)
+            for text, data in zip(batch, sorted(response.data, key=lambda d: d.index)):
+                self._cache[text] = np.asarray(data.embedding, dtype=np.float32)
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        vectors = []
+        for text in texts:
+            vector = self._cache[text]
+            self._cache.move_to_end(text)
+            vectors.append(vector)
+        return np.vstack(vectors)
+
+
+class EmbeddingIndex:
+    """
+    Dense vector index over documents keyed by URL.
+
+    Vectors are L2-normalised rows of one matrix, so cosine similarity for a
+    query is a single matrix-vector product. With `quantize=True` rows are
+    stored as int8 with a per-row scale, cutting memory by 4x.
+
+    The matrix is a preallocated buffer that grows geometrically, so inserts
+    only write their own rows. An item whose text changes gets its row
+    re-embedded in place.
+    """
+
+    def __init__(self, embedder, quantize: bool = False, max_items: int = 20000):
+        self.embedder = embedder
+        self.quantize = quantize
+        self.max_items = max_items
+        self.keys = {}  # key -> row
+        self.row_keys: List[str] = []
+        self.fingerprints = {}  # key -> hash of the embedded text
+        self._matrix: Optional[np.ndarray] = None  # capacity x dim; rows past len(self) are unused
+        self._scales: Optional[np.ndarray] = None
+
+    def __len__(self):
+        return len(self.row_keys)
+
+    @staticmethod
+    def _normalise(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _reserve(self, rows: int, dim: int):
+        """Make room for `rows` rows, at least doubling the buffer when it has to grow"""
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        capacity = max(rows, min(max(2 * capacity, 256), self.max_items + self.max_items // 10))
+        matrix = np.empty((capacity, dim), dtype=np.int8 if self.quantize else np.float32)
+        scales = np.empty(capacity, dtype=np.float32) if self.quantize else None
+        count = len(self.row_keys)
+        if self._matrix is not None:
+            matrix[:count] = self._matrix[:count]
+            if self.quantize:
+                scales[:count] = self._scales[:count]
+        self._matrix, self._scales = matrix, scales
+
+    def _evict(self):
+        """Drop the oldest tenth in one go rather than shifting the matrix per insert"""
+        count = len(self.row_keys)
+        drop = max(count - self.max_items, self.max_items // 10)
+        self._matrix[:count - drop] = self._matrix[drop:count]
+        if self._scales is not None:
+            self._scales[:count - drop] = self._scales[drop:count]
+        for key in self.row_keys[:drop]:
+            del self.fingerprints[key]
+        self.row_keys = self.row_keys[drop:]
+        self.keys = {key: row for row, key in enumerate(self.row_keys)}
+
+    def _append(self, keys: List[str], vectors: np.ndarray, fingerprints: List[int] = None):
+        """Write vectors for keys: existing keys are overwritten in place, new ones appended"""
+        vectors = self._normalise(vectors.astype(np.float32))
+        if self.quantize:
+            scales = np.abs(vectors).max(axis=1)
+            scales[scales == 0] = 1.0
+            rows = np.round(vectors / scales[:, None] * 127).astype(np.int8)
+            scales = (scales / 127).astype(np.float32)
+        else:
+            rows, scales = vectors, None
+        new_keys = [key for key in keys if key not in self.keys]
+        self._reserve(len(self.row_keys) + len(new_keys), rows.shape[1])
+        for key in new_keys:
+            self.keys[key] = len(self.row_keys)
+            self.row_keys.append(key)
+        positions = np.array([self.keys[key] for key in keys], dtype=np.int64)
+        self._matrix[positions] = rows
+        if scales is not None:
+            self._scales[positions] = scales
+        for key, fingerprint in zip(keys, fingerprints or [None] * len(keys)):
+            self.fingerprints[key] = fingerprint
+
+        if len(self.row_keys) > self.max_items:
+            self._evict()
+
+    async def add_items(self, items: List[Dict]):
+        """Embed (in batches) and index items that are new or whose text has changed"""
+        changed = {}
+        for item in items:
+            key = _item_key(item)
+            if not key:
+                continue
+            fingerprint = hash(_item_text(item))
+            if self.fingerprints.get(key, None) != fingerprint or key not in self.keys:
+                changed[key] = (item, fingerprint)
+        if changed:
+            vectors = await self.embedder.embed([_item_text(item) for item, _ in changed.values()])
+            self._append(list(changed), vectors, [fingerprint for _, fingerprint in changed.values()])
+
+    def similarities(self, query_vector: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        query_vector = self._normalise(query_vector.reshape(1, -1).astype(np.float32))[0]
+        matrix = self._matrix[rows]
+        if self.quantize:
+            return (matrix.astype(np.float32) @ query_vector) * self._scales[rows]
+        return matrix @ query_vector
+
+
+def _lexical_scores(query: str, items: List[Dict]) -> List[float]:
+    query_terms = set(tokenize(query))
+    if not query_terms:
+        return [0.0] * len(items)
+    return [len(query_terms & set(tokenize(_item_text(item)))) / len(query_terms) for item in items]
+
+
+class SemanticReranker:
+    """
+    Picks the top-k context items for the prompt by embedding similarity to the query.
+
+    Items are embedded once and kept in the EmbeddingIndex. Ordering is
+    deterministic (score, then URL). If embeddings are unavailable it falls
+    back to query-term overlap, so context is still ordered by relevance.
+    """
+
+    def __init__(self, index: EmbeddingIndex, min_score: float = 0.0):
+        self.index = index
+        self.min_score = min_score
+
+    @staticmethod
+    def _order(items: List[Dict], scores, top_k: int) -> List[Dict]:
+        ranked = sorted(
+            zip(items, scores),
+            key=lambda pair: (-round(float(pair[1]), 6), _item_key(pair[0]), pair[0].get('title', ''))
+        )
+        return [item for item, _ in ranked[:top_k]]
+
+    def rerank_lexical(self, query: str, items: List[Dict], top_k: int = 5) -> List[Dict]:
+        return self._order(items, _lexical_scores(query, items), top_k)
+
+    @traced("chatbot.rerank")
+    async def rerank(self, query: str, items: List[Dict], top_k: int = 5) -> List[Dict]:
+        if not items:
+            return []
+        try:
+            await self.index.add_items(items)
+            query_vector = (await self.index.embedder.embed([query]))[0]
+            keyed = [item for item in items if _item_key(item) in self.index.keys]
+            rows = np.array([self.index.keys[_item_key(item)] for item in keyed], dtype=np.int64)
+            scores = self.index.similarities(query_vector, rows)
+        except Exception as e:
+            print(f"Semantic rerank unavailable, using lexical ordering: {e}")
+            return self.rerank_lexical(query, items, top_k)
+        keep = [(item, score) for item, score in zip(keyed, scores) if score >= self.min_score]
+        return self._order([item for item, _ in keep], [score for _, score in keep], top_k)
@@ -0,0 +1,259 @@
+import re
+from typing import Dict, List, Optional
+from lxml import etree
+
+from .concurrency import run_blocking
+
+_COMPOUND_RE = re.compile(r"""
+    (?P<tag>[a-zA-Z][\w-]*|\*)
+  | \.(?P<cls>[\w-]+)
+  | \#(?P<id>[\w-]+)
+  | \[(?P<attr>[\w-]+)(?:=["']?(?P<value>[^"'\]]*)["']?)?\]
+""", re.X)
+
+
+class _Compound:
+    """One simple-selector sequence such as `div.search-result#top[href]`"""
+
+    __slots__ = ("tag", "classes", "id", "attrs")
+
+    def __init__(self, text: str):
+        self.tag = None
+        self.classes = []
+        self.id = None
+        self.attrs = []
+        position = 0
+        for match in _COMPOUND_RE.finditer(text):
+            if match.start() != position:
+                raise ValueError(f"Unsupported selector syntax: {text!r}")
+            position = match.end()
+            if match.group("tag"):
+                self.tag = None if match.group("tag") == "*" else match.group("tag").lower()
+            elif match.group("cls"):
+                self.classes.append(match.group("cls"))
+            elif match.group("id"):
+                self.id = match.group("id")
+            else:
+                self.attrs.append((match.group("attr").lower(), match.group("value")))
+        if position != len(text):
+            raise ValueError(f"Unsupported selector syntax: {text!r}")
+
+    def matches(self, el) -> bool:
+        if self.tag is not None and el.tag != self.tag:
+            return False
+        if self.id is not None and el.get("id") != self.id:
+            return False
+        if self.classes:
+            classes = (el.get("class") or "").split()
+            if not all(cls in classes for cls in self.classes):
+                return False
+        for name, value in self.attrs:
+            actual = el.get(name)
+            if actual is None or (value is not None and actual != value):
+                return False
+        return True
+
+
+class _Complex:
+    """Compounds joined by descendant (' ') or child ('>') combinators, matched right to left"""
+
+    def __init__(self, text: str):
+        steps = []  # (combinator joining this compound to the one on its left, compound)
+        combinator = None
+        for token in re.split(r"\s*(>)\s*|\s+", text.strip()):
+            if not token:
+                continue
+            if token == ">":
+                combinator = ">"
+                continue
+            steps.append((combinator, _Compound(token)))
+            combinator = " "
+        self.steps = steps[::-1]
+
+    def matches(self, el) -> bool:
+        return self._match_from(el, 0)
+
+    def _match_from(self, el, index: int) -> bool:
+        combinator, compound = self.steps[index]
+        if not compound.matches(el):
+            return False
+        if index + 1 == len(self.steps):
+            return True
+        parent = el.getparent()
+        if combinator == ">":
+            return parent is not None and self._match_from(parent, index + 1)
+        while parent is not None:
+            if self._match_from(parent, index + 1):
+                return True
+            parent = parent.getparent()
+        return False
+
+
+class CompiledSelector:
+    """
+    A CSS selector compiled once into matchers that test a single element.
+
+    Supports the subset used by the source configs: tag, `.class`, `#id`,
+    `[attr]` / `[attr=value]`, descendant and child combinators, and `,`
+    groups. Because it only needs the element and its ancestors it can be
+    evaluated while the document is still being parsed.
+    """
+
+    def __init__(self, css: str):
+        self.css = css
+        self.groups = [_Complex(group) for group in css.split(",") if group.strip()]
+
+    def matches(self, el) -> bool:
+        return any(group.matches(el) for group in self.groups)
+
+
+def compile_selector(css: str) -> CompiledSelector:
+    return CompiledSelector(css)
+
+
+def _resolve_link(el) -> Optional[str]:
+    """href of the element itself, else of its first link descendant, else of an enclosing link"""
+    href = el.get("href")
+    if href:
+        return href
+    anchor = el.find(".//a[@href]")
+    if anchor is not None:
+        return anchor.get("href")
+    parent = el.getparent()
+    while parent is not None:
+        if parent.tag == "a" and parent.get("href"):
+            return parent.get("href")
+        parent = parent.getparent()
+    return None
+
+
+_NON_TEXT_TAGS = frozenset(("script", "style", "template"))
+
+
+def _element_text(el) -> str:
+    """Same result as BeautifulSoup's get_text(strip=True): comments and scripts are skipped"""
+    parts = []
+
+    def walk(node):
+        if node.text:
+            parts.append(node.text.strip())
+        for child in node:
+            if isinstance(child.tag, str) and child.tag not in _NON_TEXT_TAGS:
+                walk(child)
+            if child.tail:
+                parts.append(child.tail.strip())
+
+    walk(el)
+    return "".join(parts)
+
+
+class StreamingExtractor:
+    """
+    Incremental extractor fed raw response bytes.
+
+    `selector` is a CompiledSelector, or a dict of field name -> CompiledSelector
+    in which case each result records the first field that matched. Matches
+    are recorded in document order when their start tag is parsed and
+    completed at their end tag. Once the first `limit` matches are complete
+    `done` becomes True and the caller can stop reading the body. Finished
+    subtrees are discarded as parsing goes so memory stays flat.
+    """
+
+    def __init__(self, selector, limit: int = 3, encoding: Optional[str] = None):
+        self.fields = selector if isinstance(selector, dict) else {None: selector}
+        self.limit = limit
+        self._parser = etree.HTMLPullParser(events=("start", "end"), encoding=encoding)
+        self._matches = []  # [field, result dict or None] in document order
+        self._open = {}  # element -> index in _matches, while its end tag is pending
+        self.done = False
+
+    def _match_field(self, el):
+        for field, selector in self.fields.items():
+            if selector.matches(el):
+                return field, True
+        return None, False
+
+    def _handle(self, event: str, el):
+        if event == "start":
+            if len(self._matches) < self.limit and isinstance(el.tag, str):
+                field, matched = self._match_field(el)
+                if matched:
+                    self._open[el] = len(self._matches)
+                    self._matches.append([field, None])
+            return
+
+        index = self._open.pop(el, None)
+        if index is not None:
+            field = self._matches[index][0]
+            self._matches[index][1] = {
+                "text": _element_text(el),
+                "href": el.get("href"),
+                "link": _resolve_link(el),
+                "tag": el.tag,
+                "field": field
+            }
+            if len(self._matches) >= self.limit and not self._open:
+                self.done = True
+        if not self._open:
+            # Nothing pending needs this subtree any more
+            el.clear(keep_tail=False)
+            parent = el.getparent()
+            while parent is not None and el.getprevious() is not None:
+                del parent[0]
+
+    def feed(self, chunk: bytes) -> bool:
+        """Parse another chunk; returns True once enough matches are complete"""
+        if self.done:
+            return True
+        self._parser.feed(chunk)
+        for event, el in self._parser.read_events():
+            self._handle(event, el)
+            if self.done:
+                break
+        return self.done
+
+    def close(self) -> List[Dict]:
+        if not self.done:
+            try:
+                self._parser.close()
+            except etree.XMLSyntaxError:
+                pass
+            for event, el in self._parser.read_events():
+                self._handle(event, el)
+        return self.results
+
+    @property
+    def results(self) -> List[Dict]:
+        return [result for _, result in self._matches if result is not None]
+
+
+async def extract_from_stream(chunks, selector, limit: int = 3, encoding: Optional[str] = None,
+                              batch_size: int = 16384) -> List[Dict]:
+    """
+    Extract up to `limit` matches from an async byte stream, stopping early once found.
+
+    Parsing runs on the blocking executor, on batches of at least
+    `batch_size` bytes so small network chunks don't each pay for a thread hop.
+    """
+    extractor = StreamingExtractor(selector, limit, encoding)
+    pending = []
+    size = 0
+    async for chunk in chunks:
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= batch_size:
+            batch, pending, size = b"".join(pending), [], 0
+            if await run_blocking(extractor.feed, batch):
+                break
+    if pending:
+        await run_blocking(extractor.feed, b"".join(pending))
+    return await run_blocking(extractor.close)
+
+
+def extract(content: bytes, selector, limit: int = 3, chunk_size: int = 16384) -> List[Dict]:
+    """Extract from an in-memory body, still stopping as soon as enough matches are found"""
+    extractor = StreamingExtractor(selector, limit)
+    for start in range(0, len(content), chunk_size):
+        if extractor.feed(content[start:start + chunk_size]):
+            break
+    return extractor.close()
@@ -0,0 +1,201 @@
+import asyncio
+import time
+import feedparser
+import httpx
+from .concurrency import run_blocking
+from .tracing import traced
+
+
+class FeedStore:
+    """
+    In-process store of parsed legislation feed entries.
+
+    A background task refreshes each feed once its TTL has expired, using
+    conditional requests (ETag / Last-Modified) so unchanged feeds cost a 304.
+    Chat requests read snapshots from memory without any network I/O.
+
+    With a `shared` SharedCache, each feed's entries and validators are
+    written there after a fetch, and a stale feed first adopts a fresher copy
+    stored by another worker, so N workers don't fetch every feed N times.
+    """
+
+    def __init__(self, feeds: dict, http, default_ttl=1800, check_interval=60, max_entries_per_feed=20,
+                 guards: dict = None, shared=None):
+        self.feeds = feeds
+        self.http = http
+        self.guards = guards or {}  # feed_key -> SourceGuard
+        self.shared = shared
+        self.default_ttl = default_ttl
+        self.check_interval = check_interval
+        self.max_entries_per_feed = max_entries_per_feed
+        self.version = 0  # bumped whenever the content of any feed changes
+        self.versions = {}  # feed_key -> bumped whenever that feed's content changes
+        self.listeners = []  # callables (feed_key, items) run when a feed's content changes
+        self._state = {
+            feed_key: {
+                'items': [],
+                'etag': None,
+                'last_modified': None,
+                'fetched_at': 0.0
+            }
+            for feed_key in feeds
+        }
+        self._inflight = {}  # feed_key -> asyncio.Task
+        self._task = None
+
+    def ttl(self, feed_key):
+        return self.feeds[feed_key].get('ttl', self.default_ttl)
+
+    def is_stale(self, feed_key, now=None):
+        now = now if now is not None else time.monotonic()
+        fetched_at = self._state[feed_key]['fetched_at']
+        return not fetched_at or now - fetched_at >= self.ttl(feed_key)
+
+    @property
+    def loaded(self):
+        """True once every feed has been attempted at least once"""
+        return all(state['fetched_at'] for state in self._state.values())
+
+    @traced("feed_store.parse", feed="{feed_key}")
+    def _parse_entries(self, feed_key, content):
+        feed_config = self.feeds[feed_key]
+        feed = feedparser.parse(content)
+        items = []
+        for entry in feed.entries[:self.max_entries_per_feed]:
+            items.append({
+                "site": f"legislation.gov.uk ({feed_config['description']})",
+                "title": entry.title,
+                "url": entry.link,
+                "snippet": entry.summary if hasattr(entry, 'summary') and entry.summary else entry.title,
+                "feed_type": feed_key,
+                "description": feed_config['description']
+            })
+        return items
+
+    def _set_items(self, feed_key, items):
+        state = self._state[feed_key]
+        changed = items != state['items']
+        state['items'] = items
+        if changed:
+            self.version += 1
+            self.versions[feed_key] = self.versions.get(feed_key, 0) + 1
+            for listener in self.listeners:
+                listener(feed_key, items)
+        return changed
+
+    async def _adopt_shared(self, feed_key):
+        """Take another worker's copy of the feed if it is still fresh; None if there isn't one"""
+        row = await self.shared.get("feeds", feed_key)
+        if row is None:
+            return None
+        saved, stored_at = row
+        age = time.time() - stored_at
+        if age >= self.ttl(feed_key):
+            return None
+        state = self._state[feed_key]
+        state['etag'] = saved['etag']
+        state['last_modified'] = saved['last_modified']
+        state['fetched_at'] = max(time.monotonic() - age, 1e-6)
+        return self._set_items(feed_key, saved['items'])
+
+    async def _save_shared(self, feed_key):
+        state = self._state[feed_key]
+        await self.shared.set("feeds", feed_key, {
+            'items': state['items'],
+            'etag': state['etag'],
+            'last_modified': state['last_modified']
+        })
+
+    @traced("feed_store.refresh", feed="{feed_key}")
+    async def _refresh_feed(self, feed_key):
+        state = self._state[feed_key]
+        if self.shared is not None:
+            adopted = await self._adopt_shared(feed_key)
+            if adopted is not None:
+                return adopted
+        headers = {}
+        if state['etag']:
+            headers['If-None-Match'] = state['etag']
+        if state['last_modified']:
+            headers['If-Modified-Since'] = state['last_modified']
+
+        async def fetch(timeout=httpx.USE_CLIENT_DEFAULT):
+            async with self.http.budget():
+                response = await self.http.get(self.feeds[feed_key]['url'], headers=headers, timeout=timeout)
+            if response.status_code != 304:
+                response.raise_for_status()
+            return response
+
+        try:
+            guard = self.guards.get(feed_key)
+            response = await (guard.call(fetch) if guard else fetch())
+            if response.status_code == 304:
+                changed = False
+            else:
+                items = await run_blocking(self._parse_entries, feed_key, response.content)
+                state['etag'] = response.headers.get('ETag')
+                state['last_modified'] = response.headers.get('Last-Modified')
+                changed = self._set_items(feed_key, items)
+            if self.shared is not None:
+                await self._save_shared(feed_key)
+            return changed
+        except Exception as e:
+            print(f"Failed to fetch {feed_key} feed: {e}")
+            return False
+        finally:
+            # Failed fetches also wait for the TTL so a dead feed isn't hammered
+            state['fetched_at'] = time.monotonic()
+
+    async def refresh_feed(self, feed_key, force=False):
+        """Refresh one feed if stale; concurrent callers share one fetch"""
+        if not force and not self.is_stale(feed_key):
+            return False
+        task = self._inflight.get(feed_key)
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._refresh_feed(feed_key))
+            self._inflight[feed_key] = task
+        return await task
+
+    async def refresh(self, force=False):
+        """Refresh every stale feed concurrently"""
+        await asyncio.gather(*(self.refresh_feed(feed_key, force) for feed_key in self.feeds))
+
+    async def prewarm(self, timeout=10.0):
+        """Load every feed before serving (from the shared cache when another worker has them), up to `timeout`"""
+        done, pending = await asyncio.wait([asyncio.ensure_future(self.refresh())], timeout=timeout)
+        if pending:
+            print(f"Feed prewarm incomplete after {timeout}s, continuing in the background")
+
+    def entries(self, feed_key, limit=None):
+        items = self._state[feed_key]['items']
+        return [dict(item) for item in (items[:limit] if limit is not None else items)]
+
+    def snapshot(self, limit_per_feed=2, feed_keys=None):
+        """Current entries across feeds, read from memory only"""
+        all_items = []
+        for feed_key in feed_keys or self.feeds:
+            all_items.extend(self.entries(feed_key, limit_per_feed))
+        return all_items
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Legislation feed refresh failed: {e}")
+            await asyncio.sleep(self.check_interval)
+
+    def start(self):
+        """Start the background refresh task on the running loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
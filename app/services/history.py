@@ -0,0 +1,142 @@
+import asyncio
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+@lru_cache(maxsize=4)
+def _get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads its BPE files on first use, which can fail offline
+        print(f"Tokenizer unavailable, estimating token counts: {e}")
+        return None
+
+
+def load_encoding(model: str = "gpt-4") -> None:
+    """Load the model's tokenizer now (it reads, or first downloads, its BPE file) so a chat doesn't wait on it"""
+    _get_encoding(model)
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """Token count with the model's tokenizer (rough 4 chars/token estimate without one)"""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-4") -> str:
+    """Cut text to at most max_tokens (roughly, without a tokenizer), marking the cut with '...'"""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * 4] + "..."
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]) + "..."
+
+
+class HistoryBuilder:
+    """
+    Fits conversation history to a token budget.
+
+    Walks from the newest message backwards and keeps whole messages while
+    they fit; a single over-long message is cut down rather than dropped.
+    """
+
+    def __init__(self, token_budget: int = 1500, max_messages: int = 20, model: str = "gpt-4"):
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self.model = model
+
+    def select(self, messages: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Split messages into (recent ones that fit the budget, older overflow)"""
+        if not messages:
+            return [], []
+        kept = []
+        used = 0
+        for index in range(len(messages) - 1, -1, -1):
+            msg = messages[index]
+            tokens = count_tokens(msg['content'], self.model)
+            if used + tokens > self.token_budget or len(kept) >= self.max_messages:
+                if not kept:
+                    # Keep a truncated version of the latest message rather than nothing
+                    kept.append({**msg, 'content': self.truncate(msg['content'], self.token_budget)})
+                    index -= 1
+                return list(reversed(kept)), messages[:index + 1]
+            kept.append(msg)
+            used += tokens
+        return list(reversed(kept)), []
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        return truncate_tokens(text, max_tokens, self.model)
+
+
+class ConversationMemory:
+    """
+    Budgeted history plus an incrementally updated rolling summary per session.
+
+    Each turn the newest messages that fit the budget go to the prompt
+    verbatim. Messages that fall out of the window are folded into the
+    session's stored summary by a background task after the reply is sent,
+    so only newly dropped messages are summarised and chat latency doesn't
+    grow with session length.
+    """
+
+    def __init__(self, summarise, builder: Optional[HistoryBuilder] = None, history_window: int = 40):
+        self.summarise = summarise  # async (previous_summary, messages) -> new summary
+        self.builder = builder or HistoryBuilder()
+        self.history_window = history_window
+        self._tasks = {}  # session_id -> asyncio.Task
+
+    async def load(self, session_manager, session) -> Tuple[Optional[str], List[Dict], List[Dict]]:
+        """Return (summary, budgeted history, overflow not yet summarised) for a session"""
+        if session is None:
+            return None, [], []
+        messages = await session_manager.get_history_messages(session.id, limit=self.history_window)
+        if session.summary_upto:
+            ids = [msg['id'] for msg in messages]
+            if session.summary_upto in ids:
+                messages = messages[ids.index(session.summary_upto) + 1:]
+        recent, overflow = self.builder.select(messages)
+        return session.summary, recent, overflow
+
+    def schedule_update(self, session_manager, session_id: str, summary: Optional[str], overflow: List[Dict]):
+        """Fold overflowed messages into the session summary in the background"""
+        if not overflow:
+            return None
+        running = self._tasks.get(session_id)
+        if running is not None and not running.done():
+            # The next turn will pick these messages up again
+            return running
+
+        async def update():
+            try:
+                new_summary = await self.summarise(summary, overflow)
+                if new_summary:
+                    await session_manager.update_session_summary(session_id, new_summary, overflow[-1]['id'])
+            except Exception as e:
+                print(f"Failed to update summary for session {session_id}: {e}")
+            finally:
+                self._tasks.pop(session_id, None)
+
+        task = asyncio.get_running_loop().create_task(update())
+        self._tasks[session_id] = task
+        return task
+
+    async def drain(self):
+        tasks = list(self._tasks.values())
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
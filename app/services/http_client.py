@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import weakref
+from contextlib import asynccontextmanager
+import httpx
+from .concurrency import is_speculative
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+class HttpClientPool:
+    """
+    Long-lived pooled HTTP client shared by all outbound retrieval calls.
+
+    One httpx.AsyncClient (keep-alive, HTTP/2 when available) and one global
+    concurrency semaphore are kept per event loop, so the server loop reuses
+    its connections across chat turns while the sync wrappers get their own.
+    Speculative work (see `concurrency.speculative`) also needs one of
+    `speculative_concurrency` slots from `budget()`, so it can never hold more
+    than that share of the outbound slots.
+    """
+
+    def __init__(self, max_connections=40, max_keepalive_connections=20,
+                 keepalive_expiry=30.0, max_concurrency=20, timeout=10.0, headers=None, transport=None,
+                 speculative_concurrency=3):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout)
+        self.max_concurrency = max_concurrency
+        self.speculative_concurrency = speculative_concurrency
+        self.headers = headers or DEFAULT_HEADERS
+        self.transport = transport  # e.g. a local stand-in for the upstream sites in benchmarks
+        self._clients = weakref.WeakKeyDictionary()  # loop -> httpx.AsyncClient
+        self._semaphores = weakref.WeakKeyDictionary()  # loop -> asyncio.Semaphore
+        self._speculative_semaphores = weakref.WeakKeyDictionary()  # loop -> asyncio.Semaphore
+        self._lock = threading.Lock()
+
+    def _build_client(self):
+        return httpx.AsyncClient(
+            headers=self.headers,
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=HTTP2_AVAILABLE,
+            follow_redirects=True,
+            transport=self.transport
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Client bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None or client.is_closed:
+                client = self._build_client()
+                self._clients[loop] = client
+            return client
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Global outbound concurrency limit for the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._semaphores[loop] = semaphore
+            return semaphore
+
+    @asynccontextmanager
+    async def budget(self):
+        """
+        Hold a speculative slot when called from speculative work, else nothing.
+        Callers take it before any per-source slot so waiting for it never
+        holds up real requests.
+        """
+        if not is_speculative():
+            yield
+            return
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._speculative_semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.speculative_concurrency)
+                self._speculative_semaphores[loop] = semaphore
+        async with semaphore:
+            yield
+
+    async def get(self, url, **kwargs) -> httpx.Response:
+        """GET under the global concurrency limit"""
+        async with self.semaphore:
+            return await self.client.get(url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, url, **kwargs):
+        """Streaming GET under the global concurrency limit; the body is read by the caller"""
+        async with self.semaphore:
+            async with self.client.stream("GET", url, **kwargs) as response:
+                yield response
+
+    async def aclose(self):
+        """Close the client bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.pop(loop, None)
+            self._semaphores.pop(loop, None)
+            self._speculative_semaphores.pop(loop, None)
+        if client is not None and not client.is_closed:
+            await client.aclose()
@@ -0,0 +1,142 @@
+import asyncio
+import re
+import time
+from typing import Awaitable, Callable, Optional
+
+GREETING = "greeting"
+THANKS = "thanks"
+FAREWELL = "farewell"
+SMALLTALK = "smalltalk"
+LEGAL = "legal"
+INTENTS = (GREETING, THANKS, FAREWELL, SMALLTALK, LEGAL)
+
+_NAME = r"(?: (?:there|lexley|zanger(?:ai)?|again|all|everyone))*"
+_RULES = [
+    (GREETING, re.compile(
+        rf"^(?:(?:hello|hi|hiya|hey|howdy|greetings|good (?:morning|afternoon|evening|day)){_NAME}"
+        r"(?: how are (?:you|u)(?: doing)?(?: today)?)?|how are (?:you|u)(?: doing)?(?: today)?)$"
+    )),
+    (THANKS, re.compile(
+        rf"^(?:(?:ok|okay|great|perfect|brilliant|lovely) )?(?:thanks|thank you|thank u|thx|cheers|ta)"
+        rf"(?: (?:so|very) much| a lot| again| for (?:your|the) help| for that)*{_NAME}$"
+    )),
+    (FAREWELL, re.compile(
+        rf"^(?:(?:ok|okay|thanks|thank you) )?(?:bye|goodbye|bye bye|see you|see ya|later|thats all|that is all|good night)"
+        rf"(?: for now| then)?{_NAME}$"
+    )),
+    (SMALLTALK, re.compile(
+        r"^(?:who are you|what are you|what is your name|whats your name|what can you do|how does this work"
+        r"|what do you do|are you (?:a )?(?:bot|robot|human|real|ai)|tell me a joke|lol|haha|test|testing)$"
+    )),
+]
+# Bare acknowledgements: small talk on their own, but in a conversation usually the
+# answer to a clarifying question ("Is it a periodic tenancy?" - "yes")
+_ACKNOWLEDGEMENT = re.compile(r"^(?:ok|okay|cool|nice|great|sure|yes|no|yep|nope|yeah|nah)$")
+
+# Terms that mark a message as a legal question whatever else it says
+LEGAL_TERMS = frozenset("""
+    act acts law laws legal legislation regulation regulations statute statutory section clause
+    court courts tribunal judge claim claims sue sued suing lawsuit case solicitor barrister lawyer
+    contract contracts agreement tenancy tenant tenants landlord landlords lease eviction evict evicted
+    notice deposit rent arrears possession mortgage employer employee employment dismissal dismissed
+    redundancy wages pay discrimination harassment divorce custody child maintenance will probate
+    inheritance police arrest arrested crime criminal offence fine fined debt bailiff bankruptcy
+    consumer refund faulty warranty visa immigration asylum benefits council planning liability
+    negligence injury compensation rights right appeal hmrc tax gdpr data copyright trademark
+""".split())
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def _normalise(text: str) -> str:
+    return _SPACES.sub(" ", _NON_WORD.sub("", text.lower())).strip()
+
+
+class IntentClassifier:
+    """
+    Cheap, local routing of a message before any retrieval is done.
+
+    Keyword rules catch greetings, thanks, farewells and common small talk,
+    and any legal term makes the message a legal question. Short messages
+    that match neither are ambiguous: they go to the optional `model`
+    (an async callable returning one of INTENTS) and otherwise count as legal,
+    so a real question is never answered without its sources.
+    """
+
+    def __init__(self, model: Optional[Callable[[str], Awaitable[str]]] = None,
+                 model_timeout: float = 2.0, ambiguous_max_words: int = 8):
+        self.model = model
+        self.model_timeout = model_timeout
+        self.ambiguous_max_words = ambiguous_max_words
+        self.counts = {intent: 0 for intent in INTENTS}
+        self.decided_by = {"rules": 0, "model": 0, "default": 0}
+        self.model_errors = 0
+        self.model_seconds = 0.0
+
+    def _rules(self, query: str, follow_up: bool = False):
+        """(intent, decided) from keyword rules; undecided short messages are left to the model"""
+        text = _normalise(query)
+        if not text:
+            return SMALLTALK, True
+        if _ACKNOWLEDGEMENT.match(text):
+            return (LEGAL if follow_up else SMALLTALK), True
+        for intent, pattern in _RULES:
+            if pattern.match(text):
+                return intent, True
+        words = text.split()
+        if any(word in LEGAL_TERMS for word in words) or len(words) > self.ambiguous_max_words:
+            return LEGAL, True
+        return LEGAL, False
+
+    def _record(self, intent: str, decided_by: str) -> str:
+        self.counts[intent] += 1
+        self.decided_by[decided_by] += 1
+        return intent
+
+    def peek(self, query: str) -> str:
+        """Rules only, without counting the message (for speculative work on drafts)"""
+        return self._rules(query)[0]
+
+    def classify(self, query: str, follow_up: bool = False) -> str:
+        """Rules only (sync callers)"""
+        intent, decided = self._rules(query, follow_up)
+        return self._record(intent, "rules" if decided else "default")
+
+    async def aclassify(self, query: str, follow_up: bool = False) -> str:
+        """
+        Rules first, then the model for ambiguous messages. Ambiguous follow-ups
+        in a conversation (e.g. "what about in Scotland?") stay legal without
+        asking the model, which only sees the message itself, and so do bare
+        replies such as "yes" or "no" to a clarifying question.
+        """
+        intent, decided = self._rules(query, follow_up)
+        if decided:
+            return self._record(intent, "rules")
+        if self.model is None or follow_up:
+            return self._record(intent, "default")
+
+        started = time.monotonic()
+        try:
+            label = (await asyncio.wait_for(self.model(query), self.model_timeout) or "").strip(" .\n").lower()
+        except Exception as e:
+            print(f"Intent model unavailable, treating message as legal: {e}")
+            self.model_errors += 1
+            return self._record(LEGAL, "default")
+        finally:
+            self.model_seconds += time.monotonic() - started
+        return self._record(label if label in INTENTS else LEGAL, "model")
+
+    def stats(self):
+        total = sum(self.counts.values())
+        model_calls = self.decided_by["model"] + self.model_errors
+        return {
+            "total": total,
+            "routes": {
+                intent: {"count": count, "share": round(count / total, 4) if total else 0.0}
+                for intent, count in self.counts.items()
+            },
+            "decided_by": dict(self.decided_by),
+            "model_errors": self.model_errors,
+            "model_avg_ms": round(self.model_seconds / model_calls * 1000, 1) if model_calls else None
+        }
@@ -0,0 +1,282 @@
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from typing import Dict, List, Optional
+from .resilience import SourceStats
+from .sources import load_config
+from .tracing import tracer
+
+# Cheapest first; each tier falls back to the cheaper tiers after it on a timeout or error
+DEFAULT_TIERS = {
+    'simple': {'model': 'gpt-4o-mini', 'max_tokens': 1000, 'timeout': 20.0},
+    'standard': {'model': 'gpt-4o', 'max_tokens': 1500, 'timeout': 30.0},
+    'complex': {'model': 'gpt-4', 'max_tokens': 2000, 'timeout': 45.0}
+}
+
+_COMPARISON = re.compile(
+    r"\b(?:compare|comparison|difference|differences|versus|vs|interact|interplay|conflict|both|whereas|"
+    r"exceptions?|appeal|precedent)\b", re.I
+)
+# "s21", "s.21" or "s 21", but not the "s" of a contraction ("it's 2 weeks")
+_CITATION = re.compile(
+    r"\b(?:(?<!['’])s\.?\s?\d+|section \d+|reg(?:ulation)?\.? \d+|sch(?:edule)?\.? \d+|art(?:icle)?\.? \d+|"
+    r"si \d{4}/\d+|\[\d{4}\] \w+)", re.I
+)
+
+
+def _usage_value(usage, *path):
+    value = usage
+    for name in path:
+        value = getattr(value, name, None)
+        if value is None:
+            return 0
+    return value
+
+
+class ModelStats(SourceStats):
+    """Latency and outcome stats for one model plus its token usage"""
+
+    def __init__(self, window: int = 200):
+        super().__init__(window)
+        self.fallbacks = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.first_token_latencies = deque(maxlen=window)
+
+    def record_usage(self, usage):
+        if usage is None:
+            return
+        self.prompt_tokens += _usage_value(usage, 'prompt_tokens')
+        self.completion_tokens += _usage_value(usage, 'completion_tokens')
+        self.cached_tokens += _usage_value(usage, 'prompt_tokens_details', 'cached_tokens')
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        del snapshot['short_circuits'], snapshot['retries'], snapshot['hedges']
+        first_tokens = sorted(self.first_token_latencies)
+        snapshot.update({
+            "fallbacks": self.fallbacks,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_prompt_tokens": self.cached_tokens,
+            "prompt_cache_rate": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+            "p50_first_token_ms": round(first_tokens[len(first_tokens) // 2] * 1000, 1) if first_tokens else None
+        })
+        return snapshot
+
+
+class ModelRouter:
+    """
+    Picks a model tier per request and falls back to cheaper tiers on timeouts
+    or errors.
+
+    The tier comes from a cheap complexity score of the question (length,
+    several questions, comparisons, citations) and the length of the
+    conversation. Tiers, thresholds and fallbacks can be set from the file in
+    MODEL_ROUTER_CONFIG:
+
+        tiers:
+          standard: {model: gpt-4o, max_tokens: 1500, timeout: 30}
+        thresholds: {standard: 1, complex: 3, simple_max_words: 12}
+        fallbacks: {complex: [standard], standard: [simple]}
+    """
+
+    def __init__(self, tiers: Dict[str, dict] = None, thresholds: dict = None,
+                 fallbacks: Dict[str, List[str]] = None, default_tier: str = 'standard'):
+        self.tiers = {name: dict(config) for name, config in (tiers or DEFAULT_TIERS).items()}
+        self.thresholds = {'standard': 1, 'complex': 3, 'simple_max_words': 12, **(thresholds or {})}
+        names = list(self.tiers)
+        self.fallbacks = fallbacks or {
+            name: names[:index][::-1] for index, name in enumerate(names)
+        }
+        self.default_tier = default_tier if default_tier in self.tiers else names[-1]
+        self.stats_by_model: Dict[str, ModelStats] = {}
+        self.routed = {name: 0 for name in self.tiers}
+
+    @classmethod
+    def from_config(cls, path: str = None):
+        path = path or os.getenv("MODEL_ROUTER_CONFIG")
+        config = load_config(path) if path else {}
+        tiers = None
+        if config.get('tiers'):
+            # Configured tiers override the defaults field by field
+            tiers = {name: dict(value) for name, value in DEFAULT_TIERS.items()}
+            for name, overrides in config['tiers'].items():
+                tiers.setdefault(name, {}).update(overrides or {})
+        return cls(tiers, config.get('thresholds'), config.get('fallbacks'), config.get('default_tier', 'standard'))
+
+    def complexity(self, query: str, context: list = None, conversation_history: list = None) -> int:
+        words = len(query.split())
+        score = 0
+        if words > 30:
+            score += 1
+        if words > 80:
+            score += 1
+        if query.count("?") > 1:
+            score += 1
+        if _COMPARISON.search(query):
+            score += 1
+        if _CITATION.search(query):
+            score += 1
+        if conversation_history and len(conversation_history) >= 6:
+            score += 1
+        return score
+
+    def choose_tier(self, query: str, context: list = None, conversation_history: list = None) -> str:
+        score = self.complexity(query, context, conversation_history)
+        if score >= self.thresholds['complex'] and 'complex' in self.tiers:
+            tier = 'complex'
+        elif score >= self.thresholds['standard'] or len(query.split()) > self.thresholds['simple_max_words']:
+            tier = self.default_tier
+        else:
+            tier = 'simple' if 'simple' in self.tiers else self.default_tier
+        self.routed[tier] += 1
+        return tier
+
+    def _plan(self, tier: Optional[str], model: Optional[str], max_tokens: Optional[int],
+              temperature: Optional[float] = None):
+        """Tier configs to try in order: the chosen tier, then its fallbacks"""
+        tier = tier if tier in self.tiers else self.default_tier
+        plan = [dict(self.tiers[tier])] + [
+            dict(self.tiers[name]) for name in self.fallbacks.get(tier, []) if name in self.tiers
+        ]
+        if model:
+            plan[0]['model'] = model
+        if max_tokens:
+            for config in plan:
+                config['max_tokens'] = min(max_tokens, config.get('max_tokens', max_tokens))
+        if temperature is not None:
+            for config in plan:
+                config['temperature'] = temperature
+        return plan
+
+    def _stats(self, model: str) -> ModelStats:
+        stats = self.stats_by_model.get(model)
+        if stats is None:
+            stats = self.stats_by_model[model] = ModelStats()
+        return stats
+
+    @staticmethod
+    def _request(config: dict, messages: List[Dict], **kwargs):
+        request = dict(
+            model=config['model'],
+            messages=messages,
+            max_tokens=config.get('max_tokens', 2000),
+            temperature=config.get('temperature', 0.7),
+            **kwargs
+        )
+        if config.get('timeout'):
+            request['timeout'] = config['timeout']
+        return request
+
+    def _failed(self, config: dict, error: Exception, last: bool):
+        stats = self._stats(config['model'])
+        stats.failures += 1
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError)) or 'Timeout' in type(error).__name__:
+            stats.timeouts += 1
+        if not last:
+            stats.fallbacks += 1
+            print(f"Model {config['model']} failed ({type(error).__name__}), falling back")
+
+    def _succeeded(self, config: dict, started: float, usage):
+        stats = self._stats(config['model'])
+        stats.successes += 1
+        stats.latencies.append(time.monotonic() - started)
+        stats.record_usage(usage)
+
+    async def acomplete(self, async_client, messages: List[Dict], tier: str = None, model: str = None,
+                        max_tokens: int = None, temperature: float = None) -> str:
+        plan = self._plan(tier, model, max_tokens, temperature)
+        for index, config in enumerate(plan):
+            started = time.monotonic()
+            try:
+                request = self._request(config, messages)
+                with tracer.span("openai.request", model=config['model']):
+                    response = await asyncio.wait_for(
+                        async_client.chat.completions.create(**request), config.get('timeout')
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failed(config, e, index + 1 == len(plan))
+                if index + 1 == len(plan):
+                    raise
+                continue
+            self._succeeded(config, started, response.usage)
+            return response.choices[0].message.content
+
+    def complete(self, client, messages: List[Dict], tier: str = None, model: str = None,
+                 max_tokens: int = None, temperature: float = None) -> str:
+        """Sync variant of acomplete (timeouts are enforced by the client)"""
+        plan = self._plan(tier, model, max_tokens, temperature)
+        for index, config in enumerate(plan):
+            started = time.monotonic()
+            try:
+                with tracer.span("openai.request", model=config['model']):
+                    response = client.chat.completions.create(**self._request(config, messages))
+            except Exception as e:
+                self._failed(config, e, index + 1 == len(plan))
+                if index + 1 == len(plan):
+                    raise
+                continue
+            self._succeeded(config, started, response.usage)
+            return response.choices[0].message.content
+
+    async def astream(self, async_client, messages: List[Dict], tier: str = None, model: str = None,
+                      max_tokens: int = None, temperature: float = None):
+        """
+        Stream content deltas. Falls back to the next tier only while nothing
+        has been yielded yet (the request failed or the first token timed out).
+        """
+        plan = self._plan(tier, model, max_tokens, temperature)
+        for index, config in enumerate(plan):
+            started = time.monotonic()
+            stream = None
+            usage = None
+            yielded = False
+            try:
+                request = self._request(config, messages, stream=True, stream_options={"include_usage": True})
+                stream = await asyncio.wait_for(async_client.chat.completions.create(**request), config.get('timeout'))
+                chunks = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await (asyncio.wait_for(chunks.__anext__(), config.get('timeout'))
+                                       if not yielded else chunks.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    if getattr(chunk, 'usage', None) is not None:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not yielded:
+                            first_token = time.monotonic() - started
+                            self._stats(config['model']).first_token_latencies.append(first_token)
+                            tracer.observe("openai.first_token", first_token, model=config['model'])
+                            yielded = True
+                        yield chunk.choices[0].delta.content
+            except (asyncio.CancelledError, GeneratorExit):
+                raise
+            except Exception as e:
+                self._failed(config, e, yielded or index + 1 == len(plan))
+                if yielded or index + 1 == len(plan):
+                    raise
+                continue
+            finally:
+                # Runs on normal completion and when the consumer goes away,
+                # so an abandoned upstream stream is never left open
+                if stream is not None:
+                    await stream.close()
+            self._succeeded(config, started, usage)
+            # Spans can't be held open across an async generator's yields, so the
+            # stream's duration is recorded directly
+            tracer.observe("openai.stream", time.monotonic() - started, model=config['model'])
+            return
+
+    def stats(self):
+        return {
+            "routed": dict(self.routed),
+            "tiers": {name: config['model'] for name, config in self.tiers.items()},
+            "models": {model: stats.snapshot() for model, stats in self.stats_by_model.items()}
+        }
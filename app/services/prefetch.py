@@ -0,0 +1,132 @@
+import asyncio
+from typing import Optional
+from .concurrency import speculative
+from .intent import LEGAL
+from .tracing import traced
+
+
+class Prefetcher:
+    """
+    Speculative retrieval for a question the user is still typing.
+
+    A draft fills the site search and feed caches, so the real chat for the
+    same text (or a near repeat once normalised) finds its context resident.
+    Speculation never competes with real chats:
+
+    - A draft waits `delay` seconds before any upstream work; a newer draft
+      from the same user replaces it, so keystrokes cost nothing.
+    - Each user has at most one speculation running plus one waiting, and at
+      most `max_concurrent` run in the worker; beyond that drafts are dropped.
+    - Drafts are skipped while more than `busy_ratio` of the chat slots are in
+      use, and speculation is cancelled as soon as a chat has to queue (site
+      searches already sent still finish and fill the cache).
+    - Its site searches and feed fetches share the HTTP pool's small
+      speculative budget, so however many are in flight or left finishing
+      after a cancel, they hold at most that many outbound slots.
+    """
+
+    def __init__(self, chatbot, admission=None, max_concurrent: int = 2, delay: float = 0.3,
+                 min_chars: int = 12, busy_ratio: float = 0.75):
+        self.chatbot = chatbot
+        self.admission = admission
+        self.max_concurrent = max_concurrent
+        self.delay = delay
+        self.min_chars = min_chars
+        self.busy_ratio = busy_ratio
+        self._pending = {}  # user id -> task waiting out the delay
+        self._running = {}  # user id -> task doing retrieval
+        self.outcomes = {
+            "scheduled": 0, "too_short": 0, "not_legal": 0, "busy": 0, "superseded": 0,
+            "dropped": 0, "completed": 0, "cancelled": 0, "failed": 0
+        }
+        if admission is not None:
+            admission.listeners.append(self.cancel_running)
+
+    def _busy(self) -> bool:
+        admission = self.admission
+        if admission is None:
+            return False
+        return admission.queued > 0 or admission.in_flight >= admission.max_in_flight * self.busy_ratio
+
+    def submit(self, user_id: str, query: Optional[str]) -> str:
+        """Schedule speculation for a draft; returns "scheduled" or why it was skipped"""
+        query = (query or "").strip()
+        if query:
+            if len(query) < self.min_chars:
+                return self._count("too_short")
+            if self.chatbot.intents.peek(query) != LEGAL:
+                return self._count("not_legal")
+        if self._busy():
+            return self._count("busy")
+
+        previous = self._pending.pop(user_id, None)
+        if previous is not None:
+            previous.cancel()
+            self._count("superseded")
+        task = asyncio.ensure_future(self._run(user_id, query))
+        self._pending[user_id] = task
+        return self._count("scheduled")
+
+    def _count(self, outcome: str) -> str:
+        self.outcomes[outcome] += 1
+        return outcome
+
+    async def _run(self, user_id: str, query: str):
+        task = asyncio.current_task()
+        try:
+            await asyncio.sleep(self.delay)
+            running = self._running.get(user_id)
+            if running is not None:
+                # Let the user's previous draft finish rather than stacking another on top
+                await asyncio.wait([running])
+            if self._pending.get(user_id) is not task:
+                return
+            del self._pending[user_id]
+            if self._busy() or len(self._running) >= self.max_concurrent:
+                self._count("dropped")
+                return
+            self._running[user_id] = task
+            await self._warm(query)
+            self._count("completed")
+        except asyncio.CancelledError:
+            # A waiting draft is superseded (already counted) or shed with the rest
+            if self._running.get(user_id) is task:
+                self._count("cancelled")
+        except Exception as e:
+            print(f"Speculative prefetch failed for '{query[:60]}': {e}")
+            self._count("failed")
+        finally:
+            if self._pending.get(user_id) is task:
+                del self._pending[user_id]
+            if self._running.get(user_id) is task:
+                del self._running[user_id]
+
+    @traced("prefetch.warm")
+    async def _warm(self, query: str):
+        retriever = self.chatbot.retriever
+        feed_store = getattr(retriever, 'feed_store', None)
+        with speculative():
+            if feed_store is not None:
+                await feed_store.refresh()
+            if query:
+                await retriever.afetch_context_for_query(query)
+
+    def cancel_running(self):
+        """Stop all speculation (a real chat is waiting for capacity)"""
+        for task in list(self._pending.values()) + list(self._running.values()):
+            task.cancel()
+
+    async def close(self):
+        tasks = list(self._pending.values()) + list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "running": len(self._running),
+            "max_concurrent": self.max_concurrent,
+            "outcomes": dict(self.outcomes)
+        }
@@ -0,0 +1,171 @@
+import asyncio
+import re
+import sys
+import time
+from collections import OrderedDict
+
+_NON_WORD = re.compile(r"[^\w\s./]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalise_query(query: str) -> str:
+    """Lowercase, drop punctuation (keeping citation characters) and collapse whitespace"""
+    return _SPACES.sub(" ", _NON_WORD.sub(" ", query.lower())).strip()
+
+
+def _estimate_size(results) -> int:
+    size = sys.getsizeof(results)
+    for item in results:
+        size += sys.getsizeof(item)
+        for key, value in item.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
+
+class QueryCache:
+    """
+    TTL + LRU cache for site search results keyed on (site, normalised query).
+
+    - Fresh entries are served directly; entries past their TTL but inside the
+      stale grace window are served immediately while one background fetch
+      revalidates them (stale-while-revalidate).
+    - Concurrent misses for the same key share one upstream fetch (single-flight).
+    - Memory is capped by an estimated byte budget with LRU eviction.
+    - With a `shared` SharedCache, fetched results are also written there and
+      a local miss checks it before going upstream, so workers on one host
+      share their searches.
+    """
+
+    def __init__(self, default_ttl=1800, stale_grace=3600, negative_ttl=60, max_bytes=32 * 1024 * 1024,
+                 shared=None):
+        self.default_ttl = default_ttl
+        self.stale_grace = stale_grace
+        self.negative_ttl = negative_ttl
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # (site_key, query) -> entry
+        self._inflight = {}  # (site_key, query) -> asyncio.Task
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _ttl(self, results, ttl):
+        return ttl if results else min(ttl, self.negative_ttl)
+
+    def _store(self, key, results, ttl):
+        now = time.monotonic()
+        ttl = self._ttl(results, ttl)
+        size = _estimate_size(results)
+        old = self._entries.pop(key, None)
+        if old:
+            self.current_bytes -= old['size']
+        self._entries[key] = {
+            'results': results,
+            'expires_at': now + ttl,
+            'stale_until': now + ttl + (self.stale_grace if results else 0),
+            'size': size
+        }
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= evicted['size']
+            self.evictions += 1
+
+    def _fetch(self, key, fetch, ttl):
+        task = self._inflight.get(key)
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            self.coalesced += 1
+            return task
+
+        async def run():
+            try:
+                if self.shared is not None:
+                    shared = await self._shared_get(key, ttl)
+                    if shared is not None:
+                        return shared
+                results = await fetch()
+                self._store(key, results, ttl)
+                if self.shared is not None:
+                    await self.shared.set("query", "\t".join(key), results, self._ttl(results, ttl))
+                return results
+            finally:
+                if self._inflight.get(key) is task:
+                    del self._inflight[key]
+
+        task = asyncio.ensure_future(run())
+        # Mark failures as retrieved even if every waiter has gone away
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._inflight[key] = task
+        return task
+
+    async def _shared_get(self, key, ttl):
+        """Results another worker stored while still fresh, kept locally for the time they have left"""
+        row = await self.shared.get("query", "\t".join(key))
+        if row is None:
+            return None
+        results, stored_at = row
+        remaining = self._ttl(results, ttl) - (time.time() - stored_at)
+        if remaining <= 0:
+            return None
+        self.shared_hits += 1
+        self._store(key, results, remaining)
+        return results
+
+    async def get_or_fetch(self, site_key, query, fetch, ttl=None):
+        """Return cached results for (site, query), calling fetch() on a miss"""
+        ttl = ttl if ttl is not None else self.default_ttl
+        key = (site_key, normalise_query(query))
+        entry = self._entries.get(key)
+        now = time.monotonic()
+
+        if entry is not None:
+            if now < entry['expires_at']:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return [dict(item) for item in entry['results']]
+            if now < entry['stale_until']:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                revalidate = self._fetch(key, fetch, ttl)
+                revalidate.add_done_callback(self._log_failure)
+                return [dict(item) for item in entry['results']]
+
+        self.misses += 1
+        # Shielded so a caller giving up (e.g. at its deadline) doesn't cancel the
+        # shared fetch; it still completes and fills the cache
+        results = await asyncio.shield(self._fetch(key, fetch, ttl))
+        return [dict(item) for item in results]
+
+    @staticmethod
+    def _log_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Background cache revalidation failed: {task.exception()}")
+
+    async def drain(self):
+        """Wait for in-flight fetches on the running loop (used before closing the HTTP client)"""
+        loop = asyncio.get_running_loop()
+        pending = [task for task in self._inflight.values() if task.get_loop() is loop]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0
+        }
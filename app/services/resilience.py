@@ -0,0 +1,207 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Optional
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a source whose circuit breaker is open"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when no time is left in the request budget for another attempt"""
+
+
+class Deadline:
+    """Overall time budget for one request"""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class CircuitBreaker:
+    """
+    Classic closed -> open -> half-open breaker.
+
+    After `failure_threshold` consecutive failures calls are rejected for
+    `reset_timeout` seconds; then a single trial call is let through and its
+    outcome decides whether the breaker closes again or re-opens.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class SourceStats:
+    """Rolling latency samples and outcome counters for one upstream source"""
+
+    def __init__(self, window: int = 200):
+        self.latencies = deque(maxlen=window)
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.short_circuits = 0
+        self.retries = 0
+        self.hedges = 0
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+    def snapshot(self):
+        total = self.successes + self.failures
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "short_circuits": self.short_circuits,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "error_rate": round(self.failures / total, 4) if total else 0.0,
+            "p50_ms": _ms(self.percentile(50)),
+            "p95_ms": _ms(self.percentile(95)),
+            "p99_ms": _ms(self.percentile(99))
+        }
+
+
+def _ms(seconds: Optional[float]):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+class SourceGuard:
+    """
+    Wraps calls to one upstream source with a breaker, deadline-bounded
+    retries with jittered backoff and optional hedging.
+
+    `fn` is an async callable taking the per-attempt timeout in seconds.
+    """
+
+    def __init__(self, name: str, timeout: float = 10.0, attempts: int = 2, backoff_base: float = 0.25,
+                 min_attempt_time: float = 1.0, hedge: bool = False, hedge_min_samples: int = 20,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.timeout = timeout
+        self.attempts = attempts
+        self.backoff_base = backoff_base
+        self.min_attempt_time = min_attempt_time
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = SourceStats()
+
+    def _attempt_timeout(self, deadline: Optional[Deadline]) -> float:
+        if deadline is None:
+            return self.timeout
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"No time left to call {self.name}")
+        return min(self.timeout, remaining)
+
+    async def _timed(self, fn, timeout: float):
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(fn(timeout), timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        self.stats.latencies.append(time.monotonic() - started)
+        return result
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self.stats.latencies) < self.hedge_min_samples:
+            return None
+        return self.stats.percentile(95)
+
+    async def _hedged(self, fn, timeout: float, deadline: Optional[Deadline]):
+        hedge_after = self._hedge_delay()
+        first = asyncio.ensure_future(self._timed(fn, timeout))
+        if hedge_after is None or hedge_after >= timeout:
+            return await first
+
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=hedge_after)
+            if not done and (deadline is None or deadline.remaining() > self.min_attempt_time):
+                # The first attempt is slower than this source's p95: race a second one
+                self.stats.hedges += 1
+                pending.add(asyncio.ensure_future(self._timed(fn, self._attempt_timeout(deadline))))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, fn, deadline: Optional[Deadline] = None):
+        if not self.breaker.allow():
+            self.stats.short_circuits += 1
+            raise CircuitOpenError(f"Circuit open for {self.name}")
+
+        for attempt in range(self.attempts):
+            try:
+                result = await self._hedged(fn, self._attempt_timeout(deadline), deadline)
+            except (asyncio.CancelledError, DeadlineExceeded):
+                raise
+            except Exception as e:
+                self.stats.failures += 1
+                self.breaker.record_failure()
+                delay = random.uniform(0, self.backoff_base * (2 ** attempt))
+                out_of_budget = deadline is not None and deadline.remaining() < delay + self.min_attempt_time
+                if attempt + 1 >= self.attempts or out_of_budget or not self.breaker.allow():
+                    raise e
+                self.stats.retries += 1
+                await asyncio.sleep(delay)
+                continue
+            self.stats.successes += 1
+            self.breaker.record_success()
+            return result
+
+    def snapshot(self):
+        return {"state": self.breaker.state, **self.stats.snapshot()}
@@ -1,204 +1,204 @@
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-import concurrent.futures
-import feedparser
+import asyncio
+import os
+import httpx
+from .concurrency import run_blocking, run_sync
+from .corpus import LegislationCorpus
+from .http_client import HttpClientPool, DEFAULT_HEADERS
+from .feed_store import FeedStore
+from .query_cache import QueryCache
+from .text_index import TextIndex
+from .extraction import extract_from_stream
+from .resilience import CircuitOpenError, Deadline, DeadlineExceeded, SourceGuard
+from .shared_state import SharedCache
+from .sources import SourceRegistry, load_source_registry
+from .tracing import traced
 
 class Retriever:
-    def __init__(self):
-        self.sources = {
-            'gov.uk': {
-                'base_url': 'https://www.gov.uk',
-                'search_url': 'https://www.gov.uk/search/all?keywords={query}&order=relevance',
-                'content_selector': '.gem-c-document-list__item-title, .gem-c-document-list__item-description'
-            },
-            'legislation.gov.uk': {
-                'base_url': 'https://www.legislation.gov.uk',
-                'search_url': 'https://www.legislation.gov.uk/search?text={query}',
-                'content_selector': '.searchresult h3, .searchresult p'
-            },
-            # 'justice.gov.uk': {
-            #     'base_url': 'https://www.justice.gov.uk',
-            #     'search_url': 'https://www.justice.gov.uk/search?q={query}',
-            #     'content_selector': 'h3.result-title, .result-summary'
-            # },
-            'bailii.org': {
-                'base_url': 'https://www.bailii.org',
-                'search_url': 'https://www.bailii.org/cgi-bin/lucy_search_1.cgi?query={query}',
-                'content_selector': 'h3 a, .case-summary'
-            },
-            'lawsociety.org.uk': {
-                'base_url': 'https://www.lawsociety.org.uk',
-                'search_url': 'https://www.lawsociety.org.uk/search?q={query}',
-                'content_selector': '.search-result h3, .search-result-summary'
-            },
-            'citizensadvice.org.uk': {
-                'base_url': 'https://www.citizensadvice.org.uk',
-                'search_url': 'https://www.citizensadvice.org.uk/search/?q={query}',
-                'content_selector': '.search-result__title, .search-result__summary'
-            }
-        }
+    def __init__(self, http: HttpClientPool = None, index_dir: str = None,
+                 local_min_hits: int = 3, local_min_coverage: float = 0.6, request_deadline: float = None,
+                 registry: SourceRegistry = None, shared_cache: SharedCache = None,
+                 corpus: LegislationCorpus = None):
+        self.http = http or HttpClientPool()
+        # Search sources and legislation feeds come from the source registry
+        # (built-in defaults, overridable from the SOURCES_CONFIG file)
+        self.registry = registry if registry is not None else load_source_registry()
+        self.sources = self.registry.sources
+        self.legislation_feeds = self.registry.feeds
         
-        # Comprehensive legislation feed URLs with descriptions
-        self.legislation_feeds = {
-            'all_legislation': {
-                'url': 'https://www.legislation.gov.uk/new/data.feed',
-                'description': 'All UK Legislation'
-            },
-            'uk_public_general_acts': {
-                'url': 'https://www.legislation.gov.uk/new/ukpga/data.feed',
-                'description': 'UK Public General Acts'
-            },
-            'uk_ministerial_directions': {
-                'url': 'https://www.legislation.gov.uk/new/ukmd/data.feed',
-                'description': 'UK Ministerial Directions'
-            },
-            'northern_ireland_acts': {
-                'url': 'https://www.legislation.gov.uk/new/nia/data.feed',
-                'description': 'Northern Ireland Acts'
-            },
-            'northern_ireland_orders': {
-                'url': 'https://www.legislation.gov.uk/new/nisi/data.feed',
-                'description': 'Northern Ireland Orders in Council'
-            },
-            'northern_ireland_statutory_rules': {
-                'url': 'https://www.legislation.gov.uk/new/nisr/data.feed',
-                'description': 'Northern Ireland Statutory Rules'
-            },
-            'scotland_acts': {
-                'url': 'https://www.legislation.gov.uk/new/asp/data.feed',
-                'description': 'Acts of the Scottish Parliament'
-            },
-            'scotland_statutory_instruments': {
-                'url': 'https://www.legislation.gov.uk/new/ssi/data.feed',
-                'description': 'Scottish Statutory Instruments'
-            },
-            'wales_acts': {
-                'url': 'https://www.legislation.gov.uk/new/asc/data.feed',
-                'description': 'Acts of Senedd Cymru'
-            },
-            'wales_statutory_instruments': {
-                'url': 'https://www.legislation.gov.uk/new/wsi/data.feed',
-                'description': 'Welsh Statutory Instruments'
-            }
+        self.headers = DEFAULT_HEADERS
+
+        # Per-source circuit breakers, retries and latency stats; chat requests
+        # return whatever has arrived when the overall deadline passes
+        self.request_deadline = request_deadline or float(os.getenv("RETRIEVAL_DEADLINE", "6"))
+        self.guards = {
+            site_key: SourceGuard(site_key, timeout=source.timeout, attempts=source.attempts, hedge=source.hedge)
+            for site_key, source in self.sources.items()
         }
-        
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        self.feed_guards = {
+            feed_key: SourceGuard(f"feed:{feed_key}", attempts=1)
+            for feed_key in self.legislation_feeds
         }
+        # Workers on one host can share search results and feed entries through a SharedCache
+        self.shared_cache = shared_cache
+        self.feed_store = FeedStore(self.legislation_feeds, self.http, guards=self.feed_guards, shared=shared_cache)
+        self.query_cache = QueryCache(shared=shared_cache)
 
-    def _search_site(self, site_key, query):
-        site_config = self.sources[site_key]
-        search_url = site_config["search_url"].format(query=query)
-        
+        # Local full-text index over everything harvested from feeds and site searches;
+        # live sites are only searched when it can't supply enough good matches. Search
+        # results expire with their source's TTL; the oldest entries go past TEXT_INDEX_MAX_DOCS
+        self.text_index = TextIndex(
+            index_dir or os.getenv("TEXT_INDEX_DIR"),
+            max_docs=int(os.getenv("TEXT_INDEX_MAX_DOCS", "50000"))
+        )
+        self._index_flush = None
+        self.local_min_hits = local_min_hits
+        self.local_min_coverage = local_min_coverage
+        self.feed_store.listeners.append(lambda feed_key, items: self._index_items(items))
+
+        # Offline mirror of full-text legislation from the feeds (CORPUS_DIR), used for
+        # questions that cite or name an Act or SI
+        if corpus is None and os.getenv("CORPUS_DIR"):
+            corpus = LegislationCorpus(os.getenv("CORPUS_DIR"))
+        self.corpus = corpus
+
+    @traced("retriever.search_site", source="{site_key}")
+    async def _search_site(self, site_key, query, deadline: Deadline = None):
+        """Search one source through its guard, served from the query cache when possible"""
+        ttl = self.sources[site_key].ttl
+        guard = self.guards[site_key]
         try:
-            response = requests.get(search_url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'lxml')
-            
-            results = soup.select(site_config["content_selector"])
-            
-            search_results = []
-            for result in results[:3]:
-                title = result.get_text(strip=True)
-                link = result.get('href')
-                if link:
-                    absolute_link = urljoin(site_config["base_url"], link)
-                    if title and "search" not in title.lower():
-                        search_results.append({
-                            "site": site_key,
-                            "title": title,
-                            "url": absolute_link,
-                            "snippet": title
-                        })
-
-            return search_results if search_results else []
-
-        except requests.exceptions.ConnectionError:
+            return await self.query_cache.get_or_fetch(
+                site_key, query,
+                lambda: guard.call(lambda timeout: self._fetch_site(site_key, query, timeout), deadline),
+                ttl=ttl
+            )
+        except CircuitOpenError:
+            return []
+        except (asyncio.TimeoutError, DeadlineExceeded):
+            print(f"Timed out fetching from {site_key}")
+            return []
+        except httpx.ConnectError:
             print(f"Connection failed to {site_key} - network or DNS issue")
             return []
-        except requests.exceptions.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             print(f"HTTP error from {site_key}: {e}")
             return []
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Could not fetch information from {site_key}: {e}")
             return []
 
-    def fetch_single_legislation_feed(self, feed_key, limit=3):
+    @traced("retriever.fetch_site", source="{site_key}")
+    async def _fetch_site(self, site_key, query, timeout=httpx.USE_CLIENT_DEFAULT):
+        source = self.sources[site_key]
+        search_url = source.build_url(query)
+        
+        # Parse the body bytes as they arrive and stop reading once enough matches are complete
+        async with self.http.budget(), source.slot():
+            async with self.http.stream(search_url, timeout=timeout) as response:
+                response.raise_for_status()
+                matches = await extract_from_stream(
+                    response.aiter_bytes(), source.fields, limit=source.extraction_limit,
+                    encoding=response.charset_encoding
+                )
+        search_results = source.build_results(matches, search_url)
+        self._index_items(search_results, ttl=source.ttl)
+        return search_results if search_results else []
+
+    def _index_items(self, items, ttl=None):
+        """Add items to the local index, writing a full in-memory segment out on the blocking executor"""
+        self.text_index.add_items(items, ttl=ttl)
+        if not self.text_index.needs_flush or (self._index_flush is not None and not self._index_flush.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.text_index.flush()
+            return
+        self._index_flush = loop.create_task(run_blocking(self.text_index.flush))
+        self._index_flush.add_done_callback(self._index_flushed)
+
+    @staticmethod
+    def _index_flushed(task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Failed to flush the local index: {task.exception()}")
+
+    async def _drain_index(self):
+        if self._index_flush is not None:
+            await asyncio.gather(self._index_flush, return_exceptions=True)
+            self._index_flush = None
+
+    @traced("retriever.fetch_feed", feed="{feed_key}")
+    async def afetch_single_legislation_feed(self, feed_key, limit=3):
         """
-        Fetch legislation from a single feed source.
+        Fetch legislation from a single feed source, refreshing it if its TTL has expired.
         """
-        feed_config = self.legislation_feeds[feed_key]
-        try:
-            feed = feedparser.parse(feed_config['url'])
-            items = []
-            for entry in feed.entries[:limit]:
-                items.append({
-                    "site": f"legislation.gov.uk ({feed_config['description']})",
-                    "title": entry.title,
-                    "url": entry.link,
-                    "snippet": entry.summary if hasattr(entry, 'summary') and entry.summary else entry.title,
-                    "feed_type": feed_key,
-                    "description": feed_config['description']
-                })
-            return items
-        except Exception as e:
-            print(f"Failed to fetch {feed_key} feed: {e}")
-            return []
+        await self.feed_store.refresh_feed(feed_key)
+        return self.feed_store.entries(feed_key, limit)
 
-    def fetch_all_legislation_feeds(self, limit_per_feed=2):
+    @traced("retriever.fetch_feeds")
+    async def afetch_all_legislation_feeds(self, limit_per_feed=2):
         """
-        Fetch latest legislation from all feeds concurrently.
+        Fetch latest legislation from all feeds, refreshing stale ones concurrently.
         """
-        all_legislation = []
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.legislation_feeds)) as executor:
-            future_to_feed = {
-                executor.submit(self.fetch_single_legislation_feed, feed_key, limit_per_feed): feed_key
-                for feed_key in self.legislation_feeds.keys()
-            }
-            
-            for future in concurrent.futures.as_completed(future_to_feed):
-                feed_key = future_to_feed[future]
-                try:
-                    results = future.result()
-                    if results:
-                        all_legislation.extend(results)
-                except Exception as exc:
-                    print(f'{feed_key} feed generated an exception: {exc}')
-        
-        return all_legislation
+        await self.feed_store.refresh()
+        return self.feed_store.snapshot(limit_per_feed)
 
-    def fetch_context_for_query(self, query):
+    @traced("retriever.context")
+    async def afetch_context_for_query(self, query):
         """
         Fetches context from all legal sources and legislation feeds concurrently for a given query.
         """
         print(f"Searching for '{query}' across UK legal sources and legislation feeds...")
         all_results = []
+        site_keys = list(self.sources.keys())
+        deadline = Deadline(self.request_deadline)
 
-        # Search regular sources
-        with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.sources)) as executor:
-            future_to_site = {
-                executor.submit(self._search_site, key, query): key
-                for key in self.sources.keys()
-            }
+        # Feeds are refreshed in the background; only a cold store is loaded inline,
+        # and even then we stop waiting at the deadline
+        if not self.feed_store.loaded:
+            await asyncio.wait([asyncio.ensure_future(self.feed_store.refresh())], timeout=deadline.remaining())
 
-            for future in concurrent.futures.as_completed(future_to_site):
-                site_key = future_to_site[future]
-                try:
-                    results = future.result()
-                    if results:
-                        all_results.extend(results)
-                except Exception as exc:
-                    print(f'{site_key} generated an exception: {exc}')
+        # Legislation the question cites or names is always taken from the local mirror
+        if self.corpus is not None:
+            all_results.extend(await run_blocking(self.corpus.lookup, query))
+        corpus_urls = {item['url'] for item in all_results}
+
+        # Query the local index first. Only earlier site-search results (which drop out of the
+        # index with their source's TTL) can stand in for a live search, not feed entries
+        local_results = [item for item in self.search_local(query) if item['url'] not in corpus_urls]
+        searched = [item for item in local_results if not item.get('feed_type')]
+        if searched and len(searched) + len(all_results) >= self.local_min_hits:
+            all_results.extend(local_results)
+            print(f"Found {len(all_results)} items in the local index, skipping live search")
+        else:
+            # Search regular sources, keeping whatever has arrived by the deadline
+            tasks = {
+                asyncio.ensure_future(self._search_site(key, query, deadline)): key
+                for key in site_keys
+            }
+            done, pending = await asyncio.wait(tasks, timeout=deadline.remaining()) if tasks else (set(), set())
+            for task in pending:
+                # This cancels only our wait: query_cache.get_or_fetch awaits the fetch through
+                # asyncio.shield, so the fetch itself keeps running and still fills the cache
+                task.cancel()
+            if pending:
+                print(f"Deadline reached, skipping {', '.join(tasks[task] for task in pending)}")
+            for task in tasks:
+                if task not in done:
+                    continue
+                if task.exception() is not None:
+                    print(f'{tasks[task]} generated an exception: {task.exception()}')
+                elif task.result():
+                    all_results.extend(task.result())
         
-        # Always append latest legislation from all feeds
-        try:
-            latest_legislation = self.fetch_all_legislation_feeds(limit_per_feed=2)
-            all_results.extend(latest_legislation)
-            print(f"Added {len(latest_legislation)} legislation items from feeds")
-        except Exception as e:
-            print(f"Failed to fetch legislation feeds: {e}")
+        # Always append latest legislation from the feed store snapshot
+        seen_urls = {item['url'] for item in all_results}
+        latest_legislation = [
+            item for item in self.feed_store.snapshot(limit_per_feed=2)
+            if item['url'] not in seen_urls
+        ]
+        all_results.extend(latest_legislation)
+        print(f"Added {len(latest_legislation)} legislation items from feeds")
 
         return all_results if all_results else [{
             "site": "N/A",
@@ -207,26 +207,84 @@ class Retriever:
             "snippet": "No results found from any specified UK source."
         }]
 
-    def get_recent_legislation_by_type(self, legislation_type=None, limit=5):
+    def source_stats(self):
+        """Breaker state, latency percentiles and error counts for every upstream source"""
+        return {
+            "sites": {key: guard.snapshot() for key, guard in self.guards.items()},
+            "feeds": {key: guard.snapshot() for key, guard in self.feed_guards.items()}
+        }
+
+    def search_local(self, query, limit=5):
+        """
+        Search the local index, keeping only hits that cover most of the query terms.
+        """
+        self.text_index.purge_expired()
+        return [
+            item
+            for score, coverage, item in self.text_index.search(query, limit=limit * 2)
+            if coverage >= self.local_min_coverage
+        ][:limit]
+
+    async def aclose(self):
+        """Release pooled connections held for the running event loop and persist the index"""
+        await self.http.aclose()
+        await self._drain_index()
+        await run_blocking(self.text_index.close)
+
+    def close(self):
+        """Persist the local index (for sync callers such as the CLI)"""
+        self.text_index.close()
+
+    async def _run_and_close(self, coro):
+        try:
+            return await coro
+        finally:
+            await self.query_cache.drain()
+            await self._drain_index()
+            await self.http.aclose()
+
+    # Sync wrappers kept for the CLI and other non-async callers
+    def fetch_single_legislation_feed(self, feed_key, limit=3):
+        return run_sync(self._run_and_close(self.afetch_single_legislation_feed(feed_key, limit)))
+
+    def fetch_all_legislation_feeds(self, limit_per_feed=2):
+        return run_sync(self._run_and_close(self.afetch_all_legislation_feeds(limit_per_feed)))
+
+    def fetch_context_for_query(self, query):
+        return run_sync(self._run_and_close(self.afetch_context_for_query(query)))
+
+    async def aget_recent_legislation_by_type(self, legislation_type=None, limit=5):
         """
         Get recent legislation filtered by type (e.g., 'uk_public_general_acts', 'scotland_acts', etc.)
         """
         if legislation_type and legislation_type in self.legislation_feeds:
-            return self.fetch_single_legislation_feed(legislation_type, limit)
+            return await self.afetch_single_legislation_feed(legislation_type, limit)
         else:
-            return self.fetch_all_legislation_feeds(limit_per_feed=1)
+            return await self.afetch_all_legislation_feeds(limit_per_feed=1)
 
-    def search_legislation_by_keyword(self, keyword, limit=10):
+    async def asearch_legislation_by_keyword(self, keyword, limit=10):
         """
-        Search through recent legislation for specific keywords.
+        Search through recent legislation held in the feed store for specific keywords.
         """
-        all_legislation = self.fetch_all_legislation_feeds(limit_per_feed=5)
-        matching_legislation = []
+        await self.feed_store.refresh()
+        matching_legislation = [
+            item for score, coverage, item in self.text_index.search(keyword, limit=limit * 5)
+            if item.get('feed_type')
+        ]
+        if matching_legislation:
+            return matching_legislation[:limit]
         
+        # Fall back to a substring scan for partial words the index doesn't tokenise
         keyword_lower = keyword.lower()
-        for item in all_legislation:
+        for item in self.feed_store.snapshot(limit_per_feed=None):
             if (keyword_lower in item['title'].lower() or 
                 keyword_lower in item['snippet'].lower()):
                 matching_legislation.append(item)
                 
-        return matching_legislation[:limit]
\ No newline at end of file
+        return matching_legislation[:limit]
+
+    def get_recent_legislation_by_type(self, legislation_type=None, limit=5):
+        return run_sync(self._run_and_close(self.aget_recent_legislation_by_type(legislation_type, limit)))
+
+    def search_legislation_by_keyword(self, keyword, limit=10):
+        return run_sync(self._run_and_close(self.asearch_legislation_by_keyword(keyword, limit)))
@@ -1,7 +1,16 @@
 import uuid
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from pydantic import BaseModel
+from .session_store import SessionStore, MemorySessionStore
+from .tracing import traced
+
+class SessionGone(LookupError):
+    """The session was evicted or removed before the messages could be stored"""
+
+    def __init__(self, session_id: str):
+        super().__init__(f"Session {session_id} no longer exists")
+        self.session_id = session_id
 
 class ChatMessage(BaseModel):
     id: str
@@ -17,82 +26,83 @@ class ChatSession(BaseModel):
     created_at: datetime
     updated_at: datetime
     is_active: bool
+    summary: Optional[str] = None
+    summary_upto: Optional[str] = None
 
 class SessionManager:
-    def __init__(self):
-        # In-memory storage for now (replace with database later)
-        self.sessions = {}  # session_id -> session_data
-        self.user_sessions = {}  # user_id -> [session_ids]
+    def __init__(self, store: Optional[SessionStore] = None):
+        # In-memory storage unless a persistent backend is supplied
+        self.store = store if store is not None else MemorySessionStore.from_env()
     
+    @traced("session.create_session")
     async def create_session(self, user_id: str, title: str = "New Conversation") -> str:
         """Create a new chat session"""
         session_id = str(uuid.uuid4())
         now = datetime.now()
         
-        self.sessions[session_id] = {
+        await self.store.create_session({
             'id': session_id,
             'user_id': user_id,
             'title': title,
-            'messages': [],
             'created_at': now,
             'updated_at': now,
             'is_active': True
-        }
-        
-        if user_id not in self.user_sessions:
-            self.user_sessions[user_id] = []
-        self.user_sessions[user_id].append(session_id)
+        })
         
         return session_id
     
+    @traced("session.get_session")
     async def get_session(self, session_id: str, user_id: str):
         """Get session by ID"""
-        session = self.sessions.get(session_id)
+        session = await self.store.get_session(session_id)
         if session and session['user_id'] == user_id and session['is_active']:
             return ChatSession(**session)
         return None
     
+    @traced("session.add_message")
     async def add_message(self, session_id: str, content: str, role: str) -> str:
         """Add message to session"""
-        message_id = str(uuid.uuid4())
+        message_ids = await self.add_messages(session_id, [(content, role)])
+        return message_ids[0]
+
+    @traced("session.add_messages")
+    async def add_messages(self, session_id: str, messages: List[Tuple[str, str]]) -> List[str]:
+        """Add several (content, role) messages to a session in a single write; SessionGone if it no longer exists"""
         now = datetime.now()
-        
-        if session_id in self.sessions:
-            self.sessions[session_id]['messages'].append({
-                'id': message_id,
+        records = [
+            {
+                'id': str(uuid.uuid4()),
                 'content': content,
                 'role': role,
                 'created_at': now
-            })
-            self.sessions[session_id]['updated_at'] = now
-        
-        return message_id
+            }
+            for content, role in messages
+        ]
+        if not await self.store.add_messages(session_id, records, now):
+            raise SessionGone(session_id)
+        return [record['id'] for record in records]
     
-    async def get_session_history(self, session_id: str, limit: int = 20) -> List[ChatMessage]:
-        """Get conversation history"""
-        if session_id in self.sessions:
-            messages = self.sessions[session_id]['messages']
-            return [
-                ChatMessage(
-                    id=msg['id'],
-                    session_id=session_id,
-                    content=msg['content'],
-                    role=msg['role'],
-                    created_at=msg['created_at']
-                )
-                for msg in messages[-limit:]
-            ]
-        return []
+    @traced("session.get_session_history")
+    async def get_session_history(self, session_id: str, limit: int = 20, before: Optional[str] = None) -> List[ChatMessage]:
+        """Get conversation history, optionally only messages older than `before`"""
+        messages = await self.store.get_messages(session_id, limit, before)
+        return [ChatMessage(**msg) for msg in messages]
     
-    async def get_user_sessions(self, user_id: str, limit: int = 50) -> List[ChatSession]:
-        """Get all sessions for user"""
-        user_session_ids = self.user_sessions.get(user_id, [])
-        sessions = []
-        
-        for session_id in user_session_ids[-limit:]:
-            if session_id in self.sessions:
-                session_data = self.sessions[session_id]
-                if session_data['is_active']:
-                    sessions.append(ChatSession(**session_data))
-        
-        return sorted(sessions, key=lambda x: x.updated_at, reverse=True)
\ No newline at end of file
+    @traced("session.get_history_messages")
+    async def get_history_messages(self, session_id: str, limit: int = 20, before: Optional[str] = None) -> List[Dict]:
+        """Conversation history as the store's plain dicts, for the per-turn prompt path (no model objects)"""
+        return await self.store.get_messages(session_id, limit, before)
+
+    @traced("session.get_user_sessions")
+    async def get_user_sessions(self, user_id: str, limit: int = 50, before: Optional[str] = None) -> List[ChatSession]:
+        """Get all sessions for user, most recently updated first"""
+        sessions = await self.store.list_sessions(user_id, limit, before)
+        return [ChatSession(**session) for session in sessions if session['is_active']]
+
+    @traced("session.update_session_summary")
+    async def update_session_summary(self, session_id: str, summary: str, summary_upto: str):
+        """Store the rolling summary of messages up to and including summary_upto"""
+        await self.store.update_summary(session_id, summary, summary_upto)
+
+    async def close(self):
+        await self.store.close()
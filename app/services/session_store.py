@@ -0,0 +1,257 @@
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+
+class SessionStore(ABC):
+    """
+    Storage backend for chat sessions and messages.
+
+    Sessions and messages are plain dicts with the same keys as the
+    ChatSession / ChatMessage models. History is returned oldest first and
+    session lists newest first; `before` is an id cursor for keyset paging,
+    and a cursor the store doesn't know (never issued, or since evicted)
+    gives an empty page rather than the first one.
+    """
+
+    @abstractmethod
+    async def create_session(self, session: Dict) -> None:
+        ...
+
+    @abstractmethod
+    async def get_session(self, session_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    async def add_messages(self, session_id: str, messages: List[Dict], updated_at: datetime) -> bool:
+        """Append messages and bump updated_at in one write; False if the session doesn't exist"""
+
+    @abstractmethod
+    async def get_messages(self, session_id: str, limit: int = 20, before: Optional[str] = None) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    async def update_summary(self, session_id: str, summary: str, summary_upto: str) -> None:
+        """Store the rolling conversation summary and the id of the last message folded into it"""
+
+    @abstractmethod
+    async def list_sessions(self, user_id: str, limit: int = 50, before: Optional[str] = None) -> List[Dict]:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+class _Message:
+    __slots__ = ('uuid', 'role', 'content', 'created_at')
+
+    def __init__(self, uuid_int: int, role: int, content, created_at: float):
+        self.uuid = uuid_int  # message UUID as a 128-bit int
+        self.role = role  # index into _ROLES
+        self.content = content  # str, or zstd-compressed UTF-8 bytes
+        self.created_at = created_at  # POSIX timestamp
+
+
+class _Session:
+    __slots__ = ('id', 'user_id', 'title', 'created_at', 'updated_at', 'is_active', 'summary', 'summary_upto',
+                 'messages', 'last_access')
+
+    def __init__(self, session: Dict):
+        self.id = session['id']
+        self.user_id = session['user_id']
+        self.title = session['title']
+        self.created_at = session['created_at']
+        self.updated_at = session['updated_at']
+        self.is_active = session.get('is_active', True)
+        self.summary = session.get('summary')
+        self.summary_upto = session.get('summary_upto')
+        self.messages: List[_Message] = []
+        self.last_access = time.monotonic()
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in _SESSION_FIELDS}
+
+
+_SESSION_FIELDS = ('id', 'user_id', 'title', 'created_at', 'updated_at', 'is_active', 'summary', 'summary_upto')
+_ROLES = ('user', 'assistant', 'system')
+_ROLE_INDEX = {role: index for index, role in enumerate(_ROLES)}
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Compact in-process storage (single worker, lost on restart).
+
+    Sessions and messages are slotted records: message ids are kept as UUID
+    integers, roles as small ints (user, assistant or system; other roles
+    are rejected), timestamps as floats, and assistant replies of at least
+    `compress_min_chars` characters are zstd-compressed when zstandard is
+    installed. Retention is bounded: each session keeps its
+    newest `max_messages`, and sessions idle for `idle_ttl` seconds, or the
+    least recently used beyond `max_sessions`, are evicted.
+    """
+
+    def __init__(self, max_sessions: int = 10000, max_messages: int = 500, idle_ttl: float = 7 * 86400,
+                 compress_min_chars: int = 2048):
+        self.sessions: "OrderedDict[str, _Session]" = OrderedDict()  # least recently used first
+        self.user_sessions = {}  # user_id -> [session_ids]
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+        self.compress_min_chars = compress_min_chars if zstd is not None else None
+        self._compressor = zstd.ZstdCompressor(level=3) if zstd is not None else None
+        self._decompressor = zstd.ZstdDecompressor() if zstd is not None else None
+        self.message_count = 0
+        self.compressed_count = 0
+        self.evicted_sessions = 0
+        self.trimmed_messages = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "10000")),
+            max_messages=int(os.getenv("SESSION_MAX_MESSAGES", "500")),
+            idle_ttl=float(os.getenv("SESSION_IDLE_TTL", str(7 * 86400))),
+            compress_min_chars=int(os.getenv("SESSION_COMPRESS_MIN_CHARS", "2048"))
+        )
+
+    def _touch(self, session_id: str) -> Optional[_Session]:
+        # Expire idle sessions on every access, not only when a new one is created
+        self._evict()
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.last_access = time.monotonic()
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def _evict(self):
+        """Drop idle sessions from the least recently used end, then any beyond max_sessions"""
+        cutoff = time.monotonic() - self.idle_ttl
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if session.last_access > cutoff and len(self.sessions) <= self.max_sessions:
+                break
+            del self.sessions[session_id]
+            self._forget(session.messages)
+            user_sessions = self.user_sessions.get(session.user_id)
+            if user_sessions is not None:
+                user_sessions.remove(session_id)
+                if not user_sessions:
+                    del self.user_sessions[session.user_id]
+            self.evicted_sessions += 1
+
+    def _forget(self, messages: List[_Message]):
+        self.message_count -= len(messages)
+        self.compressed_count -= sum(1 for msg in messages if isinstance(msg.content, bytes))
+
+    def _pack(self, content: str, role: str):
+        if self.compress_min_chars is not None and role == 'assistant' and len(content) >= self.compress_min_chars:
+            # Copied so the record holds just the compressed bytes, not the compressor's worst-case buffer
+            return bytes(memoryview(self._compressor.compress(content.encode('utf-8'))))
+        return content
+
+    def _unpack(self, content) -> str:
+        return self._decompressor.decompress(content).decode('utf-8') if isinstance(content, bytes) else content
+
+    def _message_dict(self, session_id: str, msg: _Message) -> Dict:
+        return {
+            'id': str(uuid.UUID(int=msg.uuid)),
+            'session_id': session_id,
+            'role': _ROLES[msg.role],
+            'content': self._unpack(msg.content),
+            'created_at': datetime.fromtimestamp(msg.created_at)
+        }
+
+    async def create_session(self, session: Dict) -> None:
+        self.sessions[session['id']] = _Session(session)
+        self.user_sessions.setdefault(session['user_id'], []).append(session['id'])
+        self._evict()
+
+    async def get_session(self, session_id: str) -> Optional[Dict]:
+        session = self._touch(session_id)
+        return session.to_dict() if session is not None else None
+
+    async def add_messages(self, session_id: str, messages: List[Dict], updated_at: datetime) -> bool:
+        session = self._touch(session_id)
+        if session is None:
+            return False
+        for msg in messages:
+            if msg['role'] not in _ROLE_INDEX:
+                raise ValueError(f"Unknown message role: {msg['role']!r}")
+        for msg in messages:
+            session.messages.append(_Message(
+                uuid.UUID(msg['id']).int, _ROLE_INDEX[msg['role']],
+                self._pack(msg['content'], msg['role']), msg['created_at'].timestamp()
+            ))
+        self.message_count += len(messages)
+        self.compressed_count += sum(1 for msg in session.messages[-len(messages):] if isinstance(msg.content, bytes))
+        overflow = len(session.messages) - self.max_messages
+        if overflow > 0:
+            self._forget(session.messages[:overflow])
+            del session.messages[:overflow]
+            self.trimmed_messages += overflow
+        session.updated_at = updated_at
+        return True
+
+    async def get_messages(self, session_id: str, limit: int = 20, before: Optional[str] = None) -> List[Dict]:
+        session = self._touch(session_id)
+        if session is None or limit <= 0:
+            return []
+        messages = session.messages
+        end = len(messages)
+        if before is not None:
+            try:
+                cursor = uuid.UUID(before).int
+            except ValueError:
+                return []
+            end = next((i for i in range(len(messages) - 1, -1, -1) if messages[i].uuid == cursor), None)
+            if end is None:
+                return []
+        return [self._message_dict(session_id, msg) for msg in messages[max(0, end - limit):end]]
+
+    async def update_summary(self, session_id: str, summary: str, summary_upto: str) -> None:
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.summary = summary
+            session.summary_upto = summary_upto
+
+    async def list_sessions(self, user_id: str, limit: int = 50, before: Optional[str] = None) -> List[Dict]:
+        sessions = [
+            self.sessions[session_id].to_dict()
+            for session_id in self.user_sessions.get(user_id, [])
+            if session_id in self.sessions
+        ]
+        sessions.sort(key=lambda x: (x['updated_at'], x['id']), reverse=True)
+        if before is not None:
+            cursor = self.sessions.get(before)
+            if cursor is None:
+                return []
+            key = (cursor.updated_at, cursor.id)
+            sessions = [s for s in sessions if (s['updated_at'], s['id']) < key]
+        return sessions[:limit]
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "messages": self.message_count,
+            "compressed_messages": self.compressed_count,
+            "evicted_sessions": self.evicted_sessions,
+            "trimmed_messages": self.trimmed_messages
+        }
+
+
+def create_session_store(url: Optional[str] = None) -> SessionStore:
+    """Build a store from a database URL; no URL (or 'memory') keeps sessions in process"""
+    if not url or url == 'memory':
+        return MemorySessionStore.from_env()
+    # SQLAlchemy is only imported when a database is configured
+    from .sql_session_store import SQLSessionStore
+    return SQLSessionStore(url)
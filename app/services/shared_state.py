@@ -0,0 +1,111 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional, Tuple
+from .concurrency import run_blocking
+
+DEFAULT_STATE_DIR = ".lexley_state"
+
+
+def shared_state_dir() -> Optional[str]:
+    """
+    Directory for state shared between worker processes: SHARED_STATE_DIR, or
+    DEFAULT_STATE_DIR when running as one of several workers (WEB_CONCURRENCY > 1,
+    or spawned by uvicorn's --workers supervisor). None for a single process.
+    """
+    path = os.getenv("SHARED_STATE_DIR")
+    if not path and (int(os.getenv("WEB_CONCURRENCY") or 1) > 1 or multiprocessing.parent_process() is not None):
+        path = DEFAULT_STATE_DIR
+    if path:
+        os.makedirs(path, exist_ok=True)
+    return path or None
+
+
+def configure_sqlite(connection):
+    """WAL lets readers in every worker run alongside one writer; writers wait instead of failing"""
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+class SharedCache:
+    """
+    Key/value cache in a SQLite file (WAL mode) shared by all workers on a host.
+
+    Values are JSON, grouped by namespace ("query", "feeds", ...). Each row
+    keeps the wall-clock time it was stored, so callers apply their own
+    freshness rules; rows past their expiry are never returned and are purged
+    now and then. Every thread gets its own connection and calls run on the
+    blocking executor.
+    """
+
+    def __init__(self, path: str, purge_every: int = 256):
+        self.path = path
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS shared_cache ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "stored_at REAL NOT NULL, expires_at REAL, PRIMARY KEY (namespace, key))"
+            )
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            configure_sqlite(connection)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def get_sync(self, namespace: str, key: str) -> Optional[Tuple[Any, float]]:
+        """(value, stored_at) or None if missing or expired"""
+        row = self._connect().execute(
+            "SELECT value, stored_at FROM shared_cache WHERE namespace = ? AND key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time())
+        ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def set_sync(self, namespace: str, key: str, value, ttl: Optional[float] = None, stored_at: float = None):
+        now = time.time()
+        stored_at = stored_at if stored_at is not None else now
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO shared_cache (namespace, key, value, stored_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), stored_at, stored_at + ttl if ttl is not None else None)
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                connection.execute("DELETE FROM shared_cache WHERE expires_at <= ?", (now,))
+
+    async def get(self, namespace: str, key: str) -> Optional[Tuple[Any, float]]:
+        try:
+            return await run_blocking(self.get_sync, namespace, key)
+        except sqlite3.Error as e:
+            print(f"Shared cache read failed: {e}")
+            return None
+
+    async def set(self, namespace: str, key: str, value, ttl: Optional[float] = None, stored_at: float = None):
+        try:
+            await run_blocking(self.set_sync, namespace, key, value, ttl, stored_at)
+        except sqlite3.Error as e:
+            print(f"Shared cache write failed: {e}")
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
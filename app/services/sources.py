@@ -0,0 +1,332 @@
+import asyncio
+import importlib
+import json
+import os
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from urllib.parse import quote_plus, urljoin
+from .extraction import compile_selector
+
+# Built-in search sources. 'title_selector' matches result titles (the link is
+# taken from the element, its first descendant link or an enclosing link) and
+# 'snippet_selector' matches the description that follows each title.
+# 'ttl' is how long (seconds) query results are cached, 'hedge' races a second
+# request when a call is slower than the source's p95.
+DEFAULT_SOURCES = {
+    'gov.uk': {
+        'base_url': 'https://www.gov.uk',
+        'search_url': 'https://www.gov.uk/search/all?keywords={query}&order=relevance',
+        'title_selector': '.gem-c-document-list__item-title',
+        'snippet_selector': '.gem-c-document-list__item-description',
+        'ttl': 3600
+    },
+    'legislation.gov.uk': {
+        'base_url': 'https://www.legislation.gov.uk',
+        'search_url': 'https://www.legislation.gov.uk/search?text={query}',
+        'title_selector': '.searchresult h3',
+        'snippet_selector': '.searchresult p',
+        'ttl': 3600
+    },
+    # 'justice.gov.uk': {
+    #     'base_url': 'https://www.justice.gov.uk',
+    #     'search_url': 'https://www.justice.gov.uk/search?q={query}',
+    #     'title_selector': 'h3.result-title',
+    #     'snippet_selector': '.result-summary'
+    # },
+    'bailii.org': {
+        'base_url': 'https://www.bailii.org',
+        'search_url': 'https://www.bailii.org/cgi-bin/lucy_search_1.cgi?query={query}',
+        'title_selector': 'h3 a',
+        'snippet_selector': '.case-summary',
+        'ttl': 21600,
+        'hedge': True,
+        # Single CGI backend; keep our fan-out to it small
+        'max_concurrency': 2,
+        'rate_limit': 2
+    },
+    'lawsociety.org.uk': {
+        'base_url': 'https://www.lawsociety.org.uk',
+        'search_url': 'https://www.lawsociety.org.uk/search?q={query}',
+        'title_selector': '.search-result h3',
+        'snippet_selector': '.search-result-summary',
+        'ttl': 21600
+    },
+    'citizensadvice.org.uk': {
+        'base_url': 'https://www.citizensadvice.org.uk',
+        'search_url': 'https://www.citizensadvice.org.uk/search/?q={query}',
+        'title_selector': '.search-result__title',
+        'snippet_selector': '.search-result__summary',
+        'ttl': 21600
+    }
+}
+
+# Comprehensive legislation feed URLs with descriptions and refresh TTLs (seconds)
+DEFAULT_FEEDS = {
+    'all_legislation': {
+        'url': 'https://www.legislation.gov.uk/new/data.feed',
+        'description': 'All UK Legislation',
+        'ttl': 900
+    },
+    'uk_public_general_acts': {
+        'url': 'https://www.legislation.gov.uk/new/ukpga/data.feed',
+        'description': 'UK Public General Acts',
+        'ttl': 3600
+    },
+    'uk_ministerial_directions': {
+        'url': 'https://www.legislation.gov.uk/new/ukmd/data.feed',
+        'description': 'UK Ministerial Directions',
+        'ttl': 3600
+    },
+    'northern_ireland_acts': {
+        'url': 'https://www.legislation.gov.uk/new/nia/data.feed',
+        'description': 'Northern Ireland Acts',
+        'ttl': 3600
+    },
+    'northern_ireland_orders': {
+        'url': 'https://www.legislation.gov.uk/new/nisi/data.feed',
+        'description': 'Northern Ireland Orders in Council',
+        'ttl': 3600
+    },
+    'northern_ireland_statutory_rules': {
+        'url': 'https://www.legislation.gov.uk/new/nisr/data.feed',
+        'description': 'Northern Ireland Statutory Rules',
+        'ttl': 3600
+    },
+    'scotland_acts': {
+        'url': 'https://www.legislation.gov.uk/new/asp/data.feed',
+        'description': 'Acts of the Scottish Parliament',
+        'ttl': 3600
+    },
+    'scotland_statutory_instruments': {
+        'url': 'https://www.legislation.gov.uk/new/ssi/data.feed',
+        'description': 'Scottish Statutory Instruments',
+        'ttl': 3600
+    },
+    'wales_acts': {
+        'url': 'https://www.legislation.gov.uk/new/asc/data.feed',
+        'description': 'Acts of Senedd Cymru',
+        'ttl': 3600
+    },
+    'wales_statutory_instruments': {
+        'url': 'https://www.legislation.gov.uk/new/wsi/data.feed',
+        'description': 'Welsh Statutory Instruments',
+        'ttl': 3600
+    }
+}
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` requests per second with bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self):
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class SourcePlugin:
+    """
+    One search source: how to build its search URL, what to extract from the
+    results page and how hard we may hit it.
+
+    Subclasses can override `build_url` or `build_results` for sources that
+    don't fit the template + selector model; name them in config with
+    `plugin: "package.module:ClassName"`. Extra config keys a subclass reads
+    from `self.options` go in `extra_options`; any other unknown key (e.g. a
+    misspelt `tll`) is rejected rather than silently ignored.
+    """
+
+    extra_options = ()
+
+    def __init__(self, key: str, base_url: str, search_url: str, title_selector: str = None,
+                 snippet_selector: str = None, content_selector: str = None, ttl: float = None,
+                 max_results: int = 3, max_concurrency: int = 4, rate_limit: float = None, burst: float = None,
+                 timeout: float = 10.0, attempts: int = 2, hedge: bool = False, **options):
+        if not (title_selector or content_selector):
+            raise ValueError(f"Source {key} needs a title_selector")
+        unknown = sorted(set(options) - set(self.extra_options))
+        if unknown:
+            raise ValueError(f"Source {key} has unknown option(s): {', '.join(unknown)}")
+        self.key = key
+        self.base_url = base_url
+        self.search_url = search_url
+        self.ttl = ttl
+        self.max_results = max_results
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.attempts = attempts
+        self.hedge = hedge
+        self.options = options
+
+        # Extractors are compiled once; the legacy single 'content_selector' is
+        # treated as titles only
+        self.title_selector = title_selector or content_selector
+        self.snippet_selector = snippet_selector
+        self.fields = {'title': compile_selector(self.title_selector)}
+        if snippet_selector:
+            self.fields['snippet'] = compile_selector(snippet_selector)
+        self.extraction_limit = max_results * len(self.fields)
+
+        self.rate_limiter = RateLimiter(rate_limit, burst) if rate_limit else None
+        self._semaphores = weakref.WeakKeyDictionary()  # loop -> asyncio.Semaphore
+        self._lock = threading.Lock()
+
+    @property
+    def content_selector(self) -> str:
+        """Every selector this source extracts, as one CSS group"""
+        return ", ".join(filter(None, (self.title_selector, self.snippet_selector)))
+
+    def build_url(self, query: str) -> str:
+        return self.search_url.format(query=quote_plus(query))
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._semaphores[loop] = semaphore
+            return semaphore
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of this source's concurrent request slots, respecting its rate limit"""
+        async with self._semaphore():
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            yield
+
+    def build_results(self, matches: List[Dict], page_url: str) -> List[Dict]:
+        """
+        Turn extracted matches into context items. A snippet is attached to the
+        title before it; titles without any link point back at the results page.
+        """
+        results = []
+        current = None  # the result a following snippet belongs to
+        for match in matches:
+            text = match['text']
+            if match['field'] == 'snippet':
+                if current is not None and text:
+                    current['snippet'] = text
+                    current = None
+                continue
+            current = None
+            if not text or "search" in text.lower() or len(results) >= self.max_results:
+                continue
+            link = match.get('link')
+            current = {
+                "site": self.key,
+                "title": text,
+                "url": urljoin(self.base_url, link) if link else f"{page_url}#result-{len(results) + 1}",
+                "snippet": text
+            }
+            results.append(current)
+        return results
+
+
+def _load_class(path: str):
+    module_name, _, class_name = path.partition(":")
+    cls = getattr(importlib.import_module(module_name), class_name)
+    if not (isinstance(cls, type) and issubclass(cls, SourcePlugin)):
+        raise ValueError(f"{path} is not a SourcePlugin")
+    return cls
+
+
+class SourceRegistry:
+    """Search source plugins and legislation feed configs, keyed by name"""
+
+    def __init__(self, sources: Dict[str, SourcePlugin] = None, feeds: Dict[str, dict] = None):
+        self.sources = dict(sources or {})
+        self.feeds = dict(feeds or {})
+
+    def register(self, plugin: SourcePlugin):
+        self.sources[plugin.key] = plugin
+        return plugin
+
+    def unregister(self, key: str):
+        self.sources.pop(key, None)
+
+    def get(self, key: str) -> Optional[SourcePlugin]:
+        return self.sources.get(key)
+
+    def __contains__(self, key):
+        return key in self.sources
+
+    def __iter__(self):
+        return iter(self.sources.values())
+
+    def __len__(self):
+        return len(self.sources)
+
+    @classmethod
+    def from_config(cls, config: dict = None):
+        """
+        Build a registry from the defaults overlaid with `config`:
+
+            sources:
+              bailii.org: {max_concurrency: 1}       # override fields of a built-in source
+              citizensadvice.org.uk: {enabled: false}
+              example.org: {base_url: ..., search_url: ..., title_selector: ...}
+            feeds:
+              wales_acts: {ttl: 7200}
+
+        With `replace_defaults: true` only the configured sources and feeds are used.
+        """
+        config = config or {}
+        replace = config.get('replace_defaults', False)
+        registry = cls()
+
+        source_configs = {} if replace else {key: dict(value) for key, value in DEFAULT_SOURCES.items()}
+        for key, overrides in (config.get('sources') or {}).items():
+            source_configs.setdefault(key, {}).update(overrides or {})
+        for key, source_config in source_configs.items():
+            if not source_config.pop('enabled', True):
+                continue
+            plugin_class = _load_class(source_config.pop('plugin')) if 'plugin' in source_config else SourcePlugin
+            registry.register(plugin_class(key, **source_config))
+
+        feed_configs = {} if replace else {key: dict(value) for key, value in DEFAULT_FEEDS.items()}
+        for key, overrides in (config.get('feeds') or {}).items():
+            feed_configs.setdefault(key, {}).update(overrides or {})
+        registry.feeds = {
+            key: feed_config for key, feed_config in feed_configs.items()
+            if feed_config.pop('enabled', True)
+        }
+        return registry
+
+
+def load_config(path: str) -> dict:
+    """Read a JSON or YAML (.yaml / .yml) source config file"""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            return yaml.safe_load(f) or {}
+        return json.load(f)
+
+
+def load_source_registry(path: str = None) -> SourceRegistry:
+    """Registry from SOURCES_CONFIG (if set) on top of the built-in sources"""
+    path = path or os.getenv("SOURCES_CONFIG")
+    config = load_config(path) if path else {}
+    registry = SourceRegistry.from_config(config)
+    if path:
+        print(f"Loaded {len(registry)} search sources and {len(registry.feeds)} feeds from {path}")
+    return registry
@@ -0,0 +1,160 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import (
+    Boolean, Column, DateTime, Index, Integer, MetaData, String, Table, Text,
+    create_engine, event, insert, select, tuple_, update
+)
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+from .concurrency import run_blocking
+from .session_store import SessionStore
+from .shared_state import configure_sqlite
+
+metadata = MetaData()
+
+sessions_table = Table(
+    'chat_sessions', metadata,
+    Column('id', String(36), primary_key=True),
+    Column('user_id', String(255), nullable=False),
+    Column('title', String(255), nullable=False),
+    Column('created_at', DateTime, nullable=False),
+    Column('updated_at', DateTime, nullable=False),
+    Column('is_active', Boolean, nullable=False, default=True),
+    Column('summary', Text, nullable=True),
+    Column('summary_upto', String(36), nullable=True),
+    Index('ix_chat_sessions_user_updated', 'user_id', 'updated_at')
+)
+
+messages_table = Table(
+    'chat_messages', metadata,
+    # seq breaks created_at ties so a user/assistant pair written together keeps its order
+    Column('seq', Integer, primary_key=True, autoincrement=True),
+    Column('id', String(36), nullable=False, unique=True),
+    Column('session_id', String(36), nullable=False),
+    Column('role', String(16), nullable=False),
+    Column('content', Text, nullable=False),
+    Column('created_at', DateTime, nullable=False),
+    Index('ix_chat_messages_session_created', 'session_id', 'created_at')
+)
+
+_SESSION_COLUMNS = [
+    sessions_table.c[name]
+    for name in ('id', 'user_id', 'title', 'created_at', 'updated_at', 'is_active', 'summary', 'summary_upto')
+]
+_MESSAGE_COLUMNS = [messages_table.c[name] for name in ('id', 'session_id', 'role', 'content', 'created_at')]
+
+
+class SQLSessionStore(SessionStore):
+    """
+    SQLAlchemy-backed storage (SQLite, Postgres, ...).
+
+    Queries run on the bounded blocking executor so they never stall the
+    event loop. Paging is keyset-based on the indexed columns. A SQLite file
+    runs in WAL mode so several worker processes can share it.
+    """
+
+    def __init__(self, url: str, **engine_kwargs):
+        in_memory = url in ('sqlite://', 'sqlite:///:memory:')
+        if url.startswith('sqlite'):
+            engine_kwargs.setdefault('connect_args', {'check_same_thread': False})
+            if in_memory:
+                engine_kwargs.setdefault('poolclass', StaticPool)
+        self.engine = create_engine(url, **engine_kwargs)
+        if url.startswith('sqlite') and not in_memory:
+            event.listen(self.engine, 'connect', lambda connection, record: configure_sqlite(connection))
+        try:
+            metadata.create_all(self.engine)
+        except OperationalError:
+            # Another worker created the tables between the existence check and CREATE
+            metadata.create_all(self.engine)
+
+    def _create_session(self, session):
+        with self.engine.begin() as conn:
+            conn.execute(insert(sessions_table).values(**{c.name: session.get(c.name) for c in _SESSION_COLUMNS}))
+
+    def _get_session(self, session_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(*_SESSION_COLUMNS).where(sessions_table.c.id == session_id)).mappings().first()
+        return dict(row) if row else None
+
+    def _add_messages(self, session_id, messages, updated_at):
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(sessions_table).where(sessions_table.c.id == session_id).values(updated_at=updated_at)
+            )
+            if result.rowcount == 0:
+                return False
+            conn.execute(insert(messages_table), [
+                {
+                    'id': msg['id'],
+                    'session_id': session_id,
+                    'role': msg['role'],
+                    'content': msg['content'],
+                    'created_at': msg['created_at']
+                }
+                for msg in messages
+            ])
+        return True
+
+    def _get_messages(self, session_id, limit, before):
+        query = select(*_MESSAGE_COLUMNS).where(messages_table.c.session_id == session_id)
+        with self.engine.connect() as conn:
+            if before is not None:
+                cursor = conn.execute(
+                    select(messages_table.c.created_at, messages_table.c.seq).where(
+                        messages_table.c.id == before, messages_table.c.session_id == session_id
+                    )
+                ).first()
+                if cursor is None:
+                    return []
+                query = query.where(
+                    tuple_(messages_table.c.created_at, messages_table.c.seq) < tuple_(cursor.created_at, cursor.seq)
+                )
+            query = query.order_by(messages_table.c.created_at.desc(), messages_table.c.seq.desc()).limit(limit)
+            rows = conn.execute(query).mappings().all()
+        return [dict(row) for row in reversed(rows)]
+
+    def _update_summary(self, session_id, summary, summary_upto):
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(sessions_table)
+                .where(sessions_table.c.id == session_id)
+                .values(summary=summary, summary_upto=summary_upto)
+            )
+
+    def _list_sessions(self, user_id, limit, before):
+        query = select(*_SESSION_COLUMNS).where(sessions_table.c.user_id == user_id)
+        with self.engine.connect() as conn:
+            if before is not None:
+                cursor = conn.execute(
+                    select(sessions_table.c.updated_at, sessions_table.c.id).where(sessions_table.c.id == before)
+                ).first()
+                if cursor is None:
+                    return []
+                query = query.where(
+                    tuple_(sessions_table.c.updated_at, sessions_table.c.id) < tuple_(cursor.updated_at, cursor.id)
+                )
+            query = query.order_by(sessions_table.c.updated_at.desc(), sessions_table.c.id.desc()).limit(limit)
+            rows = conn.execute(query).mappings().all()
+        return [dict(row) for row in rows]
+
+    async def create_session(self, session: Dict) -> None:
+        await run_blocking(self._create_session, session)
+
+    async def get_session(self, session_id: str) -> Optional[Dict]:
+        return await run_blocking(self._get_session, session_id)
+
+    async def add_messages(self, session_id: str, messages: List[Dict], updated_at: datetime) -> bool:
+        return await run_blocking(self._add_messages, session_id, messages, updated_at)
+
+    async def get_messages(self, session_id: str, limit: int = 20, before: Optional[str] = None) -> List[Dict]:
+        return await run_blocking(self._get_messages, session_id, limit, before)
+
+    async def update_summary(self, session_id: str, summary: str, summary_upto: str) -> None:
+        await run_blocking(self._update_summary, session_id, summary, summary_upto)
+
+    async def list_sessions(self, user_id: str, limit: int = 50, before: Optional[str] = None) -> List[Dict]:
+        return await run_blocking(self._list_sessions, user_id, limit, before)
+
+    async def close(self) -> None:
+        self.engine.dispose()
@@ -0,0 +1,484 @@
+import heapq
+import itertools
+import json
+import math
+import mmap
+import os
+import re
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict, deque
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_TOKEN_RE = re.compile(r"""
+    (?P<si>\bs\.?\s?i\.?\s*(?P<si_year>\d{4})\s*/\s*(?P<si_num>\d+))
+  | (?P<neutral>\[(?P<n_year>\d{4})\]\s*(?P<n_court>[a-z]+)\s*(?P<n_num>\d+))
+  | (?P<cite>\b(?P<cite_year>\d{4})\s*/\s*(?P<cite_num>\d+))
+  | (?P<prov>\b(?P<prov_kind>sections|section|sec|ss|s|regulations|regulation|regs|reg|article|art|schedule|sch|paragraph|para|rule|r|part|pt)\.?\s*(?P<prov_num>\d+[a-z]?)\b)
+  | (?P<word>[a-z0-9]+)
+""", re.I | re.X)
+
+_PROVISION_PREFIXES = {
+    'sections': 's', 'section': 's', 'sec': 's', 'ss': 's', 's': 's',
+    'regulations': 'reg', 'regulation': 'reg', 'regs': 'reg', 'reg': 'reg',
+    'article': 'art', 'art': 'art',
+    'schedule': 'sch', 'sch': 'sch',
+    'paragraph': 'para', 'para': 'para',
+    'rule': 'r', 'r': 'r',
+    'part': 'pt', 'pt': 'pt'
+}
+
+_STOPWORDS = frozenset("""
+a an and are as at be been but by can could do does for from had has have how i if in into is it its
+me my no not of on or our so such that the their them then there these they this to was we were what
+when where which who will with would you your
+""".split())
+
+
+def _normalise_word(word: str) -> str:
+    # Light plural folding so "tenants" matches "tenant" without a full stemmer
+    if len(word) > 4 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenise text for legal search.
+
+    Citations become single tokens so they match however they are written:
+    "s.21", "s 21" and "section 21" all give "s21"; "SI 2023/123" gives
+    "si2023/123" plus "2023/123"; "[2020] UKSC 12" gives "2020uksc12".
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text or ""):
+        if match.group('si'):
+            citation = f"{match.group('si_year')}/{match.group('si_num')}"
+            tokens.extend((f"si{citation}", citation))
+        elif match.group('neutral'):
+            tokens.append(f"{match.group('n_year')}{match.group('n_court').lower()}{match.group('n_num')}")
+            tokens.append(match.group('n_year'))
+        elif match.group('cite'):
+            tokens.append(f"{match.group('cite_year')}/{match.group('cite_num')}")
+        elif match.group('prov'):
+            prefix = _PROVISION_PREFIXES[match.group('prov_kind').lower()]
+            tokens.append(f"{prefix}{match.group('prov_num').lower()}")
+        else:
+            word = match.group('word').lower()
+            if word not in _STOPWORDS:
+                tokens.append(_normalise_word(word))
+    return tokens
+
+
+def _claim_directory(directory: str):
+    """
+    (path, lock handle) for the first worker-N subdirectory of `directory` no
+    other live process holds. Worker processes sharing one index directory
+    each get their own segments and manifest, and a restarted worker picks up
+    a free slot's index again.
+    """
+    for slot in itertools.count():
+        path = os.path.join(directory, f"worker-{slot}")
+        os.makedirs(path, exist_ok=True)
+        handle = open(os.path.join(path, "lock"), "w")
+        if fcntl is None:
+            return path, handle
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return path, handle
+        except OSError:
+            handle.close()
+
+
+def _document_text(item: Dict) -> str:
+    return f"{item.get('title', '')} {item.get('snippet', '')}"
+
+
+class _Segment:
+    """Immutable on-disk segment; postings are read straight from a memory-mapped file"""
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        base = os.path.join(directory, name)
+        with open(f"{base}.terms.json", encoding="utf-8") as f:
+            self.terms = json.load(f)  # term -> [offset, count] in uint32 units
+        self.docs = []
+        with open(f"{base}.docs.jsonl", encoding="utf-8") as f:
+            for line in f:
+                self.docs.append(json.loads(line))
+        self._file = open(f"{base}.post", "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._ints = memoryview(self._mmap).cast('I') if self._mmap else memoryview(array('I'))
+
+    def postings(self, term: str):
+        entry = self.terms.get(term)
+        if entry is None:
+            return
+        offset, count = entry
+        ints = self._ints
+        for i in range(offset, offset + 2 * count, 2):
+            yield ints[i], ints[i + 1]
+
+    def close(self):
+        self._ints.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    @staticmethod
+    def write(directory: str, name: str, docs: List[Dict], postings: Dict[str, Dict[int, int]]):
+        base = os.path.join(directory, name)
+        terms = {}
+        data = array('I')
+        for term in sorted(postings):
+            entries = postings[term]
+            terms[term] = [len(data), len(entries)]
+            for doc_id in sorted(entries):
+                data.append(doc_id)
+                data.append(entries[doc_id])
+        with open(f"{base}.post", "wb") as f:
+            data.tofile(f)
+        with open(f"{base}.terms.json", "w", encoding="utf-8") as f:
+            json.dump(terms, f)
+        with open(f"{base}.docs.jsonl", "w", encoding="utf-8") as f:
+            for doc in docs:
+                f.write(json.dumps(doc) + "\n")
+
+
+class TextIndex:
+    """
+    Local BM25 inverted index over feed entries and scraped search results.
+
+    New documents go into an in-memory segment that is flushed to an
+    immutable, memory-mapped segment on disk once it grows past
+    `flush_threshold` documents (and on close). Deletes of flushed documents
+    are tombstones until segments are compacted. Without a directory the
+    index is memory only; with one, the index lives in a worker-N
+    subdirectory locked by this process, so several workers can be pointed
+    at the same directory.
+
+    Documents added with a `ttl` stop matching once it passes and are
+    dropped by the next `add`; past `max_docs` the oldest documents are
+    evicted. Documents are only ever dropped on the thread calling `add`,
+    `delete` or `purge_expired`, which then runs the `listeners`. `add` never writes to disk: callers flush when `needs_flush`
+    says so, and may do that from a worker thread.
+    """
+
+    def __init__(self, directory: Optional[str] = None, flush_threshold: int = 500,
+                 max_segments: int = 8, max_docs: Optional[int] = None, k1: float = 1.2, b: float = 0.75):
+        self.directory = None
+        self._slot_lock = None
+        self.flush_threshold = flush_threshold
+        self.max_segments = max_segments
+        self.max_docs = max_docs
+        self.k1 = k1
+        self.b = b
+        self.next_id = 0
+        self.docs = {}  # doc_id -> {"key", "len", "item"} for every live document
+        self.keys = {}  # key (url) -> doc_id
+        self.total_length = 0
+        self.tombstones = set()
+        self.segments: List[_Segment] = []
+        self._live_postings = defaultdict(dict)  # term -> {doc_id: tf}
+        self._live_terms = {}  # doc_id -> Counter, for deletes before flush
+        self._sealed_postings = {}  # live postings while a flush is writing them out
+        self._order = deque()  # doc ids oldest first, for eviction past max_docs
+        self._expiry = []  # heap of (expires, doc_id); entries for renewed or deleted docs are skipped
+        self._dropped = []  # keys removed since listeners were last told
+        self.listeners = []  # callables (keys) run when documents expire, are evicted, replaced or deleted
+        self._manifest_dirty = False
+        self._lock = threading.RLock()  # index state
+        self._flush_lock = threading.RLock()  # one flush or compaction at a time
+        if directory:
+            self.directory, self._slot_lock = _claim_directory(directory)
+            self._load()
+
+    # -- persistence -----------------------------------------------------
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, "manifest.json")
+
+    def _load(self):
+        if not os.path.exists(self._manifest_path()):
+            return
+        with open(self._manifest_path(), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.next_id = manifest["next_id"]
+        self.tombstones = set(manifest["tombstones"])
+        for name in manifest["segments"]:
+            segment = _Segment(self.directory, name)
+            self.segments.append(segment)
+            for doc in segment.docs:
+                if doc["id"] in self.tombstones:
+                    continue
+                self.docs[doc["id"]] = doc
+                self.keys[doc["key"]] = doc["id"]
+                self.total_length += doc["len"]
+        self._order.extend(self.docs)
+        self._expiry = [(doc["expires"], doc_id) for doc_id, doc in self.docs.items() if "expires" in doc]
+        heapq.heapify(self._expiry)
+
+    def _manifest(self):
+        return {
+            "next_id": self.next_id,
+            "segments": [segment.name for segment in self.segments],
+            "tombstones": sorted(self.tombstones)
+        }
+
+    def _write_manifest(self, manifest):
+        path = self._manifest_path()
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+
+    @property
+    def needs_flush(self) -> bool:
+        """True once the in-memory segment has grown past `flush_threshold` documents"""
+        return bool(self.directory) and len(self._live_terms) >= self.flush_threshold
+
+    def flush(self):
+        """
+        Write the in-memory segment to disk (no-op for memory-only indexes).
+        Searches and updates don't wait for the file writes, so this can run
+        on a worker thread.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self.directory or not (self._live_terms or self._manifest_dirty):
+                    return
+                name = f"seg-{self.next_id:010d}"
+                docs = [self.docs[doc_id] for doc_id in sorted(self._live_terms)]
+                # Sealed postings stay searchable until the segment replaces them
+                postings = self._sealed_postings = self._live_postings
+                self._live_postings = defaultdict(dict)
+                self._live_terms = {}
+            segment = None
+            if docs:
+                _Segment.write(self.directory, name, docs, postings)
+                segment = _Segment(self.directory, name)
+            with self._lock:
+                if segment is not None:
+                    self.segments.append(segment)
+                self._sealed_postings = {}
+                compact = len(self.segments) > self.max_segments or len(self.tombstones) > len(self.docs)
+                manifest = None if compact else self._manifest()
+                self._manifest_dirty = False
+            if compact:
+                self.compact()
+            else:
+                self._write_manifest(manifest)
+
+    def compact(self):
+        """Merge all segments into one, dropping tombstoned documents"""
+        if not self.directory:
+            return
+        with self._flush_lock:
+            with self._lock:
+                docs = [doc for doc_id, doc in sorted(self.docs.items()) if doc_id not in self._live_terms]
+                old_segments = self.segments
+                names = {segment.name for segment in old_segments}
+                name = next(
+                    name for name in (f"seg-{self.next_id:010d}-c{n}" for n in itertools.count())
+                    if name not in names
+                )
+            postings = defaultdict(dict)
+            for doc in docs:
+                for term, tf in Counter(tokenize(_document_text(doc["item"]))).items():
+                    postings[term][doc["id"]] = tf
+            _Segment.write(self.directory, name, docs, postings)
+            segment = _Segment(self.directory, name)
+            with self._lock:
+                self.segments = [segment]
+                # Documents deleted while the merged segment was being written
+                self.tombstones = {doc["id"] for doc in docs} - self.docs.keys()
+                manifest = self._manifest()
+                self._manifest_dirty = False
+            self._write_manifest(manifest)
+            for old in old_segments:
+                old.close()
+                for suffix in (".post", ".terms.json", ".docs.jsonl"):
+                    os.remove(os.path.join(self.directory, old.name + suffix))
+
+    def close(self):
+        self.flush()
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        if self._slot_lock is not None:
+            self._slot_lock.close()
+            self._slot_lock = None
+
+    # -- updates ---------------------------------------------------------
+
+    def add(self, item: Dict, key: Optional[str] = None, ttl: Optional[float] = None) -> Optional[int]:
+        """Index an item (replacing any previous version with the same key/url), expiring after `ttl` seconds"""
+        key = key or item.get("url")
+        if not key or key == "N/A":
+            return None
+        terms = Counter(tokenize(_document_text(item)))
+        if not terms:
+            return None
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            doc_id = self._insert(key, item, terms, expires)
+        self._notify()
+        return doc_id
+
+    def _insert(self, key: str, item: Dict, terms: Counter, expires: Optional[float]) -> int:
+        existing = self.keys.get(key)
+        if existing is not None:
+            doc = self.docs[existing]
+            if doc["item"] == item:
+                if expires is None:
+                    doc.pop("expires", None)
+                else:
+                    doc["expires"] = expires
+                    heapq.heappush(self._expiry, (expires, existing))
+                self._purge_expired()
+                return existing
+            self._remove(key)
+
+        doc_id = self.next_id
+        self.next_id += 1
+        length = sum(terms.values())
+        self.docs[doc_id] = {"id": doc_id, "key": key, "len": length, "item": dict(item)}
+        if expires is not None:
+            self.docs[doc_id]["expires"] = expires
+            heapq.heappush(self._expiry, (expires, doc_id))
+        self.keys[key] = doc_id
+        self.total_length += length
+        self._live_terms[doc_id] = terms
+        for term, tf in terms.items():
+            self._live_postings[term][doc_id] = tf
+
+        self._purge_expired()
+        if self.max_docs is not None:
+            self._order.append(doc_id)
+            while len(self.docs) > self.max_docs:
+                oldest = self._order.popleft()
+                if oldest in self.docs:
+                    self._remove(self.docs[oldest]["key"])
+            if len(self._order) > 2 * len(self.docs) + 64:
+                # Drop ids of replaced and deleted documents
+                self._order = deque(doc_id for doc_id in self._order if doc_id in self.docs)
+        return doc_id
+
+    def add_items(self, items: List[Dict], ttl: Optional[float] = None):
+        for item in items:
+            self.add(item, ttl=ttl)
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            removed = self._remove(key)
+        self._notify()
+        return removed
+
+    def purge_expired(self):
+        """Drop documents whose TTL has passed (add does this too)"""
+        with self._lock:
+            self._purge_expired()
+        self._notify()
+
+    def _remove(self, key: str) -> bool:
+        doc_id = self.keys.pop(key, None)
+        if doc_id is None:
+            return False
+        doc = self.docs.pop(doc_id)
+        self.total_length -= doc["len"]
+        terms = self._live_terms.pop(doc_id, None)
+        if terms is not None:
+            for term in terms:
+                postings = self._live_postings[term]
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._live_postings[term]
+        else:
+            # Persisted with the next flush
+            self.tombstones.add(doc_id)
+            self._manifest_dirty = True
+        self._dropped.append(key)
+        return True
+
+    def _notify(self):
+        with self._lock:
+            dropped, self._dropped = self._dropped, []
+        if dropped:
+            for listener in self.listeners:
+                listener(dropped)
+
+    def _purge_expired(self):
+        now = time.time()
+        expiry = self._expiry
+        while expiry and expiry[0][0] < now:
+            expires, doc_id = heapq.heappop(expiry)
+            doc = self.docs.get(doc_id)
+            if doc is not None and doc.get("expires") == expires:
+                self._remove(doc["key"])
+        if len(expiry) > 2 * len(self.docs) + 64:
+            # Drop entries of renewed, replaced and deleted documents
+            self._expiry = [
+                (expires, doc_id) for expires, doc_id in expiry
+                if self.docs.get(doc_id, {}).get("expires") == expires
+            ]
+            heapq.heapify(self._expiry)
+
+    def __len__(self):
+        return len(self.docs)
+
+    # -- search ----------------------------------------------------------
+
+    def _postings(self, term: str):
+        live = self._live_postings.get(term)
+        if live:
+            yield from live.items()
+        sealed = self._sealed_postings.get(term)
+        if sealed:
+            yield from sealed.items()
+        for segment in self.segments:
+            yield from segment.postings(term)
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[float, float, Dict]]:
+        """
+        BM25 search.
+
+        Returns (score, coverage, item) tuples, best first, where coverage is
+        the fraction of distinct query terms the document contains. Expired
+        documents never match.
+        """
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            if not query_terms or not self.docs:
+                return []
+            docs = self.docs
+            n_docs = len(docs)
+            avg_length = self.total_length / n_docs
+            now = time.time()
+            scores = defaultdict(float)
+            matched = defaultdict(int)
+            k1, b = self.k1, self.b
+
+            for term in query_terms:
+                postings = [
+                    (doc_id, tf) for doc_id, tf in self._postings(term)
+                    if doc_id in docs and docs[doc_id].get("expires", now) >= now
+                ]
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings:
+                    length = docs[doc_id]["len"]
+                    scores[doc_id] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+                    matched[doc_id] += 1
+
+            ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))[:limit]
+            return [
+                (score, matched[doc_id] / len(query_terms), dict(docs[doc_id]["item"]))
+                for doc_id, score in ranked
+            ]
@@ -0,0 +1,287 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# Seconds; covers sub-millisecond cache hits up to slow model calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label set"""
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels tuple -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Tuple[Tuple[str, str], ...] = ()):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(labels, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {round(series[-2], 6)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Histograms plus collector callbacks rendered in the Prometheus text format.
+
+    A collector returns (name, type, help, labels, value) samples read from
+    existing counters (cache stats, breaker state, ...) at scrape time.
+    """
+
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(name, help, buckets)
+            return histogram
+
+    def add_collector(self, collector: Callable[[], Iterable[tuple]]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for histogram in list(self.histograms.values()):
+            lines.extend(histogram.render())
+        families = {}
+        for collector in self.collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, help, labels, value in samples:
+                if value is None:
+                    continue
+                family = families.setdefault(name, (kind, help, []))
+                family[2].append((tuple(sorted(labels.items())), value))
+        for name, (kind, help, samples) in families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    __slots__ = ("name", "labels", "attrs", "trace_id", "span_id", "parent_id", "start", "duration", "error")
+
+    def __init__(self, name: str, labels: dict, parent: Optional["Span"]):
+        self.name = name
+        self.labels = labels
+        self.attrs = {}
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = time.time()
+        self.duration = 0.0
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "labels": self.labels,
+            "attrs": self.attrs,
+            "error": self.error
+        }
+
+
+class _NoopSpan:
+    """Returned when tracing is disabled: entering, setting and exiting do nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class _SpanScope:
+    __slots__ = ("tracer", "span", "token", "started")
+
+    def __init__(self, tracer, name, labels):
+        self.tracer = tracer
+        self.span = Span(name, labels, _current_span.get())
+
+    def __enter__(self):
+        self.token = _current_span.set(self.span)
+        self.started = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.duration = time.perf_counter() - self.started
+        if exc_type is not None:
+            span.error = exc_type.__name__
+        try:
+            _current_span.reset(self.token)
+        except ValueError:
+            # Exited in a different context (e.g. a generator closed elsewhere)
+            pass
+        self.tracer.finish(span)
+        return False
+
+
+def _series_labels(name: str, labels: dict):
+    return (("span", name),) + tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Tracer:
+    """
+    Spans with parent/child links carried in a context variable, so spans
+    opened in tasks created inside a span become its children.
+
+    Every finished span is observed in the `lexley_span_duration_seconds`
+    histogram, labelled with the span name and its (low-cardinality) labels.
+    With `export_path` set, finished spans are also appended to that file as
+    JSON lines, written in batches when a root span ends. When disabled,
+    `span()` returns a shared no-op object.
+    """
+
+    def __init__(self, enabled: bool = True, export_path: str = None, metrics: MetricsRegistry = None):
+        self.enabled = enabled
+        self.export_path = export_path
+        self.metrics = metrics or MetricsRegistry()
+        self.durations = self.metrics.histogram(
+            "lexley_span_duration_seconds", "Duration of traced operations in seconds"
+        )
+        self._buffer = []  # finished spans not yet written to export_path
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.getenv("TRACING_ENABLED", "1").lower() not in ("0", "false", "no", "off"),
+            export_path=os.getenv("TRACE_EXPORT_PATH") or None
+        )
+
+    def span(self, name: str, **labels):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _SpanScope(self, name, labels)
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Record a duration measured elsewhere (e.g. across an async generator's lifetime)"""
+        if self.enabled:
+            self.durations.observe(seconds, _series_labels(name, labels))
+
+    def current_trace_id(self) -> Optional[str]:
+        span = _current_span.get()
+        return span.trace_id if span is not None else None
+
+    def finish(self, span: Span):
+        self.durations.observe(span.duration, _series_labels(span.name, span.labels))
+        if not self.export_path:
+            return
+        with self._lock:
+            self._buffer.append(span.to_dict())
+            if span.parent_id is not None and len(self._buffer) < 256:
+                return
+            spans, self._buffer = self._buffer, []
+        try:
+            with open(self.export_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(item) + "\n" for item in spans))
+        except OSError as e:
+            print(f"Could not export traces: {e}")
+
+
+tracer = Tracer.from_env()
+
+
+def traced(name: str, **labels):
+    """
+    Decorator wrapping a sync or async function in a span. Label values given
+    as "{arg}" are taken from the call's arguments, e.g.
+    @traced("feed_store.refresh", feed="{feed_key}").
+    """
+    dynamic = {label: value[1:-1] for label, value in labels.items() if isinstance(value, str) and value.startswith("{")}
+    static = {label: value for label, value in labels.items() if label not in dynamic}
+
+    def decorate(fn):
+        signature = inspect.signature(fn) if dynamic else None
+
+        def resolve(args, kwargs):
+            if not dynamic:
+                return static
+            bound = signature.bind_partial(*args, **kwargs)
+            return {**static, **{label: str(bound.arguments.get(arg)) for label, arg in dynamic.items()}}
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await fn(*args, **kwargs)
+                with tracer.span(name, **resolve(args, kwargs)):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return fn(*args, **kwargs)
+            with tracer.span(name, **resolve(args, kwargs)):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorate
@@ -0,0 +1,119 @@
+"""
+Concurrent load test for /api/chat.
+
+Fires N chats at once through the real FastAPI app and Chatbot, with
+retrieval and the OpenAI API replaced by local stand-ins that sleep for a
+fixed latency. If the handler blocks the event loop the wall time grows
+with N * latency; on the async path it stays close to a single latency.
+/health is probed while the chats are in flight to show it is not stalled.
+
+    python -m benchmarks.chat_load --concurrency 20 --latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-load-test")
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.server import app
+from app.services.chatbot import Chatbot
+from app.services.session_manager import SessionManager
+
+
+class SlowRetriever:
+    """Stand-in for Retriever with a fixed upstream latency"""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def afetch_context_for_query(self, query):
+        await asyncio.sleep(self.latency)
+        return [{"site": "gov.uk", "title": "Eviction guidance", "url": "https://www.gov.uk/evicting-tenants", "snippet": "..."}]
+
+
+def fake_openai_transport(latency):
+    async def handler(request):
+        if request.url.path.endswith("/embeddings"):
+            inputs = json.loads(request.content)["input"]
+            return httpx.Response(200, json={
+                "object": "list",
+                "model": "text-embedding-3-small",
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": [float((hash(text) >> k) & 1) for k in range(16)]}
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": 1, "total_tokens": 1}
+            })
+        await asyncio.sleep(latency)
+        return httpx.Response(200, json={
+            "id": "chatcmpl-load",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "gpt-4",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "Stub answer."}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+        })
+    return httpx.MockTransport(handler)
+
+
+async def run(concurrency, latency):
+    chatbot = Chatbot(api_key="sk-load-test", retriever=SlowRetriever(latency))
+    chatbot.async_client = AsyncOpenAI(
+        api_key="sk-load-test",
+        http_client=httpx.AsyncClient(transport=fake_openai_transport(latency))
+    )
+    chatbot.reranker.index.embedder.async_client = chatbot.async_client
+    app.state.chatbot = chatbot
+    app.state.session_manager = SessionManager()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        async def chat(i):
+            started = time.perf_counter()
+            response = await client.post("/api/chat", json={"message": f"Can my landlord evict me? #{i}"})
+            response.raise_for_status()
+            return time.perf_counter() - started
+
+        async def probe_health():
+            await asyncio.sleep(latency / 2)
+            started = time.perf_counter()
+            response = await client.get("/health")
+            response.raise_for_status()
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = await asyncio.gather(probe_health(), *(chat(i) for i in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    health_latency, chat_latencies = results[0], results[1:]
+    serial_estimate = concurrency * 2 * latency
+    return {
+        "concurrency": concurrency,
+        "per_chat_upstream_latency_s": 2 * latency,
+        "wall_time_s": round(wall, 3),
+        "serialised_estimate_s": round(serial_estimate, 3),
+        "speedup_vs_serial": round(serial_estimate / wall, 1),
+        "max_chat_latency_s": round(max(chat_latencies), 3),
+        "health_latency_under_load_s": round(health_latency, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5,
+                        help="seconds of simulated latency for retrieval and for the LLM call")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.concurrency, args.latency)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
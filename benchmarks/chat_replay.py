@@ -0,0 +1,425 @@
+"""
+Offline replay benchmark for the full chat pipeline.
+
+Replays a query corpus through /api/chat and /api/chat/stream on the real
+FastAPI app, Chatbot and Retriever, with nothing leaving the process:
+
+  - the five search sites serve the synthetic result pages in
+    benchmarks/fixtures (see benchmarks/extraction_bench.py)
+  - the legislation feeds serve generated Atom feeds
+  - the OpenAI API (chat, streaming and embeddings) is a local stand-in
+
+The corpus is JSON lines with a `message` (or `query` / `title`) field and
+an optional `session` label; messages sharing a label are sent in order as
+one conversation. Latency and failure rates of every stand-in are
+configurable and seeded, so runs are reproducible.
+
+The report has throughput, p50/p95/p99 latency, time to first token (stream
+phase) and peak RSS per phase. --save-baseline stores it; later runs are
+compared against the stored baseline and regressions beyond --tolerance are
+listed (and fail the run with --fail-on-regression).
+
+    python -m benchmarks.chat_replay --concurrency 8
+    python -m benchmarks.chat_replay --corpus requests.jsonl --repeat 3
+    python -m benchmarks.chat_replay --save-baseline
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-replay")
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.server import app
+from app.services.admission import AdmissionController
+from app.services.chatbot import Chatbot
+from app.services.http_client import HttpClientPool
+from app.services.retriever import Retriever
+from app.services.session_manager import SessionManager
+from app.services.sources import load_source_registry
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, "fixtures")
+DEFAULT_CORPUS = os.path.join(FIXTURES, "queries.jsonl")
+DEFAULT_BASELINE = os.path.join(HERE, "baselines", "chat_replay.json")
+
+WORDS = ("tenant landlord eviction notice deposit rent possession housing employment dismissal wages "
+         "redundancy tribunal consumer refund contract repair council order regulations act").split()
+
+
+def load_corpus(path):
+    """List of conversations, each a list of messages sent in order"""
+    conversations = {}
+    with open(path, encoding="utf-8") as f:
+        for index, line in enumerate(f):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            message = row.get("message") or row.get("query") or row.get("title")
+            if message:
+                conversations.setdefault(row.get("session") or f"_single{index}", []).append(message)
+    return list(conversations.values())
+
+
+def atom_feed(feed_key, rng, count=20):
+    entries = []
+    for i in range(count):
+        title = " ".join(rng.choice(WORDS) for _ in range(5)).capitalize()
+        summary = " ".join(rng.choice(WORDS) for _ in range(30))
+        entries.append(
+            f"<entry><title>{title} Regulations 2025</title>"
+            f"<link href=\"https://www.legislation.gov.uk/{feed_key}/2025/{i}\"/>"
+            f"<id>https://www.legislation.gov.uk/{feed_key}/2025/{i}</id>"
+            f"<updated>2025-01-01T00:00:00Z</updated><summary>{summary}</summary></entry>"
+        )
+    return (
+        "<?xml version=\"1.0\" encoding=\"UTF-8\"?><feed xmlns=\"http://www.w3.org/2005/Atom\">"
+        f"<title>{feed_key}</title><id>{feed_key}</id><updated>2025-01-01T00:00:00Z</updated>"
+        + "".join(entries) + "</feed>"
+    ).encode("utf-8")
+
+
+def fake_embedding(text, dims=64):
+    vector = [0.0] * dims
+    for word in text.lower().split():
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % dims] += 1.0
+    return vector
+
+
+class Upstreams:
+    """Local stand-ins for the search sites, legislation feeds and OpenAI API"""
+
+    def __init__(self, args):
+        self.args = args
+        self.seen = Counter()
+        self.calls = Counter()
+        self.pages = {}
+        for source in load_source_registry():
+            path = os.path.join(FIXTURES, f"{source.key}.html")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    self.pages[urlparse(source.base_url).netloc] = f.read()
+        self.feeds = {}
+
+    def _rng(self, key):
+        """
+        Random source for one upstream request, seeded by the request itself (and
+        how often it was seen) so injected latency and failures don't depend on
+        the order concurrent requests happen to arrive in
+        """
+        self.seen[key] += 1
+        return random.Random(f"{self.args.seed}:{key}:{self.seen[key]}")
+
+    @staticmethod
+    def _delay(rng, latency):
+        return latency * rng.uniform(0.5, 1.5) if latency else 0.0
+
+    async def sites(self, request):
+        host, path = request.url.host, request.url.path
+        rng = self._rng(str(request.url))
+        if path.endswith("data.feed"):
+            self.calls["feed"] += 1
+            await asyncio.sleep(self._delay(rng, self.args.feed_latency))
+            if path not in self.feeds:
+                self.feeds[path] = atom_feed(path.strip("/").replace("/", "_"), random.Random(path))
+            return httpx.Response(200, content=self.feeds[path], headers={"content-type": "application/atom+xml"})
+
+        self.calls[f"site:{host}"] += 1
+        await asyncio.sleep(self._delay(rng, self.args.site_latency))
+        if rng.random() < self.args.site_failure_rate or host not in self.pages:
+            return httpx.Response(503)
+        return httpx.Response(200, content=self.pages[host], headers={"content-type": "text/html; charset=utf-8"})
+
+    async def openai(self, request):
+        body = json.loads(request.content)
+        rng = self._rng(hashlib.md5(request.content).hexdigest())
+        if request.url.path.endswith("/embeddings"):
+            self.calls["embeddings"] += 1
+            await asyncio.sleep(self._delay(rng, self.args.embed_latency))
+            return httpx.Response(200, json={
+                "object": "list",
+                "model": body["model"],
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": fake_embedding(text)}
+                    for i, text in enumerate(body["input"])
+                ],
+                "usage": {"prompt_tokens": 1, "total_tokens": 1}
+            })
+
+        self.calls[f"llm:{body['model']}"] += 1
+        if rng.random() < self.args.llm_failure_rate:
+            await asyncio.sleep(self._delay(rng, self.args.llm_ttft))
+            return httpx.Response(500, json={"error": {"message": "injected failure", "type": "server_error"}})
+        words = [rng.choice(WORDS) for _ in range(self.args.answer_tokens)]
+        usage = {"prompt_tokens": 800, "completion_tokens": len(words), "total_tokens": 800 + len(words)}
+
+        if not body.get("stream"):
+            await asyncio.sleep(self._delay(rng, self.args.llm_ttft) + self.args.token_delay * len(words))
+            return httpx.Response(200, json={
+                "id": "chatcmpl-replay", "object": "chat.completion", "created": int(time.time()),
+                "model": body["model"], "usage": usage,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(words)}}]
+            })
+
+        ttft = self._delay(rng, self.args.llm_ttft)
+        token_delay = self.args.token_delay
+
+        async def chunks():
+            await asyncio.sleep(ttft)
+            for word in words:
+                chunk = {"id": "chatcmpl-replay", "object": "chat.completion.chunk", "created": 0,
+                         "model": body["model"], "choices": [{"index": 0, "delta": {"content": word + " "}}]}
+                yield f"data: {json.dumps(chunk)}\n\n".encode()
+                await asyncio.sleep(token_delay)
+            final = {"id": "chatcmpl-replay", "object": "chat.completion.chunk", "created": 0,
+                     "model": body["model"], "choices": [], "usage": usage}
+            yield f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode()
+
+        return httpx.Response(200, content=chunks(), headers={"content-type": "text/event-stream"})
+
+
+def build_services(upstreams, index_dir):
+    retriever = Retriever(http=HttpClientPool(transport=httpx.MockTransport(upstreams.sites)), index_dir=index_dir)
+    chatbot = Chatbot(api_key="sk-replay", retriever=retriever)
+    chatbot.async_client = AsyncOpenAI(
+        api_key="sk-replay",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(upstreams.openai))
+    )
+    chatbot.reranker.index.embedder.async_client = chatbot.async_client
+    return retriever, chatbot, SessionManager()
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _ms(value):
+    return round(value * 1000, 1) if value is not None else None
+
+
+async def send_chat(client, message, session_id):
+    started = time.perf_counter()
+    response = await client.post("/api/chat", json={"message": message, "session_id": session_id})
+    response.raise_for_status()
+    return time.perf_counter() - started, None, response.json()["session_id"]
+
+
+async def asgi_stream(path, payload):
+    """
+    POST to the app over ASGI and yield body chunks as the app sends them
+    (httpx's ASGITransport buffers the whole response, hiding time to first token)
+    """
+    body = json.dumps(payload).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"replay"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 0), "server": ("replay", 80)
+    }
+    messages = asyncio.Queue()
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # no disconnect until the app is done
+
+    task = asyncio.create_task(app(scope, receive, messages.put))
+    task.add_done_callback(lambda _: messages.put_nowait(None))
+    try:
+        while True:
+            message = await messages.get()
+            if message is None:
+                task.result()
+                return
+            if message["type"] == "http.response.start" and message["status"] >= 400:
+                raise RuntimeError(f"HTTP {message['status']}")
+            if message["type"] == "http.response.body":
+                if message.get("body"):
+                    yield message["body"]
+                if not message.get("more_body"):
+                    return
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def send_stream(client, message, session_id):
+    started = time.perf_counter()
+    first_token = None
+    event = None
+    buffer = ""
+    async for chunk in asgi_stream("/api/chat/stream", {"message": message, "session_id": session_id}):
+        buffer += chunk.decode("utf-8")
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: "):
+                data = json.loads(line[6:])
+                if event == "session":
+                    session_id = data["session_id"]
+                elif event == "token" and first_token is None:
+                    first_token = time.perf_counter() - started
+                elif event == "error":
+                    raise RuntimeError(data["detail"])
+    return time.perf_counter() - started, first_token, session_id
+
+
+async def run_phase(phase, conversations, args):
+    upstreams = Upstreams(args)
+    with tempfile.TemporaryDirectory() as index_dir:
+        retriever, chatbot, session_manager = build_services(upstreams, index_dir)
+        app.state.chatbot = chatbot
+        app.state.session_manager = session_manager
+        app.state.retriever = retriever
+        # One replay user sends everything: measure the chat path, not the rate limits
+        app.state.admission = AdmissionController(rate_per_minute=float("inf"), burst=float("inf"),
+                                                  max_in_flight=args.concurrency, max_queue=len(conversations) * args.repeat)
+
+        send = send_stream if phase == "stream" else send_chat
+        queue = asyncio.Queue()
+        for conversation in conversations * args.repeat:
+            queue.put_nowait(conversation)
+        latencies, first_tokens, errors = [], [], Counter()
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=120) as client:
+            async def worker():
+                while not queue.empty():
+                    conversation = queue.get_nowait()
+                    session_id = None
+                    for message in conversation:
+                        try:
+                            latency, first_token, session_id = await send(client, message, session_id)
+                        except Exception as e:
+                            errors[type(e).__name__] += 1
+                            break
+                        latencies.append(latency)
+                        if first_token is not None:
+                            first_tokens.append(first_token)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            wall = time.perf_counter() - started
+
+        await chatbot.aclose()
+        await retriever.aclose()
+
+    return {
+        "requests": len(latencies),
+        "errors": dict(errors),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p95_ms": _ms(percentile(latencies, 95)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "ttft_p50_ms": _ms(percentile(first_tokens, 50)),
+        "ttft_p95_ms": _ms(percentile(first_tokens, 95)),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "upstream_calls": dict(sorted(upstreams.calls.items())),
+        "answer_cache_hit_rate": chatbot.answer_cache.stats()["hit_rate"],
+        "query_cache_hit_rate": retriever.query_cache.stats()["hit_rate"]
+    }
+
+
+# Metric -> True when higher is better
+COMPARED = {
+    "throughput_rps": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "ttft_p50_ms": False,
+    "ttft_p95_ms": False,
+    "peak_rss_mb": False
+}
+
+
+def compare(report, baseline, tolerance):
+    """Metrics that got worse than the baseline by more than `tolerance` (a fraction)"""
+    regressions = []
+    for phase, results in report["phases"].items():
+        for metric, higher_is_better in COMPARED.items():
+            old = baseline.get("phases", {}).get(phase, {}).get(metric)
+            new = results.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append({"phase": phase, "metric": metric, "baseline": old, "current": new,
+                                    "change": f"{change:+.1%}"})
+    return regressions
+
+
+async def run(args):
+    conversations = load_corpus(args.corpus)
+    report = {"config": {key: value for key, value in vars(args).items()
+                         if key not in ("baseline", "save_baseline", "fail_on_regression", "verbose")},
+              "phases": {}}
+    report["config"]["corpus"] = os.path.relpath(args.corpus)
+    for phase in args.phases.split(","):
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            report["phases"][phase] = await run_phase(phase, conversations, args)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--phases", default="chat,stream", help="comma-separated: chat, stream")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1, help="times to replay the corpus")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--site-latency", type=float, default=0.2)
+    parser.add_argument("--site-failure-rate", type=float, default=0.05)
+    parser.add_argument("--feed-latency", type=float, default=0.1)
+    parser.add_argument("--llm-ttft", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.02)
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression as a fraction")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own log output")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+    print(json.dumps(report, indent=2))
+    if args.fail_on_regression and report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
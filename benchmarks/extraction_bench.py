@@ -0,0 +1,89 @@
+"""
+Benchmark the streaming extractor against the previous BeautifulSoup path.
+
+Uses the pages in benchmarks/fixtures, one per source. They are synthetic,
+not captures of the live sites: about 80 KB each of generated inline CSS,
+navigation, result markup that matches the source's content_selector, and a
+footer. Treat the timings as a comparison of the two paths on pages of that
+shape rather than as figures for real responses. For each page it checks
+both paths return the same first three matches, then times them:
+
+  - soup: decode the whole body to str, build a full BeautifulSoup(lxml)
+    tree, run CSS select and keep three results (the old _search_site path)
+  - stream: feed raw bytes to the compiled-selector extractor in 16 KiB
+    chunks, stopping as soon as three matches are complete
+
+    python -m benchmarks.extraction_bench --repeat 200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+from app.services.extraction import compile_selector, extract
+from app.services.sources import load_source_registry
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def soup_extract(content: bytes, css: str, limit: int = 3):
+    soup = BeautifulSoup(content.decode("utf-8"), "lxml")
+    return [
+        {"text": el.get_text(strip=True), "href": el.get("href")}
+        for el in soup.select(css)[:limit]
+    ]
+
+
+def stream_extract(content: bytes, selector, limit: int = 3):
+    return [{"text": m["text"], "href": m["href"]} for m in extract(content, selector, limit)]
+
+
+def timeit(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def run(repeat):
+    report = {}
+    for source in load_source_registry():
+        site_key = source.key
+        path = os.path.join(FIXTURES, f"{site_key}.html")
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            content = f.read()
+        css = source.content_selector
+        selector = compile_selector(css)
+
+        expected = soup_extract(content, css)
+        actual = stream_extract(content, selector)
+        if expected != actual:
+            raise AssertionError(f"{site_key}: extractor mismatch\n{expected}\n{actual}")
+
+        soup_ms = timeit(lambda: soup_extract(content, css), repeat)
+        stream_ms = timeit(lambda: stream_extract(content, selector), repeat)
+        report[site_key] = {
+            "page_kb": round(len(content) / 1024, 1),
+            "soup_ms": round(soup_ms, 3),
+            "stream_ms": round(stream_ms, 3),
+            "speedup": round(soup_ms / stream_ms, 1)
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+    print(json.dumps(run(args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
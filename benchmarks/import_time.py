@@ -0,0 +1,131 @@
+"""
+Import-time budget check for the server and CLI entry points.
+
+Each target is imported in a fresh interpreter with `-X importtime`, several
+times; the median cumulative import time is compared with --budget-ms and
+with the stored baseline (beyond --tolerance is a regression). Importing an
+entry point must not pull in the service stack, which is built in the app
+lifespan: any of DEFERRED showing up in sys.modules is also a failure.
+
+The report lists the heaviest direct imports of each target, so a
+regression points at the module that caused it. Exits 1 on any failure.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --targets app.server --runs 9
+    python -m benchmarks.import_time --save-baseline
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "import_time.json")
+# Heavy modules that only the lifespan (or first use) should import
+DEFERRED = ("openai", "sqlalchemy", "numpy", "lxml", "feedparser", "httpx", "tiktoken", "uvicorn")
+
+PROBE = """
+import sys
+import {target}
+print("DEFERRED_LOADED=" + ",".join(name for name in {deferred!r} if name in sys.modules))
+"""
+
+
+def measure(target):
+    """(cumulative import ms, heaviest direct imports, deferred modules loaded) from one fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(target=target, deferred=DEFERRED)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        entries.append((len(name) - len(name.lstrip()), name.strip(), int(cumulative) / 1000))
+
+    total, top_depth = 0.0, None
+    for index, (depth, name, cumulative) in enumerate(entries):
+        if name == target:
+            total, top_depth, end = cumulative, depth, index
+    # Children are listed before their parent, one level deeper
+    children = []
+    if top_depth is not None:
+        for depth, name, cumulative in reversed(entries[:end]):
+            if depth <= top_depth:
+                break
+            if depth == top_depth + 2:
+                children.append((name, cumulative))
+    loaded = result.stdout.strip().rpartition("DEFERRED_LOADED=")[2]
+    return total, children, [name for name in loaded.split(",") if name]
+
+
+def profile(target, runs, top):
+    totals, heaviest, loaded = [], {}, set()
+    for _ in range(runs):
+        total, children, deferred = measure(target)
+        totals.append(total)
+        loaded.update(deferred)
+        for name, cumulative in children:
+            heaviest.setdefault(name, []).append(cumulative)
+    ranked = sorted(((statistics.median(times), name) for name, times in heaviest.items()), reverse=True)
+    return {
+        "import_ms": round(statistics.median(totals), 1),
+        "min_ms": round(min(totals), 1),
+        "max_ms": round(max(totals), 1),
+        "heaviest": {name: round(ms, 1) for ms, name in ranked[:top]},
+        "deferred_loaded": sorted(loaded)
+    }
+
+
+def check(report, baseline, budget_ms, tolerance):
+    """Failures: over budget, slower than the baseline by more than `tolerance`, or deferred modules loaded"""
+    failures = []
+    for target, results in report["targets"].items():
+        if results["import_ms"] > budget_ms:
+            failures.append(f"{target}: {results['import_ms']}ms is over the {budget_ms}ms budget")
+        old = baseline.get("targets", {}).get(target, {}).get("import_ms")
+        if old and (results["import_ms"] - old) / old > tolerance:
+            failures.append(f"{target}: {results['import_ms']}ms vs {old}ms baseline "
+                            f"({(results['import_ms'] - old) / old:+.1%})")
+        if results["deferred_loaded"]:
+            failures.append(f"{target} imports {', '.join(results['deferred_loaded'])} at import time")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--targets", default="app.server,app.main", help="comma-separated modules to import")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="heaviest direct imports to list")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1000")))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed regression as a fraction")
+    args = parser.parse_args()
+
+    report = {"python": sys.version.split()[0], "runs": args.runs, "targets": {}}
+    for target in args.targets.split(","):
+        report["targets"][target] = profile(target, args.runs, args.top)
+
+    baseline = {}
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report["failures"] = check(report, baseline, args.budget_ms, args.tolerance)
+    print(json.dumps(report, indent=2))
+    if report["failures"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,4 @@
-import uvicorn
-from app.server import app
+from app.bootstrap import serve
 
 if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    serve()
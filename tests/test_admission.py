@@ -0,0 +1,187 @@
+import asyncio
+
+import pytest
+
+from app.services.admission import CONTINUING, NEW, AdmissionController, Overloaded, RateLimited
+
+
+def unlimited(**kwargs):
+    return AdmissionController(rate_per_minute=6000, burst=1000, **kwargs)
+
+
+def test_rate_limit_rejects_once_the_burst_is_used():
+    async def scenario():
+        admission = AdmissionController(rate_per_minute=60, burst=2)
+        for _ in range(2):
+            async with admission.admit("user"):
+                pass
+        with pytest.raises(RateLimited) as error:
+            await admission.acquire("user")
+        assert 0 < error.value.retry_after <= 1
+        # Other users have their own bucket
+        async with admission.admit("someone else"):
+            pass
+        assert admission.stats()["rejected"]["rate_limited"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_continuing_sessions_are_served_before_new_ones():
+    async def scenario():
+        admission = unlimited(max_in_flight=1, max_queue=4)
+        order = []
+
+        async def chat(name, priority):
+            async with admission.admit(name, priority):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        await admission.acquire("holder")
+        tasks = [asyncio.ensure_future(chat("new", NEW)), asyncio.ensure_future(chat("continuing", CONTINUING))]
+        await asyncio.sleep(0.01)
+        assert admission.stats()["queued"] == {"continuing": 1, "new": 1, "batch": 0}
+        admission.release()
+        await asyncio.gather(*tasks)
+        assert order == ["continuing", "new"]
+        assert admission.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_rejects_new_and_displaces_for_continuing():
+    async def scenario():
+        admission = unlimited(max_in_flight=1, max_queue=1)
+        await admission.acquire("holder")
+        waiting = asyncio.ensure_future(admission.acquire("new", NEW))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as error:
+            await admission.acquire("another new", NEW)
+        assert error.value.reason == "queue_full"
+
+        continuing = asyncio.ensure_future(admission.acquire("continuing", CONTINUING))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as error:
+            await waiting
+        assert error.value.reason == "displaced"
+        admission.release()
+        await continuing
+        admission.release()
+        assert admission.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout():
+    async def scenario():
+        admission = unlimited(max_in_flight=1, queue_timeout=0.01)
+        await admission.acquire("holder")
+        with pytest.raises(Overloaded) as error:
+            await admission.acquire("late")
+        assert error.value.reason == "queue_timeout"
+        assert admission.queued == 0
+
+    asyncio.run(scenario())
+
+
+def test_batch_items_take_a_capped_share_of_the_slots():
+    async def scenario():
+        admission = unlimited(max_in_flight=8, batch_share=0.25)
+        peak = 0
+
+        async def item():
+            nonlocal peak
+            async with admission.batch_item("user"):
+                peak = max(peak, admission.batch_in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(item() for _ in range(10)))
+        assert peak == 2
+        assert admission.stats()["admitted"]["batch"] == 10
+        assert admission.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_batch_items_wait_while_chats_are_queued():
+    async def scenario():
+        admission = unlimited(max_in_flight=1, batch_share=1)
+        order = []
+
+        async def item():
+            async with admission.batch_item("batch user"):
+                order.append("batch")
+
+        async def chat():
+            async with admission.admit("chat user"):
+                order.append("chat")
+
+        await admission.acquire("holder")
+        batch_task = asyncio.ensure_future(item())
+        await asyncio.sleep(0)
+        chat_task = asyncio.ensure_future(chat())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            admission.check_batch("batch user")
+        admission.release()
+        await asyncio.gather(batch_task, chat_task)
+        assert order == ["chat", "batch"]
+
+    asyncio.run(scenario())
+
+
+def test_batch_questions_count_against_the_users_bucket():
+    async def scenario():
+        admission = AdmissionController(rate_per_minute=60, burst=3)
+        for _ in range(3):
+            async with admission.batch_item("user"):
+                pass
+        with pytest.raises(RateLimited):
+            admission.check_batch("user")
+        with pytest.raises(RateLimited):
+            await admission.acquire("user")
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_batch_item_frees_its_place():
+    async def scenario():
+        admission = unlimited(max_in_flight=1, batch_share=1)
+        await admission.acquire("holder")
+        waiting = asyncio.ensure_future(admission.batch_item("user").__aenter__())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        admission.release()
+        assert admission.in_flight == 0
+        assert admission.stats()["queued"]["batch"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_batch_items_short_of_tokens_wait_in_line_behind_one_sleeper(monkeypatch):
+    async def scenario():
+        admission = AdmissionController(rate_per_minute=6000, burst=1, max_in_flight=8, batch_share=1)
+        sleeps = []
+        real_sleep = asyncio.sleep
+
+        async def sleep(delay):
+            sleeps.append(delay)
+            await real_sleep(0)
+
+        monkeypatch.setattr("app.services.admission.asyncio.sleep", sleep)
+        order = []
+
+        async def item(n):
+            async with admission.batch_item("user"):
+                order.append(n)
+
+        tasks = [asyncio.ensure_future(item(n)) for n in range(20)]
+        await real_sleep(0)
+        assert len(admission._token_feeders) == 1
+        assert admission.stats()["queued"]["batch"] == 19
+        await asyncio.gather(*tasks)
+        assert order == list(range(20))
+        assert admission._token_waiters == {} and admission._token_feeders == {}
+        assert admission.in_flight == 0
+
+    asyncio.run(scenario())
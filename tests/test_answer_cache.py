@@ -0,0 +1,129 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.services.answer_cache import AnswerCache, qualifiers
+from app.services.chatbot import Chatbot
+
+# Unit vectors at chosen similarities to the probe question
+VECTORS = {
+    "probe": [1.0, 0.0, 0.0],
+    "close": [0.99, 0.141, 0.0],
+    "closer": [0.999, 0.0447, 0.0],
+    "far": [0.5, 0.866, 0.0],
+}
+
+
+class FakeEmbedder:
+    async def embed(self, texts):
+        return np.array([VECTORS[text] for text in texts], dtype=np.float32)
+
+
+def feed_item(feed_key, n=0):
+    return {"title": "Act", "url": f"https://www.legislation.gov.uk/{feed_key}/{n}", "feed_type": feed_key}
+
+
+def site_item(n=0):
+    return {"title": "Guide", "url": f"https://www.gov.uk/guide/{n}"}
+
+
+def test_feed_changes_only_invalidate_answers_that_used_the_feed():
+    async def scenario():
+        cache = AnswerCache(FakeEmbedder(), threshold=0.9)
+        versions = {"ukpga": 1, "uksi": 1}
+        await cache.put("close", "from ukpga", [feed_item("ukpga"), site_item()], versions)
+        await cache.put("far", "from the web", [site_item()], versions)
+        assert cache.invalidate(feeds=["uksi"]) == 0
+
+        versions = {"ukpga": 2, "uksi": 1}
+        assert await cache.get("close", versions) is None
+        assert await cache.get("far", versions) == "from the web"
+        assert cache.invalidate(feeds=["ukpga"]) == 1
+        assert len(cache) == 1
+
+    asyncio.run(scenario())
+
+
+def test_answers_retrieved_before_a_feed_change_are_not_served_after_it():
+    async def scenario():
+        cache = AnswerCache(FakeEmbedder(), threshold=0.9)
+        read_before_retrieval = {"ukpga": 1}
+        cache.invalidate(feeds=["ukpga"])  # the feed changes while the answer is generated
+        await cache.put("close", "stale", [feed_item("ukpga")], read_before_retrieval)
+        assert await cache.get("close", {"ukpga": 2}) is None
+
+    asyncio.run(scenario())
+
+
+def test_stale_nearest_match_falls_back_to_the_next_one():
+    async def scenario():
+        cache = AnswerCache(FakeEmbedder(), threshold=0.9)
+        await cache.put("closer", "stale answer", [feed_item("ukpga")], {"ukpga": 1})
+        await cache.put("close", "fresh answer", [site_item()], {"ukpga": 1})
+        await cache.put("far", "unrelated answer", [site_item()], {"ukpga": 2})
+        assert await cache.get("probe", {"ukpga": 1}) == "stale answer"
+        assert await cache.get("probe", {"ukpga": 2}) == "fresh answer"
+        assert cache.stats()["semantic_hits"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_exact_repeats_and_url_invalidation():
+    cache = AnswerCache()
+    cache.put_exact("What is a Section 21 notice?", "answer", [site_item(1)], {})
+    assert cache.get_exact("what is a section 21 notice", {}) == "answer"
+    assert cache.invalidate(urls=["https://www.gov.uk/guide/1"]) == 1
+    assert cache.get_exact("what is a section 21 notice", {}) is None
+
+
+class SameVectorEmbedder:
+    """Every question embeds identically, as near-paraphrases almost do"""
+
+    async def embed(self, texts):
+        return np.ones((len(texts), 3), dtype=np.float32)
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("Can my landlord evict me with notice?", "Can my landlord evict me without notice?"),
+    ("Can my landlord evict me?", "Can my landlord not evict me?"),
+    ("Deposit rules in Scotland", "Deposit rules in England"),
+    ("How does section 21 work?", "How does section 8 work?"),
+])
+def test_semantic_hits_need_the_same_qualifiers(cached, asked):
+    async def scenario():
+        cache = AnswerCache(SameVectorEmbedder())
+        await cache.put(cached, "answer", [site_item()], {})
+        assert await cache.get(asked, {}) is None
+        assert await cache.get(cached.upper(), {}) == "answer"
+
+    asyncio.run(scenario())
+
+
+def test_qualifiers():
+    assert qualifiers("Can't I rent in Northern  Ireland under s.21?") == {"not", "northern ireland", "s21"}
+    assert qualifiers("cannot evict a Scottish tenant") == qualifiers("can not evict a tenant in Scotland")
+
+
+def test_answer_cache_is_exact_match_unless_semantic_is_enabled(monkeypatch):
+    assert Chatbot(api_key="sk-test", retriever=None).answer_cache.embedder is None
+    monkeypatch.setenv("ANSWER_CACHE_SEMANTIC", "1")
+    assert Chatbot(api_key="sk-test", retriever=None).answer_cache.embedder is not None
+
+
+def test_answers_go_when_their_search_results_leave_the_index():
+    from app.services.retriever import Retriever
+    from app.services.sources import SourceRegistry
+
+    retriever = Retriever(registry=SourceRegistry())
+    chatbot = Chatbot(api_key="sk-test", retriever=retriever)
+    page = {"site": "gov.uk", "title": "Deposit protection", "url": "http://www.gov.uk/deposit-protection/",
+            "snippet": "Landlords must protect deposits"}
+    retriever._index_items([page], ttl=3600)
+    context = chatbot.context_processor.process([page])
+    chatbot.answer_cache.put_exact("Do I get my deposit back?", "answer", context, {})
+    chatbot.answer_cache.put_exact("Unrelated question", "other", [site_item()], {})
+
+    retriever._index_items([{**page, "snippet": "Updated guidance on deposits"}], ttl=3600)
+    assert chatbot.answer_cache.get_exact("Do I get my deposit back?", {}) is None
+    assert chatbot.answer_cache.get_exact("Unrelated question", {}) == "other"
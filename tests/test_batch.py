@@ -0,0 +1,107 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from app.services.admission import AdmissionController
+from app.services.batch import BatchRunner
+from app.services.intent import IntentClassifier
+
+
+class FakeAnswerCache:
+    async def get(self, question, feed_versions):
+        return None
+
+    async def put(self, question, answer, context, feed_versions):
+        pass
+
+
+class FakeRouter:
+    def choose_tier(self, question, context):
+        return "simple"
+
+    async def acomplete(self, client, messages, tier):
+        await asyncio.sleep(0.01)
+        return f"answer to {messages}"
+
+
+class FakeChatbot:
+    def __init__(self):
+        self.intents = IntentClassifier()
+        self.answer_cache = FakeAnswerCache()
+        self.router = FakeRouter()
+        self.async_client = None
+        self.retriever = None
+        self.retrieved = []
+
+    def feed_versions(self):
+        return {}
+
+    async def aretrieve_context(self, question):
+        self.retrieved.append(question)
+        return [{"site": "test", "title": "t", "url": "https://example.org/a", "snippet": "s"}]
+
+    def build_messages(self, question, context):
+        return question
+
+    def templated_reply(self, intent):
+        return "Hello!" if intent == "greeting" else None
+
+
+async def collect(runner, questions, gate=None):
+    return [result async for result in runner.run(questions, gate)]
+
+
+def test_repeated_questions_are_answered_once():
+    chatbot = FakeChatbot()
+    questions = ["What is a section 21 notice?", "what is a Section 21 notice", "Can my landlord keep my deposit?"]
+    results = asyncio.run(collect(BatchRunner(chatbot), questions))
+    assert sorted(result["index"] for result in results) == [0, 1, 2]
+    assert all(result["status"] == "ok" for result in results)
+    assert len(chatbot.retrieved) == 2
+
+
+def test_gate_is_entered_around_every_question():
+    async def scenario():
+        admission = AdmissionController(rate_per_minute=6000, burst=1000, max_in_flight=8, batch_share=0.25)
+        entered = []
+        peak = 0
+
+        @asynccontextmanager
+        async def gate():
+            nonlocal peak
+            async with admission.batch_item("user"):
+                entered.append(1)
+                peak = max(peak, admission.batch_in_flight)
+                yield
+
+        questions = [f"Question {n} about tenancy law" for n in range(6)]
+        results = await collect(BatchRunner(FakeChatbot()), questions, gate)
+        assert len(results) == 6 and len(entered) == 6
+        assert peak <= admission.batch_limit == 2
+        assert admission.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_template_replies_and_cached_answers_skip_the_gate():
+    class CachedAnswers(FakeAnswerCache):
+        async def get(self, question, feed_versions):
+            return "cached answer" if "deposit" in question else None
+
+    async def scenario():
+        chatbot = FakeChatbot()
+        chatbot.answer_cache = CachedAnswers()
+        entered = []
+
+        @asynccontextmanager
+        async def gate():
+            entered.append(1)
+            yield
+
+        results = await collect(BatchRunner(chatbot), ["Hello", "Can my landlord keep my deposit?",
+                                                        "What is a section 21 notice?"], gate)
+        by_index = {result["index"]: result for result in results}
+        assert by_index[0]["answer"] == "Hello!"
+        assert by_index[1]["cached"] is True
+        assert len(entered) == 1 and chatbot.retrieved == ["What is a section 21 notice?"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,120 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.routes.chat import ChatRequest, chat_stream_with_session
+from app.services.admission import AdmissionController
+from app.services.history import ConversationMemory
+from app.services.session_manager import SessionManager
+from app.services.session_store import MemorySessionStore
+
+
+class FakeChatbot:
+    def __init__(self):
+        self.memory = ConversationMemory(summarise=None)
+
+    async def astream_query_with_history(self, query, conversation_history=None, conversation_summary=None):
+        for word in ("Section", " 21"):
+            yield word
+
+
+class FakeRequest:
+    def __init__(self, admission):
+        self.app = SimpleNamespace(state=SimpleNamespace(
+            chatbot=FakeChatbot(), session_manager=SessionManager(MemorySessionStore()), admission=admission
+        ))
+
+    async def is_disconnected(self):
+        return False
+
+
+def events(body):
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n")
+        parsed.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return parsed
+
+
+async def read(response):
+    return "".join([chunk async for chunk in response.body_iterator])
+
+
+def test_response_that_is_never_sent_holds_no_slot():
+    async def scenario():
+        admission = AdmissionController(rate_per_minute=6000, burst=1000, max_in_flight=1)
+        for _ in range(3):
+            await chat_stream_with_session(ChatRequest(message="hello"), FakeRequest(admission), "user")
+        assert admission.in_flight == 0
+        async with admission.admit("user"):
+            pass
+
+    asyncio.run(scenario())
+
+
+def test_stream_takes_and_releases_the_slot():
+    async def scenario():
+        admission = AdmissionController(rate_per_minute=6000, burst=1000, max_in_flight=1)
+        response = await chat_stream_with_session(ChatRequest(message="hello"), FakeRequest(admission), "user")
+        parsed = events(await read(response))
+        assert [event for event, _ in parsed] == ["session", "token", "token", "done"]
+        assert admission.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_abandoned_stream_releases_the_slot():
+    async def scenario():
+        admission = AdmissionController(rate_per_minute=6000, burst=1000, max_in_flight=1)
+        response = await chat_stream_with_session(ChatRequest(message="hello"), FakeRequest(admission), "user")
+        body = response.body_iterator
+        await body.__anext__()
+        assert admission.in_flight == 1
+        await body.aclose()
+        assert admission.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_rate_limit_is_reported_as_an_error_event():
+    async def scenario():
+        admission = AdmissionController(rate_per_minute=60, burst=1)
+        request = FakeRequest(admission)
+        await read(await chat_stream_with_session(ChatRequest(message="hello"), request, "user"))
+        parsed = events(await read(await chat_stream_with_session(ChatRequest(message="hello"), request, "user")))
+        assert parsed[0][0] == "error" and parsed[0][1]["status"] == 429 and parsed[0][1]["retry_after"] > 0
+        assert admission.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_unknown_session_is_a_404():
+    async def scenario():
+        admission = AdmissionController(rate_per_minute=6000, burst=1000)
+        with pytest.raises(HTTPException) as error:
+            await chat_stream_with_session(ChatRequest(message="hi", session_id="missing"), FakeRequest(admission), "user")
+        assert error.value.status_code == 404
+
+    asyncio.run(scenario())
+
+
+def test_session_evicted_mid_stream_is_a_410_error_event():
+    async def scenario():
+        admission = AdmissionController(rate_per_minute=6000, burst=1000)
+        request = FakeRequest(admission)
+        store = request.app.state.session_manager.store
+
+        async def evicting_stream(query, conversation_history=None, conversation_summary=None):
+            store.idle_ttl = -1  # every session is now past its idle time
+            yield "Section"
+
+        request.app.state.chatbot.astream_query_with_history = evicting_stream
+        parsed = events(await read(await chat_stream_with_session(ChatRequest(message="hello"), request, "user")))
+        assert [event for event, _ in parsed] == ["session", "token", "error"]
+        assert parsed[-1][1]["status"] == 410
+        assert admission.in_flight == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,78 @@
+from app.services.context import ContextProcessor, canonical_url, strip_markup
+
+
+def item(url, title, snippet, site="test"):
+    return {"site": site, "title": title, "url": url, "snippet": snippet}
+
+
+def test_legislation_views_collapse_to_the_document():
+    expected = "https://www.legislation.gov.uk/ukpga/2025/26"
+    for url in (
+        "http://www.legislation.gov.uk/ukpga/2025/26/contents/enacted",
+        "https://legislation.gov.uk/id/ukpga/2025/26",
+        "https://www.legislation.gov.uk/ukpga/2025/26/data.feed",
+        "https://www.legislation.gov.uk/ukpga/2025/26/",
+    ):
+        assert canonical_url(url) == expected
+
+
+def test_legislation_sections_stay_distinct():
+    assert canonical_url("https://www.legislation.gov.uk/ukpga/1985/70/section/11") != \
+        canonical_url("https://www.legislation.gov.uk/ukpga/1985/70/section/12")
+    assert canonical_url("https://www.legislation.gov.uk/id/ukpga/1985/70/section/11/enacted") == \
+        "https://www.legislation.gov.uk/ukpga/1985/70/section/11"
+    assert canonical_url("https://www.legislation.gov.uk/ukpga/1985/70/schedule/2/data.htm") == \
+        "https://www.legislation.gov.uk/ukpga/1985/70/schedule/2"
+
+
+def test_tracking_parameters_and_fragments_are_dropped():
+    assert canonical_url("https://www.gov.uk/evicting-tenants/?utm_source=x&page=2#top") == \
+        "https://www.gov.uk/evicting-tenants?page=2"
+
+
+def test_result_fragments_are_kept():
+    assert canonical_url("https://www.gov.uk/search?q=x#result-1") != canonical_url("https://www.gov.uk/search?q=x#result-2")
+
+
+def test_strip_markup():
+    assert strip_markup("<p>Renters&#39; <b>Rights</b></p><script>x()</script>") == "Renters' Rights"
+
+
+def test_duplicate_urls_keep_the_longer_snippet():
+    processor = ContextProcessor()
+    kept = processor.process([
+        item("http://www.legislation.gov.uk/ukpga/2025/26/contents/enacted", "Renters' Rights Act 2025", "Short."),
+        item("https://www.legislation.gov.uk/ukpga/2025/26", "Renters' Rights Act 2025",
+             "An Act to make provision about residential tenancies."),
+    ])
+    assert len(kept) == 1
+    assert kept[0]["snippet"] == "An Act to make provision about residential tenancies."
+    assert processor.stats()["duplicates_removed"] == 1
+
+
+def test_distinct_sections_and_link_less_results_are_kept():
+    kept = ContextProcessor().process([
+        item("https://www.legislation.gov.uk/ukpga/1985/70/section/11", "Section 11", "Repairing obligations."),
+        item("https://www.legislation.gov.uk/ukpga/1985/70/section/12", "Section 12", "Restriction on contracting out."),
+        item("https://www.bailii.org/search?q=x#result-1", "Smith v Jones", "Possession claim dismissed."),
+        item("https://www.bailii.org/search?q=x#result-2", "Brown v Green", "Deposit penalty awarded."),
+    ])
+    assert len(kept) == 4
+
+
+def test_near_duplicate_text_is_removed():
+    text = "You must follow strict procedures if you want your tenants to leave your property. "
+    kept = ContextProcessor().process([
+        item("https://www.gov.uk/evicting-tenants", "Evicting tenants", text * 3),
+        item("https://www.citizensadvice.org.uk/evicting", "Evicting tenants", text * 3 + "More."),
+    ])
+    assert len(kept) == 1
+    assert kept[0]["url"] == "https://www.gov.uk/evicting-tenants"
+    assert kept[0]["snippet"].endswith("More.")
+
+
+def test_long_snippets_are_trimmed():
+    kept = ContextProcessor(snippet_tokens=20).process([
+        item("https://www.gov.uk/a", "A", "This sentence is about landlords. " * 40)
+    ])
+    assert len(kept[0]["snippet"]) < 200
@@ -0,0 +1,94 @@
+import asyncio
+import zlib
+
+import numpy as np
+import pytest
+
+from app.services.embedding_index import EmbeddingIndex, SemanticReranker
+
+
+class FakeEmbedder:
+    """Deterministic vectors per text; counts the texts it was asked to embed"""
+
+    def __init__(self, dim=16):
+        self.dim = dim
+        self.embedded = []
+
+    async def embed(self, texts):
+        self.embedded.extend(texts)
+        return np.vstack([
+            np.random.default_rng(zlib.crc32(text.encode())).standard_normal(self.dim).astype(np.float32)
+            for text in texts
+        ])
+
+
+def item(n, snippet="snippet"):
+    return {"title": f"Item {n}", "url": f"https://example.org/{n}", "snippet": snippet}
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_rows_stay_addressable_as_the_buffer_grows(quantize):
+    async def scenario():
+        embedder = FakeEmbedder()
+        index = EmbeddingIndex(embedder, quantize=quantize, max_items=10000)
+        for start in range(0, 600, 50):
+            await index.add_items([item(n) for n in range(start, start + 50)])
+        assert len(index) == 600
+        assert index._matrix.shape[0] >= 600
+        vector = (await embedder.embed(["Item 123\nsnippet"]))[0]
+        scores = index.similarities(vector, np.arange(len(index)))
+        assert int(np.argmax(scores)) == index.keys["https://example.org/123"]
+        assert scores.max() == pytest.approx(1.0, abs=0.02)
+
+    asyncio.run(scenario())
+
+
+def test_known_items_are_not_embedded_again():
+    async def scenario():
+        embedder = FakeEmbedder()
+        index = EmbeddingIndex(embedder)
+        await index.add_items([item(1), item(2)])
+        await index.add_items([item(1), item(2), item(3)])
+        assert len(embedder.embedded) == 3
+
+    asyncio.run(scenario())
+
+
+def test_changed_text_replaces_the_vector():
+    async def scenario():
+        embedder = FakeEmbedder()
+        index = EmbeddingIndex(embedder)
+        await index.add_items([item(1, "old text"), item(2)])
+        row = index.keys["https://example.org/1"]
+        await index.add_items([item(1, "new text")])
+        assert len(index) == 2 and index.keys["https://example.org/1"] == row
+        vector = (await embedder.embed(["Item 1\nnew text"]))[0]
+        assert index.similarities(vector, np.array([row]))[0] == pytest.approx(1.0, abs=1e-5)
+
+    asyncio.run(scenario())
+
+
+def test_oldest_items_are_evicted_past_the_cap():
+    async def scenario():
+        index = EmbeddingIndex(FakeEmbedder(), max_items=100)
+        for start in range(0, 150, 10):
+            await index.add_items([item(n) for n in range(start, start + 10)])
+        assert len(index) <= 100
+        assert "https://example.org/0" not in index.keys
+        assert "https://example.org/149" in index.keys
+        assert set(index.fingerprints) == set(index.keys)
+        for key, row in index.keys.items():
+            assert index.row_keys[row] == key
+
+    asyncio.run(scenario())
+
+
+def test_rerank_orders_by_similarity():
+    async def scenario():
+        reranker = SemanticReranker(EmbeddingIndex(FakeEmbedder()))
+        items = [item(n) for n in range(5)]
+        ranked = await reranker.rerank("Item 3\nsnippet", items, top_k=2)
+        assert ranked[0]["url"] == "https://example.org/3"
+        assert len(ranked) == 2
+
+    asyncio.run(scenario())
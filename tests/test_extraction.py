@@ -0,0 +1,46 @@
+import asyncio
+import threading
+
+from app.services import extraction
+from app.services.extraction import compile_selector, extract, extract_from_stream
+
+PAGE = (
+    b"<html><body><nav><a href='/home'>Home</a></nav><ol>"
+    + b"".join(b"<li class='result'><a href='/r/%d'>Result %d</a></li>" % (n, n) for n in range(200))
+    + b"</ol></body></html>"
+)
+
+
+async def stream(content, chunk_size, read):
+    for start in range(0, len(content), chunk_size):
+        read.append(start)
+        yield content[start:start + chunk_size]
+
+
+def test_selectors():
+    selector = compile_selector("ol > li.result a[href], nav a")
+    results = extract(PAGE, selector, limit=4)
+    assert [result["link"] for result in results] == ["/home", "/r/0", "/r/1", "/r/2"]
+    assert results[1]["text"] == "Result 0"
+
+
+def test_stream_matches_in_memory_extraction_and_stops_early():
+    selector = compile_selector("li.result")
+    read = []
+    results = asyncio.run(extract_from_stream(stream(PAGE * 20, 1024, read), selector, limit=3, batch_size=4096))
+    assert results == extract(PAGE, selector, limit=3)
+    assert len(read) < len(PAGE * 20) // 1024
+
+
+def test_stream_is_parsed_off_the_event_loop(monkeypatch):
+    threads = set()
+    feed = extraction.StreamingExtractor.feed
+
+    def recording_feed(self, chunk):
+        threads.add(threading.current_thread())
+        return feed(self, chunk)
+
+    monkeypatch.setattr(extraction.StreamingExtractor, "feed", recording_feed)
+    results = asyncio.run(extract_from_stream(stream(PAGE, 100, []), compile_selector("li.result"), limit=200))
+    assert len(results) == 200
+    assert threads and threading.main_thread() not in threads
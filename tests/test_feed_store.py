@@ -0,0 +1,23 @@
+import asyncio
+
+import httpx
+
+from app.services.feed_store import FeedStore
+from app.services.http_client import HttpClientPool
+
+
+def test_unguarded_feed_fetches_keep_the_pool_timeout():
+    timeouts = []
+
+    def handler(request):
+        timeouts.append(request.extensions["timeout"])
+        return httpx.Response(200, content=b"<rss><channel></channel></rss>")
+
+    async def scenario():
+        http = HttpClientPool(transport=httpx.MockTransport(handler), timeout=7.0)
+        feeds = FeedStore({"acts": {"url": "https://example.org/acts.rss", "name": "Acts"}}, http)
+        await feeds.refresh_feed("acts")
+        await http.aclose()
+
+    asyncio.run(scenario())
+    assert timeouts == [{"connect": 7.0, "read": 7.0, "write": 7.0, "pool": 7.0}]
@@ -0,0 +1,41 @@
+from app import bootstrap
+from app.services import history
+from app.services.chatbot import Chatbot
+from app.services.history import HistoryBuilder
+
+
+def turn(n, words=10):
+    return {"id": str(n), "role": ("user", "assistant")[n % 2], "content": " ".join(["word"] * words)}
+
+
+def test_select_keeps_the_newest_messages_that_fit():
+    builder = HistoryBuilder(token_budget=50, max_messages=20)
+    messages = [turn(n) for n in range(10)]
+    recent, overflow = builder.select(messages)
+    assert recent == messages[-len(recent):] and overflow == messages[:-len(recent)]
+    assert sum(history.count_tokens(msg["content"]) for msg in recent) <= 50
+
+
+def test_an_over_long_latest_message_is_truncated():
+    recent, overflow = HistoryBuilder(token_budget=20).select([turn(0), turn(1, words=500)])
+    assert len(recent) == 1 and recent[0]["content"].endswith("...")
+    assert overflow == [turn(0)]
+
+
+def test_build_messages_uses_the_history_as_given(monkeypatch):
+    chatbot = Chatbot(api_key="sk-test", retriever=None)
+
+    def select(messages):
+        raise AssertionError("history was already budgeted")
+
+    monkeypatch.setattr(chatbot.memory.builder, "select", select)
+    conversation = [turn(n) for n in range(4)]
+    messages = chatbot.build_messages("And then?", [], conversation, "Earlier summary")
+    assert [msg["role"] for msg in messages] == ["system", "system", "user", "assistant", "user", "assistant", "user"]
+
+
+def test_preload_loads_the_tokenizer(monkeypatch):
+    loaded = []
+    monkeypatch.setattr(history, "_get_encoding", lambda model: loaded.append(model))
+    bootstrap.preload_chat_stack()
+    assert loaded == ["gpt-4"]
@@ -0,0 +1,32 @@
+import asyncio
+
+from app.services.concurrency import speculative
+from app.services.http_client import HttpClientPool
+
+
+def test_speculative_work_is_held_to_its_own_budget():
+    async def scenario():
+        http = HttpClientPool(speculative_concurrency=2)
+        holding = peak = 0
+
+        async def request():
+            nonlocal holding, peak
+            async with http.budget():
+                holding += 1
+                peak = max(peak, holding)
+                await asyncio.sleep(0.01)
+                holding -= 1
+
+        async def speculate():
+            with speculative():
+                # Tasks started from speculative work are speculative too
+                await asyncio.gather(*(asyncio.ensure_future(request()) for _ in range(6)))
+
+        await speculate()
+        assert peak == 2
+
+        peak = 0
+        await asyncio.gather(*(request() for _ in range(6)))
+        assert peak == 6
+
+    asyncio.run(scenario())
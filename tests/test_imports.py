@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.import_time import DEFERRED
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("target", ["app.server", "app.main"])
+def test_entry_points_do_not_import_the_service_stack(target):
+    probe = f"import sys, {target}; print(','.join(name for name in {DEFERRED!r} if name in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
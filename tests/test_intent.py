@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from app.services.intent import FAREWELL, GREETING, LEGAL, SMALLTALK, THANKS, IntentClassifier
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("Hello there!", GREETING),
+    ("good morning lexley", GREETING),
+    ("thanks so much", THANKS),
+    ("ok bye for now", FAREWELL),
+    ("who are you?", SMALLTALK),
+    ("yes", SMALLTALK),
+    ("", SMALLTALK),
+    ("Can my landlord keep my deposit?", LEGAL),
+    ("hi, my employer hasn't paid my wages", LEGAL),
+])
+def test_rules(message, intent):
+    assert IntentClassifier().classify(message) == intent
+
+
+@pytest.mark.parametrize("message", ["yes", "No.", "yep", "okay", "sure"])
+def test_acknowledgements_in_a_conversation_are_legal(message):
+    classifier = IntentClassifier()
+    assert classifier.classify(message, follow_up=True) == LEGAL
+    assert asyncio.run(classifier.aclassify(message, follow_up=True)) == LEGAL
+
+
+def test_greetings_in_a_conversation_are_still_greetings():
+    assert asyncio.run(IntentClassifier().aclassify("thank you", follow_up=True)) == THANKS
+
+
+def test_ambiguous_messages_go_to_the_model_only_outside_a_conversation():
+    calls = []
+
+    async def model(query):
+        calls.append(query)
+        return "smalltalk"
+
+    classifier = IntentClassifier(model)
+    assert asyncio.run(classifier.aclassify("what about in Scotland?", follow_up=True)) == LEGAL
+    assert calls == []
+    assert asyncio.run(classifier.aclassify("what about the weather")) == SMALLTALK
+    assert calls == ["what about the weather"]
+
+
+def test_model_failure_counts_as_legal():
+    async def model(query):
+        raise RuntimeError("unavailable")
+
+    classifier = IntentClassifier(model)
+    assert asyncio.run(classifier.aclassify("what about the weather")) == LEGAL
+    assert classifier.stats()["routes"][LEGAL]["count"] == 1
+
+
+def test_peek_does_not_count():
+    classifier = IntentClassifier()
+    assert classifier.peek("hello") == GREETING
+    assert classifier.stats()["total"] == 0
@@ -0,0 +1,21 @@
+import pytest
+
+from app.services.model_router import ModelRouter
+
+
+@pytest.mark.parametrize("question", [
+    "Can I get a s21 notice?", "Is a s.21 notice valid?", "Is my s 21 notice valid?",
+    "What does section 8 say?", "Does reg 3 apply?", "Is SI 2015/1646 in force?",
+])
+def test_citations_raise_the_complexity(question):
+    assert ModelRouter().complexity(question) == 1
+
+
+@pytest.mark.parametrize("question", [
+    "It's 2 weeks late, what now?", "What’s 3 months notice?", "He lets 3 rooms, is that an HMO?",
+    "My landlord's 2 letters were ignored",
+])
+def test_ordinary_text_is_not_a_citation(question):
+    router = ModelRouter()
+    assert router.complexity(question) == 0
+    assert router.choose_tier(question) == "simple"
@@ -0,0 +1,25 @@
+import asyncio
+
+from app.services.query_cache import QueryCache
+
+
+def test_cancelled_caller_leaves_the_fetch_running_and_cached():
+    async def scenario():
+        cache = QueryCache()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return [{"title": "t", "url": "https://example.org/a", "snippet": "s"}]
+
+        caller = asyncio.ensure_future(cache.get_or_fetch("site", "deposit", fetch, ttl=60))
+        await asyncio.sleep(0.01)
+        caller.cancel()  # what the retriever does at its deadline
+        await asyncio.sleep(0.08)
+        assert await cache.get_or_fetch("site", "deposit", fetch, ttl=60) == [
+            {"title": "t", "url": "https://example.org/a", "snippet": "s"}
+        ]
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
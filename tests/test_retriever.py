@@ -0,0 +1,44 @@
+import asyncio
+
+from app.services.retriever import Retriever
+from app.services.sources import SourceRegistry, load_source_registry
+
+
+def make_retriever():
+    retriever = Retriever(registry=SourceRegistry(load_source_registry().sources, {}))
+    searched = []
+
+    async def search_site(site_key, query, deadline=None):
+        searched.append(site_key)
+        return []
+
+    retriever._search_site = search_site
+    return retriever, searched
+
+
+def entry(n, **extra):
+    return {"site": "test", "title": f"Tenancy deposit protection {n}", "url": f"https://example.org/{n}",
+            "snippet": "Rules on tenancy deposit protection", **extra}
+
+
+def test_feed_entries_alone_do_not_skip_live_search():
+    async def scenario():
+        retriever, searched = make_retriever()
+        retriever._index_items([entry(n, feed_type="ukpga") for n in range(5)])
+        await retriever.afetch_context_for_query("tenancy deposit protection")
+        assert searched
+
+    asyncio.run(scenario())
+
+
+def test_fresh_search_results_skip_live_search_until_they_expire():
+    async def scenario():
+        retriever, searched = make_retriever()
+        retriever._index_items([entry(n) for n in range(3)], ttl=0.05)
+        results = await retriever.afetch_context_for_query("tenancy deposit protection")
+        assert searched == [] and len(results) == 3
+        await asyncio.sleep(0.06)
+        await retriever.afetch_context_for_query("tenancy deposit protection")
+        assert searched
+
+    asyncio.run(scenario())
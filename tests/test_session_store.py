@@ -0,0 +1,124 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.session_store import MemorySessionStore, SessionStore
+
+START = datetime(2026, 1, 1)
+
+
+def memory_store():
+    return MemorySessionStore()
+
+
+def sql_store():
+    pytest.importorskip("sqlalchemy")
+    from app.services.sql_session_store import SQLSessionStore
+    return SQLSessionStore("sqlite://")
+
+
+@pytest.fixture(params=[memory_store, sql_store], ids=["memory", "sql"])
+def store(request):
+    return request.param()
+
+
+def session(n, user="user"):
+    at = START + timedelta(minutes=n)
+    return {"id": str(uuid.UUID(int=n + 1)), "user_id": user, "title": f"Session {n}", "created_at": at,
+            "updated_at": at, "is_active": True, "summary": None, "summary_upto": None}
+
+
+def message(n, role="user"):
+    return {"id": str(uuid.UUID(int=1000 + n)), "role": role, "content": f"Message {n}",
+            "created_at": START + timedelta(seconds=n)}
+
+
+def test_session_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+def test_message_paging_walks_back_to_the_start(store):
+    async def scenario():
+        await store.create_session(session(0))
+        session_id = session(0)["id"]
+        await store.add_messages(session_id, [message(n, ("user", "assistant")[n % 2]) for n in range(7)], START)
+        pages = []
+        before = None
+        while True:
+            page = await store.get_messages(session_id, limit=3, before=before)
+            if not page:
+                break
+            pages.append([msg["content"] for msg in page])
+            before = page[0]["id"]
+        assert pages == [["Message 4", "Message 5", "Message 6"], ["Message 1", "Message 2", "Message 3"],
+                         ["Message 0"]]
+
+    asyncio.run(scenario())
+
+
+def test_unknown_cursors_give_an_empty_page(store):
+    async def scenario():
+        await store.create_session(session(0))
+        session_id = session(0)["id"]
+        await store.add_messages(session_id, [message(n) for n in range(3)], START)
+        assert await store.get_messages(session_id, before=str(uuid.uuid4())) == []
+        assert await store.get_messages(session_id, before="not-a-uuid") == []
+        assert await store.list_sessions("user", before=str(uuid.uuid4())) == []
+
+    asyncio.run(scenario())
+
+
+def test_session_paging_is_newest_first(store):
+    async def scenario():
+        for n in range(5):
+            await store.create_session(session(n))
+        await store.create_session(session(9, user="someone else"))
+        first = await store.list_sessions("user", limit=3)
+        assert [s["title"] for s in first] == ["Session 4", "Session 3", "Session 2"]
+        rest = await store.list_sessions("user", limit=3, before=first[-1]["id"])
+        assert [s["title"] for s in rest] == ["Session 1", "Session 0"]
+
+    asyncio.run(scenario())
+
+
+def test_unknown_roles_are_rejected():
+    async def scenario():
+        store = MemorySessionStore()
+        await store.create_session(session(0))
+        session_id = session(0)["id"]
+        with pytest.raises(ValueError):
+            await store.add_messages(session_id, [message(0), message(1, role="tool")], START)
+        assert await store.get_messages(session_id) == []
+        assert store.stats()["messages"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_evicted_sessions_are_no_longer_a_cursor():
+    async def scenario():
+        store = MemorySessionStore(max_sessions=2)
+        for n in range(3):
+            await store.create_session(session(n))
+        assert [s["title"] for s in await store.list_sessions("user")] == ["Session 2", "Session 1"]
+        assert await store.list_sessions("user", before=session(0)["id"]) == []
+
+    asyncio.run(scenario())
+
+
+def test_idle_sessions_are_evicted_without_new_sessions_being_created(monkeypatch):
+    async def scenario():
+        now = [1000.0]
+        monkeypatch.setattr("app.services.session_store.time.monotonic", lambda: now[0])
+        store = MemorySessionStore(idle_ttl=60)
+        await store.create_session(session(0))
+        await store.create_session(session(1))
+        now[0] += 45
+        assert await store.get_session(session(1)["id"]) is not None
+        now[0] += 30
+        assert not await store.add_messages(session(0)["id"], [message(0)], START)
+        assert store.stats()["sessions"] == 1 and store.stats()["evicted_sessions"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,21 @@
+import pytest
+
+from app.services.sources import SourcePlugin, SourceRegistry
+
+
+class TaggedSource(SourcePlugin):
+    extra_options = ("tag",)
+
+
+def test_misspelt_source_options_are_rejected():
+    with pytest.raises(ValueError, match="tll"):
+        SourceRegistry.from_config({"sources": {"gov.uk": {"tll": 60}}})
+
+
+def test_plugins_declare_the_extra_options_they_read():
+    source = TaggedSource("example.org", "https://example.org", "https://example.org/?q={query}",
+                          title_selector="h3", tag="guidance")
+    assert source.options == {"tag": "guidance"}
+    with pytest.raises(ValueError, match="content_selecter"):
+        TaggedSource("example.org", "https://example.org", "https://example.org/?q={query}",
+                     title_selector="h3", content_selecter="h2")
@@ -0,0 +1,206 @@
+import os
+import subprocess
+import sys
+import threading
+
+from app.services.text_index import TextIndex, tokenize
+
+
+def item(n, title, snippet=""):
+    return {"site": "test", "title": title, "url": f"https://example.org/{n}", "snippet": snippet}
+
+
+def test_citations_tokenise_however_they_are_written():
+    assert "s21" in tokenize("section 21 notice")
+    assert "s21" in tokenize("a s.21 notice")
+    assert "si2023/123" in tokenize("SI 2023/123")
+    assert "2020uksc12" in tokenize("[2020] UKSC 12")
+
+
+def test_bm25_ranks_matching_documents_first():
+    index = TextIndex()
+    index.add(item(1, "Section 21 eviction notice", "How landlords end an assured shorthold tenancy"))
+    index.add(item(2, "Deposit protection", "Tenancy deposit schemes"))
+    index.add(item(3, "Employment tribunal", "Claims against an employer"))
+    results = index.search("section 21 tenancy", limit=3)
+    assert results[0][2]["url"] == "https://example.org/1"
+    assert 0 < results[0][1] <= 1
+
+
+def test_replacing_and_deleting_documents():
+    index = TextIndex()
+    index.add(item(1, "Old title about rent"))
+    index.add(item(1, "New title about deposits"))
+    assert len(index) == 1
+    assert index.search("rent") == []
+    assert index.delete("https://example.org/1")
+    assert index.search("deposits") == []
+
+
+def test_flushed_segments_are_reloaded(tmp_path):
+    index = TextIndex(str(tmp_path), flush_threshold=2)
+    for n in range(5):
+        index.add(item(n, f"Tenancy document {n}"))
+    index.delete("https://example.org/0")
+    index.close()
+
+    reopened = TextIndex(str(tmp_path))
+    assert len(reopened) == 4
+    assert {hit[2]["url"] for hit in reopened.search("tenancy", limit=10)} == {
+        f"https://example.org/{n}" for n in range(1, 5)
+    }
+    reopened.close()
+
+
+def test_indexes_sharing_a_directory_get_their_own_slot(tmp_path):
+    first = TextIndex(str(tmp_path))
+    second = TextIndex(str(tmp_path))
+    assert first.directory != second.directory
+    first.add(item(1, "Only in the first index"))
+    second.add(item(2, "Only in the second index"))
+    first.close()
+    second.close()
+    assert sorted(os.listdir(tmp_path)) == ["worker-0", "worker-1"]
+
+    # A restarted worker takes a free slot and finds that slot's documents
+    reopened = TextIndex(str(tmp_path))
+    assert reopened.directory == first.directory
+    assert len(reopened) == 1
+    reopened.close()
+
+
+def test_slots_are_exclusive_across_processes(tmp_path):
+    holder = subprocess.Popen(
+        [sys.executable, "-c",
+         "import sys, time; from app.services.text_index import TextIndex; "
+         f"index = TextIndex({str(tmp_path)!r}); print(index.directory, flush=True); time.sleep(30)"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), stdout=subprocess.PIPE, text=True
+    )
+    try:
+        held = holder.stdout.readline().strip()
+        index = TextIndex(str(tmp_path))
+        assert index.directory != held
+        index.close()
+    finally:
+        holder.kill()
+        holder.wait()
+
+
+def test_expired_documents_stop_matching_and_are_purged(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.text_index.time.time", lambda: now[0])
+    index = TextIndex()
+    index.add(item(1, "Tenancy deposit search result"), ttl=60)
+    index.add(item(2, "Tenancy deposit feed entry"))
+    assert len(index.search("tenancy deposit")) == 2
+
+    now[0] += 30
+    index.add(item(1, "Tenancy deposit search result"), ttl=60)  # seen again: expiry moves on
+    now[0] += 45
+    assert len(index.search("tenancy deposit")) == 2
+
+    now[0] += 60
+    assert [hit[2]["url"] for hit in index.search("tenancy deposit")] == ["https://example.org/2"]
+    index.add(item(3, "Employment tribunal"))
+    assert len(index) == 2 and "https://example.org/1" not in index.keys
+
+
+def test_memory_only_index_stays_bounded_under_churn(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.text_index.time.time", lambda: now[0])
+    index = TextIndex(max_docs=100)
+    for n in range(5000):
+        # The same few pages seen again with new text, and short-lived search results
+        index.add(item(n % 50, f"Tenancy page version {n}"))
+        index.add(item(1000 + n, f"Search result {n}"), ttl=10)
+        now[0] += 1
+    assert len(index) <= 100
+    assert all(doc.get("expires", now[0]) >= now[0] - 1 for doc in index.docs.values())  # as of the last add
+    assert len(index._order) <= 2 * len(index) + 64
+    assert len(index._expiry) <= 2 * len(index) + 64
+
+
+def test_oldest_documents_are_evicted_past_max_docs(tmp_path):
+    index = TextIndex(str(tmp_path), flush_threshold=3, max_docs=5)
+    for n in range(12):
+        index.add(item(n, f"Tenancy document {n}"))
+        if index.needs_flush:
+            index.flush()
+    index.add(item(7, "Tenancy document seven, updated"))
+    assert len(index) == 5
+    assert set(index.keys) == {f"https://example.org/{n}" for n in (7, 8, 9, 10, 11)}
+    index.close()
+
+    reopened = TextIndex(str(tmp_path), max_docs=5)
+    assert set(reopened.keys) == {f"https://example.org/{n}" for n in (7, 8, 9, 10, 11)}
+    assert reopened.search("seven")[0][2]["url"] == "https://example.org/7"
+    reopened.close()
+
+
+def test_add_leaves_flushing_to_the_caller(tmp_path):
+    index = TextIndex(str(tmp_path), flush_threshold=2)
+    for n in range(4):
+        index.add(item(n, f"Tenancy document {n}"))
+    assert index.segments == [] and index.needs_flush
+    index.flush()
+    assert len(index.segments) == 1 and not index.needs_flush
+    index.close()
+
+
+def test_deletes_are_persisted_by_the_next_flush(tmp_path):
+    index = TextIndex(str(tmp_path))
+    index.add(item(1, "Tenancy document"))
+    index.add(item(2, "Tenancy document"))
+    index.flush()
+    index.delete("https://example.org/1")
+    index.flush()
+    index.close()
+    assert set(TextIndex(str(tmp_path)).keys) == {"https://example.org/2"}
+
+
+def test_search_during_a_flush_on_another_thread(tmp_path):
+    index = TextIndex(str(tmp_path), flush_threshold=50, max_segments=2)
+    stop = threading.Event()
+    errors = []
+
+    def flusher():
+        while not stop.is_set():
+            try:
+                index.flush()
+            except Exception as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=flusher)
+    thread.start()
+    try:
+        for n in range(600):
+            index.add(item(n, f"Tenancy document {n}"))
+            if n % 10 == 0:
+                index.delete(f"https://example.org/{n - 5}")
+            assert index.search(f"document {n}")[0][2]["url"] == f"https://example.org/{n}"
+    finally:
+        stop.set()
+        thread.join()
+    assert errors == []
+    expected = set(index.keys)
+    index.close()
+    assert set(TextIndex(str(tmp_path)).keys) == expected
+
+
+def test_listeners_hear_about_every_dropped_document(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.text_index.time.time", lambda: now[0])
+    index = TextIndex(max_docs=3)
+    dropped = []
+    index.listeners.append(dropped.append)
+    index.add(item(1, "Expiring result"), ttl=10)
+    index.add(item(2, "Page"))
+    index.add(item(2, "Page, edited"))
+    assert dropped == [["https://example.org/2"]]
+    now[0] += 20
+    index.purge_expired()
+    index.add(item(3, "Three"))
+    index.add(item(4, "Four"))
+    index.add(item(5, "Five"))
+    index.delete("https://example.org/5")
+    assert dropped[1:] == [["https://example.org/1"], ["https://example.org/2"], ["https://example.org/5"]]